@@ -0,0 +1,694 @@
+#
+# Copyright (c) 2022 Arm Limited
+# Copyright (c) 2022 Hanno Becker
+# Copyright (c) 2023 Amin Abdulrahman, Matthias Kannwischer
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Author: Hanno Becker <hannobecker@posteo.de>
+#
+
+"""Micro-benchmarks for performance-critical parts of SLOTHY
+
+Each benchmark checks that the optimized code path agrees with a reference
+implementation before reporting timings for both."""
+
+import argparse
+import glob
+import inspect
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from slothy import Slothy
+from slothy.core.core import SlothyBase
+from slothy.core.dataflow import DataFlowGraph as DFG
+from slothy.core.dataflow import Config as DFGConfig
+from slothy.core.dataflow import RegisterState, RegisterStateSnapshot
+from slothy.core.profiler import Profiler
+import slothy.helper
+from slothy.helper import (
+    AsmAllocation,
+    AsmHelper,
+    AssemblyCache,
+    LLVM_Mc,
+    LLVM_Mca,
+    LLVM_Mc_Error,
+    SelfTest,
+    SourceLine,
+    unfold_all_directives,
+)
+import slothy.targets.aarch64.aarch64_neon as AArch64_Neon
+import slothy.targets.aarch64.cortex_a55 as Target_CortexA55
+import slothy.targets.arm_v81m.arch_v81m as Arch_Armv81M
+import slothy.targets.arm_v81m.cortex_m55r1 as Target_CortexM55r1
+import slothy.targets.riscv.riscv as RISC_V
+import slothy.targets.riscv.xuantie_c908 as Target_XuanTieC908
+from slothy.targets.exceptions import ParsingException, UnknownInstruction
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BenchmarkException(Exception):
+    """Exception thrown when a benchmark finds a mismatch between the optimized
+    code path and its reference"""
+
+
+def _timed(f, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        res = f()
+    return res, (time.perf_counter() - t0) / iterations
+
+
+def _aarch64_source_lines():
+    lines = []
+    pattern = os.path.join(BASE_DIR, "examples", "naive", "aarch64", "**", "*.s")
+    for filename in sorted(glob.glob(pattern, recursive=True)):
+        with open(filename, "r", encoding="utf-8") as f:
+            src = SourceLine.read_multiline(f.read())
+        lines += [line.text.strip() for line in src if line.text.strip() != ""]
+    return lines
+
+
+def _parse_with(candidates, src):
+    for inst_class in candidates(src):
+        try:
+            return inst_class.make(src)
+        except ParsingException:
+            pass
+    return None
+
+
+def bench_aarch64_parser(iterations):
+    """Compare the mnemonic dispatch of the AArch64 instruction parser against a
+    linear search through all instruction classes."""
+    Instruction = AArch64_Neon.Instruction
+    lines = _aarch64_source_lines()
+
+    def linear():
+        return [
+            _parse_with(lambda _: Instruction.all_subclass_leaves, src) for src in lines
+        ]
+
+    def dispatch():
+        return [_parse_with(Instruction._parser_candidates, src) for src in lines]
+
+    ref, t_linear = _timed(linear, iterations)
+    res, t_dispatch = _timed(dispatch, iterations)
+
+    for src, a, b in zip(lines, ref, res):
+        if type(a) is not type(b) or (a is not None and vars(a) != vars(b)):
+            raise BenchmarkException(f"Parse results differ for {src}: {a} vs {b}")
+
+    parsed = len([r for r in ref if r is not None])
+    print(f"Lines: {len(lines)} ({parsed} instructions)")
+    print(f"Linear search:     {t_linear:8.4f} s")
+    print(f"Mnemonic dispatch: {t_dispatch:8.4f} s ({t_linear / t_dispatch:.1f}x)")
+
+
+def _aarch64_kernel(filename):
+    """Unfold an AArch64 kernel into straight-line code, dropping anything which
+    does not parse as an instruction (labels, branches, directives)."""
+    slothy = Slothy(AArch64_Neon, Target_CortexA55)
+    slothy.load_source_from_file(filename)
+    slothy.unfold()
+    slothy.config.allow_useless_instructions = True
+    body = []
+    for line in slothy.source:
+        txt = line.text.strip()
+        if txt == "" or txt.endswith(":") or txt.startswith("."):
+            continue
+        try:
+            AArch64_Neon.Instruction.parser(line)
+        except ParsingException:
+            continue
+        body.append(line)
+    return body, DFGConfig(slothy.config)
+
+
+def _snapshot_copy(state):
+    # Reference: Full copy of the register state for every node
+    return dict(RegisterStateSnapshot(state, state.version))
+
+
+def _build_dfg(filename, copy_reg_state):
+    """Build the data flow graph of a kernel, and return the peak memory traced
+    while building it in KB and the time taken"""
+    body, config = _aarch64_kernel(filename)
+    snapshot = RegisterState.snapshot
+    if copy_reg_state:
+        RegisterState.snapshot = _snapshot_copy
+    try:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        dfg = DFG(body, logging.getLogger("benchmark"), config)
+        t = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        RegisterState.snapshot = snapshot
+    reg_states = [
+        {reg: (r.src.id, type(r).__name__, r.idx) for reg, r in n.reg_state.items()}
+        for n in dfg.nodes_all
+    ]
+    return len(body), peak // 1024, t, reg_states
+
+
+def bench_aarch64_dfg_memory(iterations):
+    """Compare the peak memory usage of building data flow graphs with shared,
+    versioned register states against a full copy of the state per node."""
+    pattern = os.path.join(BASE_DIR, "examples", "naive", "aarch64", "**", "*.s")
+    files = sorted(glob.glob(pattern, recursive=True), key=os.path.getsize)[-4:]
+    for filename in reversed(files):
+        ref, res = None, None
+        for _ in range(iterations):
+            ref = _build_dfg(filename, True)
+            res = _build_dfg(filename, False)
+        lines, mem_copy, t_copy, states_copy = ref
+        _, mem_shared, t_shared, states_shared = res
+        if states_copy != states_shared:
+            raise BenchmarkException(f"Register states differ for {filename}")
+        print(f"{os.path.basename(filename)} ({lines} instructions)")
+        print(f"  Copied register state: {mem_copy:8d} KB peak, {t_copy:.4f} s")
+        print(f"  Shared register state: {mem_shared:8d} KB peak, {t_shared:.4f} s")
+
+
+def _traced(f):
+    """Run f, returning its result together with the memory it retains and the
+    peak memory while running, both in KB, and the number of retained blocks"""
+    tracemalloc.start()
+    try:
+        res = f()
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sum(
+            s.count for s in tracemalloc.take_snapshot().statistics("filename")
+        )
+    finally:
+        tracemalloc.stop()
+    return res, current // 1024, peak // 1024, blocks
+
+
+def bench_source_memory(iterations):
+    """Measure the memory held by copies of a large source, as taken repeatedly
+    by the split heuristic, and by the nodes of its data flow graph."""
+    pattern = os.path.join(BASE_DIR, "examples", "naive", "aarch64", "**", "*.s")
+    filename = sorted(glob.glob(pattern, recursive=True), key=os.path.getsize)[-1]
+    body, config = _aarch64_kernel(filename)
+    ref = SourceLine.write_multiline(body)
+
+    copies, mem, peak, blocks = _traced(
+        lambda: [SourceLine.copy_source(body) for _ in range(iterations)]
+    )
+    for c in copies:
+        if SourceLine.write_multiline(c) != ref:
+            raise BenchmarkException("Copied source differs from original")
+    print(f"{os.path.basename(filename)} ({len(body)} instructions)")
+    print(
+        f"  {iterations} source copies: {mem:8d} KB retained, {peak:8d} KB peak, "
+        f"{blocks} blocks"
+    )
+
+    logger = logging.getLogger("benchmark")
+    dfg, mem, peak, blocks = _traced(lambda: DFG(body, logger, config))
+    if len(dfg.nodes) != len(body):
+        raise BenchmarkException("Data flow graph does not match source")
+    print(
+        f"  Data flow graph:  {mem:8d} KB retained, {peak:8d} KB peak, "
+        f"{blocks} blocks"
+    )
+
+
+def _optimize_window(body, config, sparse):
+    """Optimize straight-line code with a variable number of stalls, returning
+    the result and the profile of the optimization"""
+    base = SlothyBase(
+        AArch64_Neon,
+        Target_CortexA55,
+        logger=logging.getLogger("benchmark"),
+        config=config.copy(),
+    )
+    base.config.variable_size = True
+    base.config.constraints.stalls_allowed = 16
+    base.config.constraints.sparse_renaming = sparse
+    base.config.selftest = False
+    with Profiler() as profiler:
+        base.optimize(body)
+    if not base.success:
+        raise BenchmarkException("Optimization failed")
+    return base.result, profiler
+
+
+def bench_sparse_renaming(iterations):
+    """Compare the size and solve time of models with full and with pruned
+    sets of candidate registers for renaming."""
+    pattern = os.path.join(BASE_DIR, "examples", "naive", "aarch64", "**", "*.s")
+    filename = sorted(glob.glob(pattern, recursive=True), key=os.path.getsize)[-1]
+    slothy = Slothy(AArch64_Neon, Target_CortexA55)
+    body, _ = _aarch64_kernel(filename)
+    slothy.config.allow_useless_instructions = True
+    body = body[:60]
+
+    print(f"{os.path.basename(filename)} (first {len(body)} instructions)")
+    for sparse in [False, True]:
+        build, solve = 0.0, 0.0
+        for _ in range(iterations):
+            res, profiler = _optimize_window(body, slothy.config, sparse)
+            summary = profiler.summary()
+            build += summary["build_model"]["wall_time"]
+            solve += summary["solve"]["wall_time"]
+        size = profiler.phases()[0]["children"]
+        size = [p for p in size if p["name"] == "build_model"][-1]["info"]
+        label = "Sparse renaming:" if sparse else "Full renaming:  "
+        print(
+            f"  {label} {size['variables']:6d} variables, "
+            f"{size['constraints']:6d} constraints, {res.stalls:3d} stalls, "
+            f"build {build / iterations:.4f} s, solve {solve / iterations:.4f} s"
+        )
+
+
+class _StallsHandler(logging.Handler):
+    """Collect the minimum number of stalls reported by the heuristics"""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.stalls = []
+
+    def emit(self, record):
+        m = re.match(r"Minimum number of stalls: (\d+)", record.getMessage())
+        if m is not None:
+            self.stalls.append(int(m.group(1)))
+
+
+def _optimize_ntt_loop(subdir, name, symmetry_breaking):
+    filename = os.path.join(BASE_DIR, "examples", "naive", "aarch64", subdir, name)
+    logger = logging.getLogger(f"benchmark.{name}")
+    handler = _StallsHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    # Logging is disabled globally while parsing, but we need the result here
+    disabled = logging.root.manager.disable
+    logging.disable(logging.NOTSET)
+    slothy = Slothy(AArch64_Neon, Target_CortexA55, logger=logger)
+    slothy.load_source_from_file(f"{filename}.s")
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.inputs_are_outputs = True
+    slothy.config.variable_size = True
+    slothy.config.reserved_regs = [f"x{i}" for i in range(0, 7)] + ["x30", "sp"]
+    slothy.config.constraints.stalls_first_attempt = 64
+    slothy.config.constraints.register_symmetry_breaking = symmetry_breaking
+    try:
+        with Profiler() as profiler:
+            slothy.optimize_loop("layer123_start")
+    finally:
+        logger.removeHandler(handler)
+        logging.disable(disabled)
+    solve = profiler.summary()["solve"]
+    return handler.stalls[-1], solve["count"], solve["wall_time"]
+
+
+def bench_register_symmetry(iterations):
+    """Compare the solve time for the first loop of the Kyber and Dilithium NTTs
+    with and without breaking symmetries between interchangeable registers."""
+    for subdir, name in [
+        ("kyber", "ntt_kyber_123_4567"),
+        ("dilithium", "ntt_dilithium_123_45678"),
+    ]:
+        print(name)
+        ref = None
+        for symmetry_breaking in [False, True]:
+            total = 0.0
+            for _ in range(iterations):
+                stalls, solves, t = _optimize_ntt_loop(subdir, name, symmetry_breaking)
+                total += t
+            if ref is not None and stalls > ref:
+                raise BenchmarkException(
+                    f"Symmetry breaking increased stalls from {ref} to {stalls}"
+                )
+            ref = stalls
+            label = "With symmetry breaking:" if symmetry_breaking else "Without:"
+            print(
+                f"  {label:24s}{stalls:3d} stalls, {solves} solver calls, "
+                f"solve {total / iterations:.4f} s"
+            )
+
+
+def _lookup_multidict_reference(d, inst, instclass):
+    # Reference: Linear scan over all keys of the multidict
+    result = None
+    for ll, v in d.items():
+        if not isinstance(ll, tuple):
+            ll = [ll]
+        for lp in ll:
+            if isinstance(inst, lp) if inspect.isclass(lp) else lp(inst):
+                if result is not None:
+                    raise UnknownInstruction(
+                        f"Multiple matches found for {instclass} for {inst}"
+                    )
+                result = v
+                break
+    if result is None:
+        raise UnknownInstruction(f"Couldn't find {instclass} for {inst}")
+    return result
+
+
+def _find_class_reference(iter_classes):
+    # Reference: Linear scan over all instruction classes
+    def find_class(src):
+        for inst_class in iter_classes():
+            if isinstance(src, inst_class):
+                return inst_class
+        raise UnknownInstruction(f"Couldn't find instruction class for {src}")
+
+    return find_class
+
+
+def _riscv_lookup_multidict_reference(d, inst, default=None):
+    # Reference: First match in a linear scan over all keys of the multidict
+    instclass = _find_class_reference(RISC_V.iter_riscv_instructions)(inst)
+    for ll, v in d.items():
+        if not isinstance(ll, tuple):
+            ll = [ll]
+        for lp in ll:
+            if isinstance(inst, lp) if inspect.isclass(lp) else lp(inst):
+                return v
+    if default is None:
+        raise UnknownInstruction(f"Couldn't find {instclass} for {inst}")
+    return default
+
+
+@contextmanager
+def _patched(module, **attrs):
+    orig = {name: getattr(module, name) for name in attrs}
+    for name, v in attrs.items():
+        setattr(module, name, v)
+    try:
+        yield
+    finally:
+        for name, v in orig.items():
+            setattr(module, name, v)
+
+
+def _target_model_queries(target, nodes):
+    def query(f, *args):
+        try:
+            return f(*args)
+        except UnknownInstruction as exc:
+            return str(exc)
+
+    res = []
+    for t in nodes:
+        res.append(query(target.get_units, t.inst))
+        res.append(query(target.get_inverse_throughput, t.inst))
+        latency = query(target.get_latency, t.inst, 0, t.inst)
+        # Latency exceptions are fresh closures, so only compare the latency
+        res.append(latency[0] if isinstance(latency, tuple) else latency)
+    return res
+
+
+def _build_target_model(arch, target, body):
+    base = SlothyBase(arch, target, logger=logging.getLogger("benchmark"))
+    base.config.allow_useless_instructions = True
+    base.config.variable_size = True
+    base.config.constraints.stalls_allowed = 16
+    base._load_source(body)
+    t0 = time.perf_counter()
+    base._build_model()
+    return base, time.perf_counter() - t0
+
+
+def bench_target_lookup(iterations):
+    """Compare the time for building the constraint model for the instruction
+    tests of the Cortex-A55, Cortex-M55 and XuanTie C908 models with indexed and
+    with linear lookups in the latency and functional unit tables."""
+    for arch, target, subdir, reference in [
+        (
+            AArch64_Neon,
+            Target_CortexA55,
+            "aarch64",
+            {
+                "lookup_multidict": _lookup_multidict_reference,
+                "find_class": _find_class_reference(
+                    AArch64_Neon.iter_aarch64_instructions
+                ),
+            },
+        ),
+        (
+            Arch_Armv81M,
+            Target_CortexM55r1,
+            "armv8m",
+            {
+                "lookup_multidict": _lookup_multidict_reference,
+                "find_class": _find_class_reference(Arch_Armv81M.iter_MVE_instructions),
+            },
+        ),
+        (
+            RISC_V,
+            Target_XuanTieC908,
+            "riscv",
+            {"lookup_multidict": _riscv_lookup_multidict_reference},
+        ),
+    ]:
+        slothy = Slothy(arch, target)
+        slothy.load_source_from_file(
+            os.path.join(BASE_DIR, "tests", "naive", subdir, "instructions.s")
+        )
+        pre, body, _ = AsmHelper.extract(slothy.source, "start", "end")
+        body = unfold_all_directives(pre, body)
+        body = AsmAllocation.unfold_all_aliases(slothy.config.register_aliases, body)
+
+        base, t_index = _build_target_model(arch, target, body)
+        nodes = base._model.tree.nodes
+        res = _target_model_queries(target, nodes)
+        with _patched(target, **reference):
+            ref = _target_model_queries(target, nodes)
+        if res != ref:
+            raise BenchmarkException(f"Lookup mismatch for {target.__name__}")
+
+        t_index = 0.0
+        t_ref = 0.0
+        for _ in range(iterations):
+            t_index += _build_target_model(arch, target, body)[1]
+            with _patched(target, **reference):
+                t_ref += _build_target_model(arch, target, body)[1]
+        print(
+            f"{target.__name__.split('.')[-1]}: {len(nodes)} instructions, "
+            f"model building {t_ref / iterations:.4f} s (linear lookup) vs "
+            f"{t_index / iterations:.4f} s (indexed lookup)"
+        )
+
+
+def bench_selftest(iterations):
+    """Compare the time for selftests of an AArch64 kernel against itself, with
+    the selftest iterations run individually, as a batch, and as batches in
+    parallel worker processes."""
+    slothy = Slothy(AArch64_Neon, Target_CortexA55)
+    slothy.load_source_from_file(
+        os.path.join(BASE_DIR, "tests", "naive", "aarch64", "aarch64_simple0.s")
+    )
+    source = [line for line in slothy.source if line.text.strip() != ""]
+    address_registers = {"x0": 1024, "x1": 1024, "x2": 1024}
+    trials = 100
+    slothy.config.selftest_seed = 0
+    workers = max(2, os.cpu_count())
+    for label, batched, workers in [
+        ("Individually:", False, 1),
+        ("Batched:", True, 1),
+        (f"{workers} workers:", True, workers),
+    ]:
+        slothy.config.selftest_batched = batched
+        slothy.config.selftest_parallel_workers = workers
+
+        def run():
+            SelfTest.run(
+                slothy.config,
+                logging.getLogger("benchmark"),
+                source,
+                source,
+                address_registers,
+                ["v8", "v9", "v10", "v11"],
+                trials,
+            )
+
+        _, t = _timed(run, iterations)
+        print(f"{label:16s}{trials} iterations in {t:.4f} s")
+
+
+def bench_assembly(iterations):
+    """Compare the time for assembling an AArch64 kernel with LLVM MC against
+    looking up the assembled code in memory and in a cache directory."""
+    slothy = Slothy(AArch64_Neon, Target_CortexA55)
+    slothy.load_source_from_file(
+        os.path.join(BASE_DIR, "tests", "naive", "aarch64", "aarch64_simple0.s")
+    )
+    source = [line for line in slothy.source if line.text.strip() != ""]
+    log = logging.getLogger("benchmark")
+    arch, attr = AArch64_Neon.llvm_mc_arch, AArch64_Neon.llvm_mc_attr
+    reference = LLVM_Mc._assemble(source, arch, attr, log, None, None, None)
+    assemblies = 20
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+
+        def uncached():
+            for _ in range(assemblies):
+                LLVM_Mc._assemble(source, arch, attr, log, None, None, None)
+
+        def memory():
+            for _ in range(assemblies):
+                res = LLVM_Mc.assemble(source, arch, attr, log)
+            return res
+
+        def disk():
+            for _ in range(assemblies):
+                LLVM_Mc.cache.clear()
+                res = LLVM_Mc.assemble(source, arch, attr, log, cache_dir=cache_dir)
+            return res
+
+        for label, f in [("LLVM MC:", uncached), ("Memory:", memory), ("Disk:", disk)]:
+            res, t = _timed(f, iterations)
+            if res is not None and res != reference:
+                raise BenchmarkException(f"Cached assembly differs: {label}")
+            print(f"{label:16s}{assemblies} assemblies in {t:.4f} s")
+        LLVM_Mc.cache.clear()
+
+
+def _unbatched(*args, **kwargs):
+    raise LLVM_Mc_Error("Batching disabled")
+
+
+def _unbatched_mca(header, bodies, *args, **kwargs):
+    return [LLVM_Mca.run(header, body, *args, **kwargs) for body in bodies]
+
+
+def bench_llvm_processes(iterations):
+    """Compare the number of external processes and the time for optimizing an
+    AArch64 loop with the split heuristic, selftests and LLVM-MCA statistics,
+    with one process per piece of code, with batched invocations, and with
+    batched invocations and the assembly cache."""
+    calls = []
+    run = slothy.helper.subprocess.run
+
+    def counted(args, **kwargs):
+        calls.append(args[0])
+        return run(args, **kwargs)
+
+    def optimize():
+        slothy = Slothy(AArch64_Neon, Target_CortexA55)
+        slothy.load_source_from_file(
+            os.path.join(
+                BASE_DIR, "tests", "naive", "aarch64", "aarch64_simple0_loop.s"
+            )
+        )
+        slothy.config.variable_size = True
+        slothy.config.constraints.stalls_first_attempt = 32
+        slothy.config.sw_pipelining.enabled = True
+        slothy.config.sw_pipelining.optimize_preamble = True
+        slothy.config.sw_pipelining.optimize_postamble = True
+        slothy.config.split_heuristic = True
+        slothy.config.split_heuristic_factor = 4
+        slothy.config.split_heuristic_repeat = 2
+        slothy.config.with_llvm_mca = True
+        slothy.config.selftest_seed = 0
+        slothy.optimize_loop("start")
+        return slothy.get_source_as_string()
+
+    uncached = AssemblyCache(max_size=0)
+    reference = None
+    for label, batch, cache in [
+        ("Unbatched:", False, uncached),
+        ("Batched:", True, uncached),
+        ("Batched+cache:", True, LLVM_Mc.cache),
+    ]:
+        attrs = {"cache": cache}
+        if not batch:
+            attrs["_assemble_batch"] = staticmethod(_unbatched)
+        mca = {} if batch else {"run_batch": staticmethod(_unbatched_mca)}
+        with (
+            _patched(LLVM_Mc, **attrs),
+            _patched(LLVM_Mca, **mca),
+            _patched(slothy.helper.subprocess, run=counted),
+        ):
+            cache.clear()
+            calls.clear()
+            res, t = _timed(optimize, iterations)
+            count = len(calls) // iterations
+        # Statistics of LLVM-MCA on the original code must agree
+        res = res.split("(ORIGINAL) BEGIN")[1].split("(ORIGINAL) END")[0]
+        if reference is None:
+            reference = res
+        if res != reference:
+            raise BenchmarkException(f"LLVM-MCA statistics differ: {label}")
+        print(f"{label:16s}{count} processes in {t:.4f} s")
+    LLVM_Mc.cache.clear()
+
+
+benchmarks = {
+    "aarch64_parser": bench_aarch64_parser,
+    "aarch64_dfg_memory": bench_aarch64_dfg_memory,
+    "source_memory": bench_source_memory,
+    "sparse_renaming": bench_sparse_renaming,
+    "register_symmetry": bench_register_symmetry,
+    "target_lookup": bench_target_lookup,
+    "selftest": bench_selftest,
+    "assembly": bench_assembly,
+    "llvm_processes": bench_llvm_processes,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--benchmarks",
+        type=str,
+        default="all",
+        help=f"The list of benchmarks to be run, comma-separated list from "
+        f"{list(benchmarks.keys())}.",
+    )
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    # Parsers log their failures
+    logging.disable(logging.CRITICAL)
+
+    if args.benchmarks != "all":
+        todo = args.benchmarks.split(",")
+    else:
+        todo = list(benchmarks.keys())
+
+    for name in todo:
+        if name not in benchmarks:
+            raise BenchmarkException(f"Could not find benchmark {name}")
+        print(f"== {name}")
+        benchmarks[name](args.iterations)
+
+
+if __name__ == "__main__":
+    main()
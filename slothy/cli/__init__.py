@@ -30,6 +30,7 @@ import os
 from importlib.metadata import version, PackageNotFoundError
 
 from slothy import Slothy, Archery
+from slothy.core.profiler import Profiler
 
 
 def _get_version():
@@ -182,6 +183,14 @@ def main():
         help="""File to write logging output to. Can be omitted, "\
                 "in which case a generic name with timestamp is used""",
     )
+    parser.add_argument(
+        "--profile-report",
+        default=None,
+        type=str,
+        metavar="FILE",
+        help="""Record wall time, CPU time, peak memory usage and model size for
+                each phase of the optimization, and write them to FILE as JSON""",
+    )
 
     args = parser.parse_args()
 
@@ -385,39 +394,51 @@ def main():
 
     done = False
 
-    # Unfold only?
-    if args.unfold is True:
-        slothy.unfold(
-            start=args.start,
-            end=args.end,
-            macros=args.unfold_macros,
-            aliases=args.unfold_aliases,
-        )
-        done = True
-
-    # Fusion
-    if done is False and args.fusion is True:
-        if len(args.loop) > 0:
-            for lll in args.loop:
-                slothy.fusion_loop(lll)
-        if args.fusion_only:
+    profiler = None
+    if args.profile_report is not None:
+        profiler = Profiler()
+        profiler.start()
+
+    try:
+        # Unfold only?
+        if args.unfold is True:
+            slothy.unfold(
+                start=args.start,
+                end=args.end,
+                macros=args.unfold_macros,
+                aliases=args.unfold_aliases,
+            )
             done = True
 
-    # Optimize
-    if done is False:
-        if len(args.loop) > 0:
-            for lll in args.loop:
-                slothy.optimize_loop(lll)
-        elif args.se:
-            for pair in args.se:
-                parts = pair.split(",", 1)
-                if len(parts) != 2:
-                    raise CmdLineException(
-                        f"Invalid --se pair '{pair}', expected start,end"
-                    )
-                slothy.optimize(start=parts[0], end=parts[1])
-        else:
-            slothy.optimize(start=args.start, end=args.end)
+        # Fusion
+        if done is False and args.fusion is True:
+            if len(args.loop) > 0:
+                for lll in args.loop:
+                    slothy.fusion_loop(lll)
+            if args.fusion_only:
+                done = True
+
+        # Optimize
+        if done is False:
+            if len(args.loop) > 0:
+                for lll in args.loop:
+                    slothy.optimize_loop(lll)
+            elif args.se:
+                for pair in args.se:
+                    parts = pair.split(",", 1)
+                    if len(parts) != 2:
+                        raise CmdLineException(
+                            f"Invalid --se pair '{pair}', expected start,end"
+                        )
+                    slothy.optimize(start=parts[0], end=parts[1])
+            else:
+                slothy.optimize(start=args.start, end=args.end)
+    finally:
+        # Write the report for failed optimizations as well
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_json(args.profile_report)
+            logger.info("Wrote profile report to %s", args.profile_report)
 
     # Rename
     if args.rename_function:
@@ -0,0 +1,212 @@
+#
+# Copyright (c) 2022 Arm Limited
+# Copyright (c) 2022 Hanno Becker
+# Copyright (c) 2023 Amin Abdulrahman, Matthias Kannwischer
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Author: Hanno Becker <hannobecker@posteo.de>
+#
+
+"""Persistent cache for one-shot SLOTHY optimizations
+
+SlothyBase.optimize() is deterministic in its source, configuration and target
+model, yet every invocation pays for a full constraint solve. This module provides
+an on-disk, content-addressed cache mapping a hash of those inputs to the solver's
+assignment for the nodes of the data flow graph, from which SlothyBase can rebuild
+the Result without invoking the solver.
+
+Entries are kept in a DiskCache from slothy.helper, which also backs the cache
+of assembled code.
+"""
+
+import enum
+import hashlib
+import inspect
+import json
+import types
+
+import ortools
+
+from slothy.helper import DiskCache
+
+# Bump whenever the layout of cache entries changes
+CACHE_FORMAT_VERSION = 1
+
+# Configuration fields which have no bearing on the optimization result
+_CONFIG_FIELDS_IGNORED = {
+    "logger",
+    "_locked",
+    "_log_dir",
+    "_log_model",
+    "log_model_only_on_success",
+    "log_model_dir",
+    "log_model_log_results",
+    "log_model_results_file",
+    "_result_cache_dir",
+    "_result_cache_max_size",
+    "_assembly_cache_dir",
+    "_assembly_cache_max_size",
+    "_selfcheck_failure_logfile",
+    "_global_timeout",
+    "_deadline",
+    "_solution_pool_size",
+}
+
+
+def _module_fingerprint(mod):
+    """Identify a module by name and by the contents of its source file, so that
+    changes to an architecture or microarchitecture model invalidate the cache."""
+    res = {"name": mod.__name__}
+    try:
+        with open(inspect.getfile(mod), "rb") as f:
+            res["digest"] = hashlib.sha256(f.read()).hexdigest()
+    except (TypeError, OSError):
+        pass
+    return res
+
+
+def _fingerprint(obj):
+    """Convert (part of) a configuration into a canonical JSON-serializable form"""
+    if isinstance(obj, types.ModuleType):
+        return _module_fingerprint(obj)
+    if isinstance(obj, enum.Enum):
+        return repr(obj)
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [_fingerprint(x) for x in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((_fingerprint(x) for x in obj), key=repr)
+    if isinstance(obj, dict):
+        return sorted(
+            ([_fingerprint(k), _fingerprint(v)] for k, v in obj.items()), key=repr
+        )
+    if hasattr(obj, "__dict__") and not callable(obj):
+        return {
+            k: _fingerprint(v)
+            for k, v in sorted(vars(obj).items())
+            if k not in _CONFIG_FIELDS_IGNORED
+        }
+    # Anything else. Note that lambdas and other callables have a repr that is
+    # unique to the current process: Configurations containing them will never
+    # hit the cache, which is safe.
+    return repr(obj)
+
+
+class ResultCache:
+    """On-disk cache of one-shot optimization results
+
+    Entries are stored as individual JSON files named after the hash of the
+    optimization inputs. When the total size of the cache directory exceeds
+    the configured limit, the least recently used entries are evicted.
+
+    :param cache_dir: The directory holding the cache entries.
+    :type cache_dir: str
+    :param max_size: The maximum total size of the cache in bytes.
+    :type max_size: int
+    :param logger: The logger to use.
+    :type logger: any
+    """
+
+    # Hit/miss statistics, shared by all cache instances of the process
+    _stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def __init__(self, cache_dir: str, max_size: int, logger: any):
+        self._disk = DiskCache(cache_dir, max_size, logger)
+        self._logger = logger
+
+    @staticmethod
+    def stats() -> dict:
+        """Returns the hit/miss statistics of all result caches in this process
+
+        :return: Dictionary with counts of hits, misses, stores and evictions.
+        :rtype: dict
+        """
+        return dict(ResultCache._stats)
+
+    @staticmethod
+    def reset_stats():
+        """Resets the hit/miss statistics"""
+        for k in ResultCache._stats:
+            ResultCache._stats[k] = 0
+
+    @staticmethod
+    def key(source: list, config: any, params: dict) -> str:
+        """Computes the cache key for a one-shot optimization
+
+        :param source: The reduced source code to be optimized.
+        :type source: list
+        :param config: The configuration of the optimization.
+        :type config: any
+        :param params: Further parameters of the optimization, such as the number
+            of locked instructions at the beginning and end of the source.
+        :type params: dict
+        :return: Hex digest identifying the optimization problem.
+        :rtype: str
+        """
+        data = {
+            "version": CACHE_FORMAT_VERSION,
+            "ortools": ortools.__version__,
+            "source": [
+                line.to_string(indentation=False, comments=False) for line in source
+            ],
+            "params": _fingerprint(params),
+            "config": _fingerprint(config),
+        }
+        txt = json.dumps(data, sort_keys=True)
+        return hashlib.sha256(txt.encode()).hexdigest()
+
+    def _log_stats(self, event):
+        s = ResultCache._stats
+        self._logger.info(
+            "Result cache %s (%d hits, %d misses)", event, s["hits"], s["misses"]
+        )
+
+    def lookup(self, key: str) -> dict:
+        """Look up a cache entry
+
+        :param key: The cache key, as computed by ResultCache.key().
+        :type key: str
+        :return: The cache entry, or None if there is no valid entry for the key.
+        :rtype: dict
+        """
+        entry = self._disk.read(key)
+        if entry is None or entry.get("version") != CACHE_FORMAT_VERSION:
+            ResultCache._stats["misses"] += 1
+            self._log_stats("miss")
+            return None
+
+        ResultCache._stats["hits"] += 1
+        self._log_stats("hit")
+        return entry
+
+    def store(self, key: str, entry: dict):
+        """Store a cache entry and evict old entries if the cache exceeds its size
+
+        :param key: The cache key, as computed by ResultCache.key().
+        :type key: str
+        :param entry: The JSON-serializable cache entry.
+        :type entry: dict
+        """
+        entry = {**entry, "version": CACHE_FORMAT_VERSION}
+        evicted = self._disk.write(key, entry)
+        ResultCache._stats["stores"] += 1
+        ResultCache._stats["evictions"] += evicted
@@ -29,8 +29,11 @@
 SLOTHY configuration
 """
 
+import pickle
 import shutil
+import time
 
+from contextlib import contextmanager
 from copy import deepcopy
 
 from slothy.helper import LockAttributes, NestedPrint
@@ -163,6 +166,41 @@ class Config(NestedPrint, LockAttributes):
         """If selftest is set, indicates the number of random selftest to conduct"""
         return self._selftest_iterations
 
+    @property
+    def selftest_batched(self):
+        """If selftest is set, indicates whether the selftest iterations should
+        be run as a batch.
+
+        In batched mode, the original and the optimized code are each run on a
+        single emulator instance whose CPU state is restored to its pristine
+        state before every iteration. This makes large values for
+        selftest_iterations affordable.
+
+        If disabled, every iteration sets up a fresh emulator. In either case,
+        the code is assembled only once."""
+        return self._selftest_batched
+
+    @property
+    def selftest_parallel_workers(self):
+        """If selftest is set, the number of worker processes over which the
+        selftest iterations are distributed.
+
+        If greater than 1, every worker runs its share of the iterations on its
+        own emulators. The first mismatch found terminates the remaining
+        workers."""
+        return self._selftest_parallel_workers
+
+    @property
+    def selftest_seed(self):
+        """The seed for the random inputs of the selftest.
+
+        Iteration i of the selftest derives its inputs from seed + i. If a
+        selftest fails, the seed of the failing iteration is reported; to replay
+        it, set selftest_seed to that seed and selftest_iterations to 1.
+
+        If None, a random seed is chosen for every selftest."""
+        return self._selftest_seed
+
     @property
     def selftest_address_registers(self):
         """Dictionary of (reg, sz) items indicating which registers are assumed to be
@@ -356,6 +394,69 @@ class Config(NestedPrint, LockAttributes):
         """
         return self._solver_search_strategy
 
+    @property
+    def solver_num_workers(self):
+        """The number of worker threads used by the CP-SAT solver.
+
+        If None (default), CP-SAT's own default is used, which is to use all
+        available cores."""
+        return self._solver_num_workers
+
+    @property
+    def solver_subsolvers(self):
+        """List of names of the CP-SAT subsolvers to run in the solver portfolio,
+        e.g. `["default_lp", "fixed", "core"]`.
+
+        If None (default), CP-SAT chooses the portfolio based on the number of
+        workers. See CP-SAT's `subsolvers` parameter for valid names."""
+        return self._solver_subsolvers
+
+    @property
+    def solver_linearization_level(self):
+        """The linearization level of the CP-SAT solver (0, 1 or 2). Higher levels
+        add more linear relaxations of the model, which can help proving optimality
+        at the cost of slower propagation.
+
+        If None (default), CP-SAT's default is used."""
+        return self._solver_linearization_level
+
+    @property
+    def solver_symmetry_level(self):
+        """The symmetry detection level of the CP-SAT solver (0 to 4).
+
+        If None (default), CP-SAT's default is used."""
+        return self._solver_symmetry_level
+
+    @property
+    def solver_parameters(self):
+        """Dictionary of arbitrary CP-SAT parameters, mapping the name of a field
+        of CP-SAT's SatParameters to its value, e.g.
+        `{"max_presolve_iterations": 5}`.
+
+        Those parameters are applied after, and hence take precedence over,
+        solver_num_workers, solver_subsolvers, solver_linearization_level and
+        solver_symmetry_level. Values of enum-typed parameters can be given by
+        name, e.g. `{"search_branching": "FIXED_SEARCH"}`."""
+        return self._solver_parameters
+
+    @property
+    def solver_binsearch_parameters(self):
+        """Dictionary of CP-SAT parameters to use in addition to solver_parameters
+        for the probes of the binary search for the minimum number of stalls.
+
+        For example, `{"num_workers": 1}` runs the probes single-threaded, which
+        can be beneficial when combined with constraints.stalls_parallel_probes."""
+        return self._solver_binsearch_parameters
+
+    @property
+    def solver_retry_parameters(self):
+        """Dictionary of CP-SAT parameters to use in addition to solver_parameters
+        for the final optimization pass for the secondary objective, once the
+        minimum number of stalls has been found.
+
+        Parameters set in solver_binsearch_parameters do not apply to this pass."""
+        return self._solver_retry_parameters
+
     @property
     def keep_tags(self):
         """Indicates whether tags in the input source should be kept or removed.
@@ -390,6 +491,35 @@ class Config(NestedPrint, LockAttributes):
         """
         return {**self._register_aliases, **self._arch.RegisterType.default_aliases()}
 
+    def start_global_timeout(self):
+        """Start the clock for global_timeout, unless it is already running"""
+        if self._global_timeout is not None and self._deadline is None:
+            self._deadline = time.time() + self._global_timeout
+
+    def time_remaining(self):
+        """The time in seconds until the global timeout expires, or None if no
+        global timeout is running"""
+        if self._deadline is None:
+            return None
+        return max(0, self._deadline - time.time())
+
+    def out_of_time(self):
+        """Indicates whether the global timeout has expired"""
+        return self.time_remaining() == 0
+
+    @contextmanager
+    def time_share(self, fraction):
+        """Context in which the global timeout, if running, expires after the
+        given fraction of the time remaining. Copies of the configuration made
+        within the context inherit the earlier expiry."""
+        deadline = self._deadline
+        if deadline is not None:
+            self._deadline = time.time() + fraction * self.time_remaining()
+        try:
+            yield
+        finally:
+            self._deadline = deadline
+
     def add_aliases(self, new_aliases):
         """Add further register aliases to the configuration"""
         self._register_aliases = {**self._register_aliases, **new_aliases}
@@ -507,6 +637,32 @@ class Config(NestedPrint, LockAttributes):
         """
         return self._max_solutions
 
+    @property
+    def solution_callback(self):
+        """A callable invoked for every solution found by the underlying constraint
+        solver, or None (default).
+
+        The callable receives a SolutionSnapshot describing the solution, e.g. its
+        cycle count, stalls, objective value and code. If it returns True, the
+        search is stopped and the solution is used as the result of the solver
+        invocation. This can be used to evaluate solutions externally, e.g. on a
+        cycle-accurate simulator, and to stop once they no longer improve.
+
+        The callable is shared by all copies of the configuration. It must be
+        picklable, e.g. a module-level function, since solutions found in worker
+        processes, e.g. with parallel stall probing, are delivered to a copy of it
+        in the worker process. Note that it is not invoked for results loaded
+        from the result cache."""
+        return self._solution_callback
+
+    @property
+    def solution_pool_size(self):
+        """The number of best solutions with distinct schedules to be kept for every
+        invocation of the underlying constraint solver. They are available through
+        Result.solution_pool, which is empty for results loaded from the result
+        cache. Default: 0."""
+        return self._solution_pool_size
+
     @property
     def with_preprocessor(self):
         """Indicates whether the C preprocessor is run prior to optimization."""
@@ -568,6 +724,29 @@ class Config(NestedPrint, LockAttributes):
         or `with_llvm_mca_after` are set."""
         return self._compiler_include_paths
 
+    @property
+    def assembly_cache_dir(self):
+        """Directory in which to persist assembled code across runs and processes.
+
+        Code assembled with LLVM MC, e.g. for the selftest, is always cached in
+        memory, keyed on the source and all options affecting the assembly. If
+        this is set, entries are additionally stored in and looked up from this
+        directory, so that they can be shared between invocations of SLOTHY.
+
+        Note that the contents of files included by the C preprocessor are not
+        part of the cache key. If None (default), no disk cache is used."""
+        return self._assembly_cache_dir
+
+    @property
+    def assembly_cache_max_size(self):
+        """The maximum total size in bytes of the assembly cache directory.
+
+        When the directory grows beyond this size, least recently used entries
+        are removed. If None, the directory is unbounded.
+
+        This is only meaningful if `assembly_cache_dir` is set."""
+        return self._assembly_cache_max_size
+
     @property
     def timeout(self):
         """The timeout in seconds after which each invocation of the underlying
@@ -581,6 +760,30 @@ class Config(NestedPrint, LockAttributes):
         performance optimization (e.g., minimization of iteration overlapping)."""
         return self._retry_timeout
 
+    @property
+    def global_timeout(self):
+        """The total time in seconds that a single call to Slothy.optimize() or
+        Slothy.optimize_loop() may spend in the underlying constraint solver, or
+        None (default) for no limit.
+
+        Unlike `timeout` and `retry_timeout`, which apply to every solver
+        invocation separately, this bounds the optimization as a whole: Every
+        solver invocation is capped at the time remaining, and once the time is
+        up, no further solver invocations are made. The remaining time is spread
+        over the passes of an optimization -- windows of the split heuristic, the
+        two halves of the halving heuristic, preamble, postamble and exceptional
+        iterations -- with time left unused by a pass rolling over to later ones.
+
+        When the time runs out, the best code found so far is used: The binary
+        search for the minimum number of stalls returns its best successful
+        attempt, the split heuristic keeps the windows optimized so far, and code
+        for which no solution has been found at all is left unoptimized. In all
+        cases, the selfcheck still applies.
+
+        Note that the time spent outside of the constraint solver, e.g. for model
+        construction and the selftest, is accounted for, but not bounded."""
+        return self._global_timeout
+
     @property
     def do_address_fixup(self):
         """Indicates whether post-optimization address fixup should be conducted.
@@ -730,6 +933,28 @@ class Config(NestedPrint, LockAttributes):
             )
         return self._split_heuristic_optimize_seam
 
+    @property
+    def split_heuristic_parallel_chunks(self):
+        """If the split heuristic is used, the number of worker processes used to
+        optimize windows of the same pass concurrently.
+
+        If greater than 1, the windows of each pass are grouped into waves of windows
+        which do not overlap, including their seams (see
+        split_heuristic_optimize_seam). With the default step size, these are the
+        even-numbered windows followed by the odd-numbered windows. The windows of a
+        wave are optimized concurrently against the same code and stitched together
+        afterwards. The abort thresholds split_heuristic_abort_cycle_at_high and
+        split_heuristic_abort_cycle_at_low are evaluated at the end of each wave.
+
+        Since a window does not see the optimized version of other windows in the
+        same wave, the result may differ from that of the sequential heuristic."""
+        if not self.split_heuristic:
+            raise InvalidConfig(
+                "Did you forget to set config.split_heuristic=True? "
+                "Shouldn't read config.split_heuristic_parallel_chunks otherwise."
+            )
+        return self._split_heuristic_parallel_chunks
+
     @property
     def split_heuristic_chunks(self):
         """If split heuristic is used, explicitly lists the optimization windows to be
@@ -831,6 +1056,48 @@ class Config(NestedPrint, LockAttributes):
             )
         return self._split_heuristic_repeat
 
+    @property
+    def split_heuristic_adaptive(self):
+        """If split_heuristic is enabled, choose the optimization windows from the
+        stall map rather than sliding a window of fixed size over the code.
+
+        The stall map of the code is turned into a list of windows centered
+        around clusters of stalls, of up to twice the size given by
+        split_heuristic_factor, while regions without stalls are skipped. The
+        windows are optimized in order of the number of stalls they contain, and
+        passes over the code are repeated for as long as they remove stalls. If a
+        pass removes no stalls, the windows are grown to twice their initial size
+        once, before giving up. Windows which cannot be optimized within the
+        solver timeout are skipped.
+
+        In adaptive mode, split_heuristic_repeat, split_heuristic_stepsize, the
+        abort thresholds and split_heuristic_parallel_chunks are ignored. Windows
+        explicitly configured through split_heuristic_chunks take precedence.
+
+        See also split_heuristic_adaptive_time_budget."""
+        if not self.split_heuristic:
+            raise InvalidConfig(
+                "Did you forget to set config.split_heuristic=True? "
+                "Shouldn't read config.split_heuristic_adaptive otherwise."
+            )
+        return self._split_heuristic_adaptive
+
+    @property
+    def split_heuristic_adaptive_time_budget(self):
+        """If the adaptive split heuristic is used, the total time in seconds to be
+        spent on optimizing windows, or None for no limit.
+
+        Once the budget is exhausted, no further windows are optimized, and
+        the solver timeout for every window is capped at the budget remaining
+        when the window is started."""
+        if not self.split_heuristic:
+            raise InvalidConfig(
+                "Did you forget to set config.split_heuristic=True? "
+                "Shouldn't read config.split_heuristic_adaptive_time_budget "
+                "otherwise."
+            )
+        return self._split_heuristic_adaptive_time_budget
+
     @property
     def split_heuristic_preprocess_naive_interleaving_strategy(self):
         """Strategy for naive interleaving preprocessing step
@@ -863,14 +1130,40 @@ class Config(NestedPrint, LockAttributes):
         """
         return self._log_model
 
+    @property
+    def result_cache_dir(self):
+        """Directory of the persistent result cache for one-shot optimizations.
+
+        If set, SlothyBase.optimize() stores the solution of every successful
+        (and every provably infeasible) optimization in this directory, keyed on
+        a hash of the reduced source code, the configuration, and the source of the
+        architecture and target models. Subsequent optimizations with identical
+        inputs rebuild their result from the cache instead of invoking the
+        constraint solver. Results rebuilt from the cache are still subject to
+        the selfcheck and selftest.
+
+        If None (default), no result cache is used."""
+        return self._result_cache_dir
+
+    @property
+    def result_cache_max_size(self):
+        """The maximum total size in bytes of the result cache.
+
+        When the cache grows beyond this size, least recently used entries are
+        evicted. If None, the cache is unbounded.
+
+        This is only meaningful if `result_cache_dir` is set."""
+        return self._result_cache_max_size
+
     def copy(self):
         """Make a deep copy of the configuration"""
-        # Temporarily unset references to Arch and Target for deepcopy
-        arch, target = self.arch, self.target
-        self.arch = self.target = None
+        # Temporarily unset references to Arch, Target and the solution callback
+        # for deepcopy
+        arch, target, cb = self.arch, self.target, self._solution_callback
+        self.arch = self.target = self._solution_callback = None
         res = deepcopy(self)
-        res.arch, res.target = arch, target
-        self.arch, self.target = arch, target
+        res.arch, res.target, res._solution_callback = arch, target, cb
+        self.arch, self.target, self._solution_callback = arch, target, cb
         return res
 
     class SoftwarePipelining(NestedPrint, LockAttributes):
@@ -928,6 +1221,45 @@ class Config(NestedPrint, LockAttributes):
             """Perform a separate optimization pass for the loop postamble."""
             return self._optimize_postamble
 
+        @property
+        def parallel_passes(self):
+            """The number of worker processes used to run independent optimization
+            passes concurrently once the loop kernel has been optimized: The
+            preamble and postamble passes, and the passes for the exceptional
+            iterations if the iteration count is unknown.
+
+            The log output of the passes is replayed in order, and the result is
+            the same as for sequential passes. If the configuration cannot be sent
+            to worker processes, e.g. because it holds a lambda, the passes run
+            sequentially. Default: 1 (sequential)."""
+            return self._parallel_passes
+
+        @property
+        def portfolio(self):
+            """Race the halving heuristic against full software pipelining.
+
+            If set, the loop is optimized with both strategies concurrently, each
+            in its own worker process, for every unroll factor listed in
+            portfolio_unroll. The kernel found by each strategy is then evaluated
+            in steady state, without reordering or renaming, and the strategy
+            with the fewest cycles per loop iteration wins. Ties are resolved in
+            favour of full software pipelining and smaller unroll factors. The
+            timings and outcomes of all strategies are logged.
+
+            The unroll factor of the winning strategy is stored in `unroll` of
+            the configuration that was passed in. Slothy.optimize_loop() takes it
+            into account; when using Slothy.optimize() with several unroll
+            factors, the loop needs to be adjusted by the caller.
+
+            Default: False."""
+            return self._portfolio
+
+        @property
+        def portfolio_unroll(self):
+            """The unroll factors to try in portfolio mode, as a list, or None
+            (default) to only try the configured unroll factor."""
+            return self._portfolio_unroll
+
         @property
         def max_overlapping(self):
             """The maximum number of early or late instructions.
@@ -987,6 +1319,9 @@ class Config(NestedPrint, LockAttributes):
             self.minimize_overlapping = True
             self.optimize_preamble = True
             self.optimize_postamble = True
+            self.parallel_passes = 1
+            self.portfolio = False
+            self.portfolio_unroll = None
             self.max_overlapping = None
             self.min_overlapping = None
             self.halving_heuristic = False
@@ -1032,6 +1367,25 @@ class Config(NestedPrint, LockAttributes):
         def optimize_postamble(self, val):
             self._optimize_postamble = val
 
+        @parallel_passes.setter
+        def parallel_passes(self, val):
+            if val < 1:
+                raise InvalidConfig("sw_pipelining.parallel_passes must be at least 1")
+            self._parallel_passes = val
+
+        @portfolio.setter
+        def portfolio(self, val):
+            self._portfolio = val
+
+        @portfolio_unroll.setter
+        def portfolio_unroll(self, val):
+            if val is not None and (len(val) == 0 or min(val) < 1):
+                raise InvalidConfig(
+                    "sw_pipelining.portfolio_unroll must be a non-empty list of "
+                    "positive unroll factors"
+                )
+            self._portfolio_unroll = val
+
         @max_overlapping.setter
         def max_overlapping(self, val):
             self._max_overlapping = val
@@ -1123,6 +1477,62 @@ class Config(NestedPrint, LockAttributes):
             """
             return self._stalls_timeout_below_precision
 
+        @property
+        def stalls_parallel_probes(self):
+            """The number of stall counts to probe concurrently during the external
+            binary search for the minimum number of stalls.
+
+            If this is larger than 1, every round of the binary search solves up to
+            this many candidate stall counts in parallel, in separate processes.
+            Probes are terminated as soon as their outcome no longer matters, e.g.
+            because a smaller number of stalls has been found to be feasible.
+            Once the minimum number of stalls has been determined, the final
+            optimization is repeated in the calling process, so that the result is
+            the same as for the sequential search.
+
+            Note that every probe runs its own instance of the constraint solver,
+            each of which may use multiple threads.
+
+            The `ext_bsearch_remember_successes` hint is ignored by parallel probes.
+            """
+            return self._stalls_parallel_probes
+
+        @property
+        def stalls_reuse_model(self):
+            """Reuse the constraint model across the probes of the external binary
+            search for the minimum number of stalls.
+
+            If set, the model is built once, with the number of stalls as a variable
+            (as for Config.variable_size) bounded by the number of stalls of the
+            probe. Probes for fewer stalls re-solve a copy of the same model with a
+            tighter bound. The model is only rebuilt if a probe exceeds the bound it
+            was built for.
+
+            Note that the model with a variable number of stalls can take longer to
+            solve than a model for a fixed number of stalls, so this mainly pays off
+            if model building takes a significant share of the optimization time.
+
+            This is ignored by parallel probes (see stalls_parallel_probes), and if
+            the `ext_bsearch_remember_successes` hint is set."""
+            return self._stalls_reuse_model
+
+        @property
+        def stalls_lower_bound(self):
+            """Skip stall counts that are known to be infeasible ahead of time.
+
+            If set, SLOTHY computes a lower bound for the number of cycles of the
+            code prior to the binary search for the minimum number of stalls,
+            taking into account the critical path through the data flow graph,
+            the issue rate, and the pressure on the functional units. Stall counts
+            below that bound are not probed, i.e. the bound acts as an automatic
+            lower limit for stalls_minimum_attempt.
+
+            The bound is also reported as Result.cycles_bound.
+
+            No bound is computed if software pipelining is enabled, or if only
+            functional correctness is modelled."""
+            return self._stalls_lower_bound
+
         @property
         def model_latencies(self):
             """Determines whether instruction latencies should be modelled.
@@ -1162,6 +1572,44 @@ class Config(NestedPrint, LockAttributes):
             in order to find the number of model violations in a piece of code."""
             return self._allow_renaming
 
+        @property
+        def sparse_renaming(self):
+            """Restrict the registers considered for renaming each output
+
+            By default, SLOTHY considers every available register of the right type
+            as the destination of every output, creating one boolean variable per
+            output and register. If this option is set, a liveness analysis of the
+            input code determines a smaller set of candidate registers per output:
+            Its original register, the registers which are free during its original
+            lifetime, and further registers as given by sparse_renaming_slack.
+
+            This keeps the original register allocation feasible, but may exclude
+            better ones. If the reduced model is infeasible, SLOTHY rebuilds the model
+            with the full sets of candidate registers and tries again, so pruning never
+            makes an optimization fail. It may, however, lead to a worse objective
+            (including the number of stalls, if Config.variable_size is set)."""
+            return self._sparse_renaming
+
+        @property
+        def sparse_renaming_slack(self):
+            """The number of candidate registers for an output beyond the number
+            of values of the same type live during its original lifetime.
+
+            Only meaningful if sparse_renaming is set."""
+            return self._sparse_renaming_slack
+
+        @property
+        def register_symmetry_breaking(self):
+            """Break symmetries between interchangeable registers
+
+            Registers which are not pinned by inputs, outputs, locked instructions
+            or restrictions, and which are available to the same outputs, can be
+            permuted in any solution without affecting its validity. If this option
+            is set, SLOTHY groups such registers into classes and requires the
+            registers of a class to be used for the first time in a fixed order,
+            sparing the solver the exploration of permuted register allocations."""
+            return self._register_symmetry_breaking
+
         @property
         def allow_spills(self):
             """Allow Slothy to introduce stack spills
@@ -1266,11 +1714,17 @@ class Config(NestedPrint, LockAttributes):
             self._stalls_precision = 0
             self._stalls_timeout_below_precision = None
             self._stalls_first_attempt = 0
+            self._stalls_parallel_probes = 1
+            self._stalls_reuse_model = False
+            self._stalls_lower_bound = True
 
             self._model_latencies = True
             self._model_functional_units = True
             self._allow_reordering = True
             self._allow_renaming = True
+            self._sparse_renaming = False
+            self._sparse_renaming_slack = 4
+            self._register_symmetry_breaking = False
             self._allow_spills = False
             self._spill_stack_loc_prefix = "STACK_LOC"
             self._spill_type = None
@@ -1305,6 +1759,20 @@ class Config(NestedPrint, LockAttributes):
         def stalls_timeout_below_precision(self, val):
             self._stalls_timeout_below_precision = val
 
+        @stalls_parallel_probes.setter
+        def stalls_parallel_probes(self, val):
+            if val < 1:
+                raise InvalidConfig("stalls_parallel_probes must be at least 1")
+            self._stalls_parallel_probes = val
+
+        @stalls_reuse_model.setter
+        def stalls_reuse_model(self, val):
+            self._stalls_reuse_model = val
+
+        @stalls_lower_bound.setter
+        def stalls_lower_bound(self, val):
+            self._stalls_lower_bound = val
+
         @model_latencies.setter
         def model_latencies(self, val):
             self._model_latencies = val
@@ -1321,6 +1789,20 @@ class Config(NestedPrint, LockAttributes):
         def allow_renaming(self, val):
             self._allow_renaming = val
 
+        @sparse_renaming.setter
+        def sparse_renaming(self, val):
+            self._sparse_renaming = val
+
+        @sparse_renaming_slack.setter
+        def sparse_renaming_slack(self, val):
+            if val < 0:
+                raise InvalidConfig("sparse_renaming_slack must not be negative")
+            self._sparse_renaming_slack = val
+
+        @register_symmetry_breaking.setter
+        def register_symmetry_breaking(self, val):
+            self._register_symmetry_breaking = val
+
         @allow_spills.setter
         def allow_spills(self, val):
             self._allow_spills = val
@@ -1371,6 +1853,20 @@ class Config(NestedPrint, LockAttributes):
             See also Config.variable_size."""
             return self._ext_bsearch_remember_successes
 
+        @property
+        def ext_bsearch_warm_start(self):
+            """When using an external binary search, seed every probe with hints
+            derived from the feasible solution of the earlier probe closest in the
+            number of stalls: Its program order, early/late flags and register
+            allocation. Program positions are compressed if the new probe allows
+            for fewer stalls.
+
+            This is ignored if ext_bsearch_remember_successes is set, since the
+            probes then optimize different source code.
+
+            See also Config.variable_size."""
+            return self._ext_bsearch_warm_start
+
         def __init__(self):
             super().__init__()
 
@@ -1378,6 +1874,7 @@ class Config(NestedPrint, LockAttributes):
             self._order_hint_orig_order = False
             self._rename_hint_orig_rename = False
             self._ext_bsearch_remember_successes = False
+            self._ext_bsearch_warm_start = False
 
             self.lock()
 
@@ -1393,6 +1890,10 @@ class Config(NestedPrint, LockAttributes):
         def order_hint_orig_order(self, val):
             self._order_hint_orig_order = val
 
+        @ext_bsearch_warm_start.setter
+        def ext_bsearch_warm_start(self, val):
+            self._ext_bsearch_warm_start = val
+
     def __init__(self, Arch, Target, logger):
         super().__init__()
 
@@ -1419,6 +1920,9 @@ class Config(NestedPrint, LockAttributes):
 
         self._selftest = True
         self._selftest_iterations = 10
+        self._selftest_batched = True
+        self._selftest_parallel_workers = 1
+        self._selftest_seed = None
         self._selftest_address_registers = None
         self._selftest_default_memory_size = 1024
         self._selftest_initial_register_values = {}
@@ -1437,12 +1941,15 @@ class Config(NestedPrint, LockAttributes):
         self._split_heuristic_region = [0.0, 1.0]
         self._split_heuristic_chunks = False
         self._split_heuristic_optimize_seam = 0
+        self._split_heuristic_parallel_chunks = 1
         self._split_heuristic_bottom_to_top = False
         self._split_heuristic_factor = 2
         self._split_heuristic_abort_cycle_at_high = None
         self._split_heuristic_abort_cycle_at_low = None
         self._split_heuristic_stepsize = None
         self._split_heuristic_repeat = 1
+        self._split_heuristic_adaptive = False
+        self._split_heuristic_adaptive_time_budget = None
         self._split_heuristic_preprocess_naive_interleaving = False
         self._split_heuristic_preprocess_naive_interleaving_by_latency = False
         self._split_heuristic_preprocess_naive_interleaving_strategy = "depth"
@@ -1450,6 +1957,8 @@ class Config(NestedPrint, LockAttributes):
 
         self._compiler_binary = "gcc"
         self._compiler_include_paths = None
+        self._assembly_cache_dir = None
+        self._assembly_cache_max_size = 64 * 1024 * 1024
 
         self.keep_tags = True
         self.inherit_macro_comments = False
@@ -1463,8 +1972,12 @@ class Config(NestedPrint, LockAttributes):
         self._with_llvm_mca_before = False
         self._with_llvm_mca_after = False
         self._max_solutions = 64
+        self._solution_callback = None
+        self._solution_pool_size = 0
         self._timeout = None
         self._retry_timeout = None
+        self._global_timeout = None
+        self._deadline = None
         self._ignore_objective = False
         self._objective_precision = 0
         self._objective_lower_bound = None
@@ -1484,6 +1997,13 @@ class Config(NestedPrint, LockAttributes):
 
         self.solver_random_seed = 42
         self._solver_search_strategy = "lowest_min"
+        self._solver_num_workers = None
+        self._solver_subsolvers = None
+        self._solver_linearization_level = None
+        self._solver_symmetry_level = None
+        self._solver_parameters = {}
+        self._solver_binsearch_parameters = {}
+        self._solver_retry_parameters = {}
 
         self._log_dir = "."
         self._log_model = None
@@ -1493,6 +2013,9 @@ class Config(NestedPrint, LockAttributes):
         self.log_model_log_results = True
         self.log_model_results_file = "results.txt"
 
+        self._result_cache_dir = None
+        self._result_cache_max_size = 256 * 1024 * 1024
+
         self.lock()
 
     @arch.setter
@@ -1557,6 +2080,44 @@ class Config(NestedPrint, LockAttributes):
             )
         self._solver_search_strategy = val
 
+    @solver_num_workers.setter
+    def solver_num_workers(self, val):
+        if val is not None and val < 0:
+            raise InvalidConfig("solver_num_workers must not be negative")
+        self._solver_num_workers = val
+
+    @solver_subsolvers.setter
+    def solver_subsolvers(self, val):
+        self._solver_subsolvers = val
+
+    @solver_linearization_level.setter
+    def solver_linearization_level(self, val):
+        if val is not None and val not in [0, 1, 2]:
+            raise InvalidConfig(
+                f"Invalid solver_linearization_level: {val} (expected 0, 1 or 2)"
+            )
+        self._solver_linearization_level = val
+
+    @solver_symmetry_level.setter
+    def solver_symmetry_level(self, val):
+        if val is not None and val not in range(5):
+            raise InvalidConfig(
+                f"Invalid solver_symmetry_level: {val} (expected 0 to 4)"
+            )
+        self._solver_symmetry_level = val
+
+    @solver_parameters.setter
+    def solver_parameters(self, val):
+        self._solver_parameters = val
+
+    @solver_binsearch_parameters.setter
+    def solver_binsearch_parameters(self, val):
+        self._solver_binsearch_parameters = val
+
+    @solver_retry_parameters.setter
+    def solver_retry_parameters(self, val):
+        self._solver_retry_parameters = val
+
     @selftest.setter
     def selftest(self, val):
         self._selftest = val
@@ -1565,6 +2126,20 @@ class Config(NestedPrint, LockAttributes):
     def selftest_iterations(self, val):
         self._selftest_iterations = val
 
+    @selftest_batched.setter
+    def selftest_batched(self, val):
+        self._selftest_batched = val
+
+    @selftest_parallel_workers.setter
+    def selftest_parallel_workers(self, val):
+        if val < 1:
+            raise InvalidConfig("selftest_parallel_workers must be at least 1")
+        self._selftest_parallel_workers = val
+
+    @selftest_seed.setter
+    def selftest_seed(self, val):
+        self._selftest_seed = val
+
     @selftest_address_registers.setter
     def selftest_address_registers(self, val):
         self._selftest_address_registers = val
@@ -1601,6 +2176,25 @@ class Config(NestedPrint, LockAttributes):
     def max_solutions(self, val):
         self._max_solutions = val
 
+    @solution_callback.setter
+    def solution_callback(self, val):
+        if val is not None and not callable(val):
+            raise InvalidConfig("solution_callback must be callable")
+        if val is not None:
+            try:
+                pickle.dumps(val)
+            except (pickle.PicklingError, TypeError, AttributeError) as exc:
+                raise InvalidConfig(
+                    f"solution_callback must be picklable ({exc})"
+                ) from exc
+        self._solution_callback = val
+
+    @solution_pool_size.setter
+    def solution_pool_size(self, val):
+        if val < 0:
+            raise InvalidConfig("solution_pool_size must not be negative")
+        self._solution_pool_size = val
+
     @with_preprocessor.setter
     def with_preprocessor(self, val):
         self._with_preprocessor = val
@@ -1634,6 +2228,16 @@ class Config(NestedPrint, LockAttributes):
     def compiler_include_paths(self, val):
         self._compiler_include_paths = val
 
+    @assembly_cache_dir.setter
+    def assembly_cache_dir(self, val):
+        self._assembly_cache_dir = val
+
+    @assembly_cache_max_size.setter
+    def assembly_cache_max_size(self, val):
+        if val is not None and val < 0:
+            raise InvalidConfig("assembly_cache_max_size must not be negative")
+        self._assembly_cache_max_size = val
+
     @timeout.setter
     def timeout(self, val):
         self._timeout = val
@@ -1642,6 +2246,12 @@ class Config(NestedPrint, LockAttributes):
     def retry_timeout(self, val):
         self._retry_timeout = val
 
+    @global_timeout.setter
+    def global_timeout(self, val):
+        if val is not None and val <= 0:
+            raise InvalidConfig("global_timeout must be positive")
+        self._global_timeout = val
+
     @keep_tags.setter
     def keep_tags(self, val):
         self._keep_tags = val
@@ -1702,6 +2312,12 @@ class Config(NestedPrint, LockAttributes):
     def split_heuristic_optimize_seam(self, val):
         self._split_heuristic_optimize_seam = val
 
+    @split_heuristic_parallel_chunks.setter
+    def split_heuristic_parallel_chunks(self, val):
+        if val < 1:
+            raise InvalidConfig("split_heuristic_parallel_chunks must be at least 1")
+        self._split_heuristic_parallel_chunks = val
+
     @split_heuristic_bottom_to_top.setter
     def split_heuristic_bottom_to_top(self, val):
         self._split_heuristic_bottom_to_top = val
@@ -1730,6 +2346,16 @@ class Config(NestedPrint, LockAttributes):
     def split_heuristic_repeat(self, val):
         self._split_heuristic_repeat = val
 
+    @split_heuristic_adaptive.setter
+    def split_heuristic_adaptive(self, val):
+        self._split_heuristic_adaptive = val
+
+    @split_heuristic_adaptive_time_budget.setter
+    def split_heuristic_adaptive_time_budget(self, val):
+        if val is not None and val <= 0:
+            raise InvalidConfig("split_heuristic_adaptive_time_budget must be positive")
+        self._split_heuristic_adaptive_time_budget = val
+
     @log_dir.setter
     def log_dir(self, val):
         self._log_dir = val
@@ -1737,3 +2363,11 @@ class Config(NestedPrint, LockAttributes):
     @log_model.setter
     def log_model(self, val):
         self._log_model = val
+
+    @result_cache_dir.setter
+    def result_cache_dir(self, val):
+        self._result_cache_dir = val
+
+    @result_cache_max_size.setter
+    def result_cache_max_size(self, val):
+        self._result_cache_max_size = val
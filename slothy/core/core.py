@@ -31,20 +31,23 @@ import os
 import time
 
 from types import SimpleNamespace
-from copy import deepcopy
+from copy import copy, deepcopy
 from functools import cached_property
 from sympy import simplify
 
 import ortools
 from ortools.sat.python import cp_model
 
-from slothy.core.config import Config
+from slothy.core.config import Config, InvalidConfig
+from slothy.core.cache import ResultCache
+from slothy.core.profiler import profile_phase, profiled, register_cache
 from slothy.helper import (
     LockAttributes,
     Permutation,
     DeferHandler,
     SourceLine,
     SelfTest,
+    LLVM_Mc,
 )
 
 from slothy.core.dataflow import DataFlowGraph as DFG
@@ -52,6 +55,9 @@ from slothy.core.dataflow import Config as DFGConfig
 from slothy.core.dataflow import InstructionOutput, InstructionInOut, ComputationNode
 from slothy.core.dataflow import SlothyUselessInstructionException
 
+register_cache("result", ResultCache.stats)
+register_cache("assembly", LLVM_Mc.cache.stats)
+
 
 class SlothyException(Exception):
     """Generic exception thrown by SLOTHY"""
@@ -61,6 +67,65 @@ class SlothySelfCheckException(SlothyException):
     """Exception thrown by SLOTHY during tht selfcheck"""
 
 
+class SolutionSnapshot:
+    """An intermediate solution found by the constraint solver
+
+    Unlike a Result, a snapshot is taken while the solver is still running, and
+    neither selfchecked nor subject to post-optimization fixups such as address
+    offset fixup or spilling. It is meant for evaluating the performance of a
+    solution, e.g. through an external simulator, not for use as final code.
+
+    :param index: The number of the solution within its solver invocation,
+        starting from 1.
+    :type index: int
+    :param wall_time: The solver wall time in seconds at which the solution was
+        found.
+    :type wall_time: float
+    :param objective: The objective value of the solution, or None if the solver
+        invocation has no objective.
+    :type objective: float
+    :param objective_bound: The best bound on the objective value known to the
+        solver, or None if the solver invocation has no objective.
+    :type objective_bound: float
+    :param stalls: The number of stalls of the solution.
+    :type stalls: int
+    :param cycles: The number of cycles that SLOTHY expects the solution to take.
+    :type cycles: int
+    :param code: The instructions of the solution in their new order and with
+        registers renamed, or None if software pipelining is enabled.
+    :type code: list
+    :param key: Identifies the schedule of the solution, so that solutions with
+        the same schedule have the same key.
+    :type key: tuple
+    """
+
+    def __init__(
+        self,
+        index: int,
+        wall_time: float,
+        objective: float,
+        objective_bound: float,
+        stalls: int,
+        cycles: int,
+        code: list,
+        key: tuple,
+    ):
+        self.index = index
+        self.wall_time = wall_time
+        self.objective = objective
+        self.objective_bound = objective_bound
+        self.stalls = stalls
+        self.cycles = cycles
+        self.code = code
+        self.key = key
+
+    def __repr__(self):
+        return (
+            f"SolutionSnapshot(index={self.index}, cycles={self.cycles}, "
+            f"stalls={self.stalls}, objective={self.objective})"
+        )
+
+
 class Result(LockAttributes):
     """The results of a one-shot SLOTHY optimization run"""
 
@@ -287,6 +352,16 @@ class Result(LockAttributes):
         """Returns the amount of wall clock time in seconds the optimization has taken"""
         return self._optimization_wall_time
 
+    @property
+    def solution_pool(self):
+        """The best distinct solutions found by the constraint solver, as a list of
+        SolutionSnapshot objects, best first.
+
+        This holds at most Config.solution_pool_size solutions. Solutions are
+        ranked by objective, or by cycle count if there is no objective. It is
+        empty if the result has been loaded from the result cache."""
+        return self._solution_pool
+
     @property
     def optimization_user_time(self):
         """Returns the amount of CPU time in seconds the optimization has taken"""
@@ -1187,6 +1262,10 @@ class Result(LockAttributes):
         assert self._cycles_bound is None
         self._cycles_bound = v
 
+    @solution_pool.setter
+    def solution_pool(self, v):
+        self._solution_pool = v
+
     def _build_stalls_idxs(self):
         self._stalls_idxs = {
             j
@@ -1561,6 +1640,7 @@ class Result(LockAttributes):
         self._optimization_user_time = None
         self._spills = {}
         self._restores = {}
+        self._solution_pool = []
 
         self.lock()
 
@@ -1630,6 +1710,11 @@ class SlothyBase(LockAttributes):
         self._model = SimpleNamespace()
         self._result = None
         self._orig_code = None
+        self._result_cache_params = None
+        self._solver_overrides = None
+        self._solution_hint = None
+        self._incremental = False
+        self._sparse_renaming = False
 
         self.lock()  # Can't do this yet, there are still lots of temporaries being used
 
@@ -1638,6 +1723,11 @@ class SlothyBase(LockAttributes):
         self._model = SimpleNamespace()
         self._result = None
         self._orig_code = None
+        self._result_cache_params = None
+        self._solver_overrides = None
+        self._solution_hint = None
+        self._incremental = False
+        self._sparse_renaming = False
 
     def _set_timeout(self, timeout):
         if timeout is None:
@@ -1645,14 +1735,160 @@ class SlothyBase(LockAttributes):
         self.logger.info("Setting timeout of %d seconds...", timeout)
         self._model.cp_solver.parameters.max_time_in_seconds = timeout
 
-    def optimize(self, source, prefix_len=0, suffix_len=0, log_model=None, retry=False):
+    @profiled("optimize")
+    def optimize(
+        self,
+        source,
+        prefix_len=0,
+        suffix_len=0,
+        log_model=None,
+        retry=False,
+        solver_overrides=None,
+        solution_hint=None,
+        incremental=False,
+    ):
         self._reset()
+        self._solver_overrides = solver_overrides
+        self._solution_hint = solution_hint
+        self._incremental = incremental
+        self._sparse_renaming = self.config.constraints.sparse_renaming
+        if incremental and not self.config.variable_size:
+            raise SlothyException("Incremental optimization requires variable_size")
         self._usage_check()
 
         self.config.log(self.logger.getChild("config").debug)
 
         # Setup
-        self._load_source(source, prefix_len=prefix_len, suffix_len=suffix_len)
+        with profile_phase("load_source", instructions=len(source)):
+            self._load_source(source, prefix_len=prefix_len, suffix_len=suffix_len)
+        if self.config.constraints.stalls_lower_bound:
+            self._model.cycles_lower_bound = self._cycles_lower_bound()
+
+        self._result_cache_params = {
+            "prefix_len": prefix_len,
+            "suffix_len": suffix_len,
+            "incremental": incremental,
+        }
+        result_cache, cache_key, entry = self._lookup_result_cache()
+        if entry is not None:
+            return self._load_result_from_cache(entry)
+
+        self._build_model()
+        self._result = Result(self.config)
+
+        # Do the actual work
+        self.logger.info(
+            "Invoking external constraint solver (%s) ...", self._describe_solver()
+        )
+        success = self._solve()
+        if not success and self._sparse_renaming_fallback():
+            success = self._solve()
+        self.result.success = success
+        self.result.valid = True
+
+        if not retry and self.success:
+            self.logger.info(
+                "Booleans in result: %d", self._model.cp_solver.NumBooleans()
+            )
+
+        return self._finish_solve(result_cache, cache_key)
+
+    def stalls_lower_bound(self, source: list[SourceLine]) -> int:
+        """Compute a lower bound for the number of stalls required to schedule the
+        given source code, without invoking the constraint solver.
+
+        See Config.constraints.stalls_lower_bound for how the bound is obtained.
+
+        :param source: The source code to be optimized.
+        :type source: list[SourceLine]
+        :return: A lower bound for the number of stalls. This is 0 if no bound can
+            be derived, e.g. because software pipelining is enabled.
+        :rtype: int
+        """
+        self._reset()
+        self._load_source(source)
+        cycles = self._cycles_lower_bound(log=self.logger.info)
+        if cycles is None:
+            return 0
+        min_cycles = math.ceil(self._model.tree.num_nodes / self.target.issue_rate)
+        return max(0, cycles - min_cycles)
+
+    @profiled("reoptimize")
+    def reoptimize(self, stalls: int, timeout: int = None) -> bool:
+        """Re-solve the model of a previous incremental optimization, allowing for
+        at most the given number of stalls.
+
+        The model is not rebuilt: The bound on the number of stalls is added to a
+        copy of the model built by optimize(), replacing the bound of any previous
+        call to reoptimize().
+
+        :param stalls: The maximum number of stalls. Must not exceed the number of
+            stalls the model was built for.
+        :type stalls: int
+        :param timeout: The timeout in seconds, or None to use Config.timeout.
+        :type timeout: int
+        :return: Indicates whether the optimization succeeded.
+        :rtype: bool
+        :raises SlothyException: If there is no incremental model for this number of
+            stalls.
+        """
+        if not self._incremental:
+            raise SlothyException("reoptimize() requires optimize(incremental=True)")
+        if stalls > self.config.constraints.stalls_allowed:
+            raise SlothyException(
+                f"Cannot reoptimize for {stalls} stalls: Model was built for at most "
+                f"{self.config.constraints.stalls_allowed} stalls"
+            )
+
+        self._result_cache_params["max_stalls"] = stalls
+        result_cache, cache_key, entry = self._lookup_result_cache()
+        if entry is not None:
+            return self._load_result_from_cache(entry)
+
+        # If the initial optimization was served from the result cache,
+        # no model has been built yet.
+        if getattr(self._model, "cp_model", None) is None:
+            self._build_model()
+        else:
+            self.logger.info(
+                "Reusing model for max %d stalls (saving %.4f s of model building)",
+                stalls,
+                self._model.build_time,
+            )
+
+        while True:
+            # Bound the number of stalls in a copy of the model. Unlike an assumption,
+            # a constraint is visible to presolve, which matters for quickly refuting
+            # infeasible probes. Copying the model is cheap compared to building it.
+            hints = self._model.hints
+            self._model.cp_model = self._model.cp_model_base.Clone()
+            self._Add(self._model.stalls <= stalls)
+            # Hint the solution of the last successful solve
+            self._ClearHints()
+            for var, val in hints.values():
+                self._AddHint(var, val)
+
+            self._result = Result(self.config)
+            self._configure_solver(self._solver_overrides)
+            self._set_timeout(timeout if timeout is not None else self.config.timeout)
+
+            self.logger.info(
+                "Invoking external constraint solver (%s) ...", self._describe_solver()
+            )
+            success = self._solve()
+            if success or not self._sparse_renaming_fallback():
+                break
+        self.result.success = success
+        self.result.valid = True
+        return self._finish_solve(result_cache, cache_key)
+
+    def _build_model(self):
+        with profile_phase("build_model") as info:
+            self._build_model_core()
+            info.update(self._model_size())
+
+    def _build_model_core(self):
+        t0 = time.time()
         self._init_external_model_and_solver()
         self._init_model_internals()
 
@@ -1708,48 +1944,256 @@ class SlothyBase(LockAttributes):
 
         # Build constraint model
         self.logger.debug("Creating constraint model...")
-        # - Variables
-        self._add_variables_scheduling()
-        self._add_variables_functional_units()
-        self._add_variables_loop_rolling()
-        self._add_variables_dependencies()
-        self._add_variables_register_renaming()
-        # - Constraints
-        self._add_constraints_scheduling()
-        self._add_constraints_lifetime_bounds()
-        self._add_constraints_loop_optimization()
-        self._add_constraints_n_issue()
-        self._add_constraints_dependency_order()
-        self._add_constraints_latencies()
-        self._add_constraints_register_renaming()
-        self._add_constraints_register_usage()
-        self._add_constraints_functional_units()
-        self._add_constraints_loop_periodic()
-        self._add_constraints_locked_ordering()
-        self._add_constraints_misc()
+        for step in [
+            # - Variables
+            self._add_variables_scheduling,
+            self._add_variables_functional_units,
+            self._add_variables_loop_rolling,
+            self._add_variables_dependencies,
+            self._add_variables_register_renaming,
+            # - Constraints
+            self._add_constraints_scheduling,
+            self._add_constraints_lifetime_bounds,
+            self._add_constraints_loop_optimization,
+            self._add_constraints_n_issue,
+            self._add_constraints_dependency_order,
+            self._add_constraints_latencies,
+            self._add_constraints_register_renaming,
+            self._add_constraints_register_symmetry,
+            self._add_constraints_register_usage,
+            self._add_constraints_functional_units,
+            self._add_constraints_loop_periodic,
+            self._add_constraints_locked_ordering,
+            self._add_constraints_misc,
+        ]:
+            with profile_phase(step.__name__):
+                step()
+        # - Hints
+        if self._solution_hint is not None:
+            self._add_solution_hint(self._solution_hint)
 
         # - Objective
-        self._add_objective()
+        # For incremental optimization, the number of stalls is bounded rather than
+        # minimized, as for a model of fixed size.
+        self._add_objective(force_objective=self._incremental)
         # - Search strategy
         self._add_search_strategy()
-        self._result = Result(self.config)
 
-        # Do the actual work
-        self.logger.info(
-            "Invoking external constraint solver (%s) ...", self._describe_solver()
+        self._model.cp_model_base = self._model.cp_model
+        self._model.build_time = time.time() - t0
+        self.logger.debug("Model built in %.4f s", self._model.build_time)
+
+    def _model_size(self):
+        proto = self._model.cp_model.Proto()
+        return {
+            "variables": len(proto.variables),
+            "constraints": len(proto.constraints),
+        }
+
+    def _finish_solve(self, result_cache, cache_key):
+        if not self.success:
+            if (
+                result_cache is not None
+                and self._model.cp_model.status == cp_model.INFEASIBLE
+            ):
+                result_cache.store(cache_key, {"success": False})
+            return False
+
+        self._extract_result()
+
+        # The global timeout is not part of the cache key: A solution it cut short
+        # need not be the one found without it.
+        capped = getattr(self._model, "time_capped", False)
+        if capped and self._model.cp_model.status != cp_model.OPTIMAL:
+            self.logger.debug("Not caching result cut short by global timeout")
+        elif result_cache is not None:
+            result_cache.store(cache_key, self._make_result_cache_entry())
+        return True
+
+    def _lookup_result_cache(self, **kwargs):
+        """Look up the current optimization problem in the result cache.
+
+        Returns the cache, the cache key, and the cache entry, if any. All of them
+        are None if no result cache is configured."""
+        if self.config.result_cache_dir is None:
+            return None, None, None
+        result_cache = ResultCache(
+            self.config.result_cache_dir,
+            self.config.result_cache_max_size,
+            self.logger.getChild("cache"),
         )
-        self.result.success = self._solve()
-        self.result.valid = True
+        with profile_phase("cache_lookup") as info:
+            cache_key = ResultCache.key(
+                self._orig_code, self.config, self._result_cache_params | kwargs
+            )
+            entry = result_cache.lookup(cache_key)
+            info["hit"] = entry is not None
+        return result_cache, cache_key, entry
+
+    def solution_hint(self) -> dict:
+        """Describes the solution of a successful optimization in a form that can be
+        used to warm-start another optimization of the same source code, e.g. for a
+        different number of stalls, via `optimize(..., solution_hint=...)`.
+
+        :return: Picklable and JSON-serializable description of the program
+            positions, pre/post flags and register allocations of the solution.
+        :rtype: dict
+        """
+        assert self.success
+        nodes = self._model.tree.nodes
+        codesize = self._result.codesize_with_bubbles
+        positions = []
+        for t in nodes:
+            pos = t.real_pos_program
+            # Undo the adjustment of early/late instructions in _extract_positions()
+            if self.config.sw_pipelining.enabled:
+                num_low = len(self._model.tree.nodes_low)
+                if t.pre and t.orig_pos < num_low:
+                    pos += 2 * codesize
+                if t.post and t.orig_pos >= num_low:
+                    pos -= 2 * codesize
+            positions.append(pos)
+        copies = 2 if self.config.sw_pipelining.enabled else 1
+        return {
+            "padded_size": copies * codesize,
+            "positions": positions,
+            "pre_post": (
+                [[bool(t.pre), bool(t.post)] for t in nodes]
+                if self.config.sw_pipelining.enabled
+                else None
+            ),
+            "allocations": [
+                list(t.inst.args_out) for t in self._get_nodes(allnodes=True)
+            ],
+        }
 
-        if not retry and self.success:
-            self.logger.info(
-                "Booleans in result: %d", self._model.cp_solver.NumBooleans()
+    def _add_solution_hint(self, hint):
+        nodes = self._model.tree.nodes
+        if len(hint["positions"]) != len(nodes) or (
+            (hint["pre_post"] is not None) != self.config.sw_pipelining.enabled
+        ):
+            self.logger.warning("Ignoring solution hint for a different model")
+            return
+        self.logger.info("Using solution hint from a previous optimization")
+
+        # If this model is smaller, compress the hinted positions into its padded
+        # program size, keeping their order and leaving room for the remaining
+        # instructions.
+        old_size = max(1, hint["padded_size"])
+        new_size = self._model.program_horizon - 10
+        order = sorted(range(len(nodes)), key=lambda i: hint["positions"][i])
+        prev = -1
+        for rank, i in enumerate(order):
+            pos = hint["positions"][i]
+            if new_size < old_size:
+                pos = (pos * new_size) // old_size
+            pos = min(max(pos, prev + 1), new_size - (len(nodes) - rank))
+            prev = pos
+            self._model.hints[nodes[i].program_start_var.Index()] = (
+                nodes[i].program_start_var,
+                pos,
             )
 
+        if hint["pre_post"] is not None:
+            for t, (pre, post) in zip(nodes, hint["pre_post"]):
+                for var, val in [
+                    (t.pre_var, pre),
+                    (t.post_var, post),
+                    (t.core_var, not pre and not post),
+                ]:
+                    self._model.hints[var.Index()] = (var, val)
+
+        for t, regs in zip(self._get_nodes(allnodes=True), hint["allocations"]):
+            for var_dict, reg in zip(t.alloc_out_var, regs):
+                for r, var in var_dict.items():
+                    self._model.hints[var.Index()] = (var, r == reg)
+
+        # Replace any hints from the configuration for the same variables
+        hints = self._model.hints
+        self._ClearHints()
+        for var, val in hints.values():
+            self._AddHint(var, val)
+
+    def _make_result_cache_entry(self):
+        positions = [
+            (
+                [t.real_pos_program, t.pre, t.core, t.post]
+                if self.config.sw_pipelining.enabled
+                else [t.real_pos_program]
+            )
+            for t in self._model.tree.nodes
+        ]
+        allocations = [
+            {
+                "args_out": t.inst.args_out,
+                "args_in": t.inst.args_in,
+                "args_in_out": t.inst.args_in_out,
+                "out_spills": t.out_spills,
+                "in_out_spills": t.in_out_spills,
+                "out_lifetime_start": t.out_lifetime_start,
+                "inout_lifetime_start": t.inout_lifetime_start,
+            }
+            for t in self._get_nodes(allnodes=True)
+        ]
+        return {
+            "success": True,
+            "stalls": self._result.stalls,
+            "cycles_bound": self._result.cycles_bound,
+            "codesize_with_bubbles": self._result.codesize_with_bubbles,
+            "optimization_wall_time": self._result.optimization_wall_time,
+            "optimization_user_time": self._result.optimization_user_time,
+            "positions": positions,
+            "allocations": allocations,
+        }
+
+    def _load_result_from_cache(self, entry):
+        self._result = Result(self.config)
+        self.result.success = entry["success"]
+        self.result.valid = True
+
         if not self.success:
+            self.logger.info("Result cache: Optimization is known to be infeasible")
             return False
 
-        self._extract_result()
+        self.logger.info("Result cache: Rebuilding result without solver invocation")
+        if self.config.solution_pool_size > 0:
+            self.logger.warning(
+                "Result cache: No solution pool for cached results -- "
+                "Result.solution_pool is empty"
+            )
+
+        self._result.orig_code = self._orig_code
+        if entry["stalls"] is not None:
+            self._result.stalls = entry["stalls"]
+        if entry["cycles_bound"] is not None:
+            self._result.cycles_bound = entry["cycles_bound"]
+        self._result.codesize_with_bubbles = entry["codesize_with_bubbles"]
+        self._result.optimization_wall_time = entry["optimization_wall_time"]
+        self._result.optimization_user_time = entry["optimization_user_time"]
+
+        nodes = self._model.tree.nodes
+        allnodes = self._get_nodes(allnodes=True)
+        assert len(nodes) == len(entry["positions"])
+        assert len(allnodes) == len(entry["allocations"])
+
+        for t, pos in zip(nodes, entry["positions"]):
+            t.real_pos_program = pos[0]
+            if self.config.sw_pipelining.enabled:
+                t.pre, t.core, t.post = pos[1:]
+            if not self.config.constraints.functional_only:
+                t.real_pos_cycle = t.real_pos_program // self.target.issue_rate
+
+        for t, alloc in zip(allnodes, entry["allocations"]):
+            t.inst.args_out = alloc["args_out"]
+            t.inst.args_in = alloc["args_in"]
+            t.inst.args_in_out = alloc["args_in_out"]
+            t.out_spills = alloc["out_spills"]
+            t.in_out_spills = alloc["in_out_spills"]
+            t.out_lifetime_start = alloc["out_lifetime_start"]
+            t.inout_lifetime_start = alloc["inout_lifetime_start"]
+
+        self._extract_reordering()
+        self._finalize_result()
         return True
 
     def _load_source(self, source, prefix_len=0, suffix_len=0):
@@ -1804,6 +2248,7 @@ class SlothyBase(LockAttributes):
         self._model.register_usage_vars = {}
         self._model.spill_vars = []
         self._model.variables = []
+        self._model.hints = {}
 
     def _usage_check(self):
         if self._num_optimization_passes > 0:
@@ -2013,7 +2458,12 @@ class SlothyBase(LockAttributes):
         a new solution.
 
         This callback counts the solutions found so far, and aborts the search when the
-        solution is sufficiently close to the optimum."""
+        solution is sufficiently close to the optimum.
+
+        If `snapshot` is provided, it is called with the callback and the number of
+        the solution, and must return a SolutionSnapshot of the current solution.
+        The best `pool_size` distinct snapshots are kept, and `on_solution` is
+        called with every snapshot; if it returns True, the search is stopped."""
 
         def __init__(
             self,
@@ -2023,6 +2473,9 @@ class SlothyBase(LockAttributes):
             is_good_enough=None,
             printer=None,
             variables=None,
+            snapshot=None,
+            on_solution=None,
+            pool_size=0,
         ):
             cp_model.CpSolverSolutionCallback.__init__(self)
             self.__solution_count = 0
@@ -2031,6 +2484,10 @@ class SlothyBase(LockAttributes):
             self.__is_good_enough = is_good_enough
             self.__printer = printer
             self.__objective_desc = objective_description
+            self.__snapshot = snapshot
+            self.__on_solution = on_solution
+            self.__pool_size = pool_size
+            self.__pool = []
             self.variables = variables
 
         def on_solution_callback(self):
@@ -2061,13 +2518,36 @@ class SlothyBase(LockAttributes):
                 )
                 if self.__is_good_enough and self.__is_good_enough(cur, bound):
                     self.StopSearch()
+            if self.__snapshot is not None:
+                solution = self.__snapshot(self, self.__solution_count)
+                self.__add_to_pool(solution)
+                if self.__on_solution is not None and self.__on_solution(solution):
+                    self.__logger.info("Solution callback requested to stop search")
+                    self.StopSearch()
             if self.__solution_count >= self.__max_solutions:
                 self.StopSearch()
 
+        def __add_to_pool(self, solution):
+            if self.__pool_size == 0:
+                return
+            # Of solutions with the same schedule, keep the one found first
+            if any(s.key == solution.key for s in self.__pool):
+                return
+
+            def rank(s):
+                return (s.objective if s.objective is not None else s.cycles, s.index)
+
+            self.__pool = sorted(self.__pool + [solution], key=rank)
+            del self.__pool[self.__pool_size :]
+
         def solution_count(self):
             """The number of solutions found so far"""
             return self.__solution_count
 
+        def solution_pool(self):
+            """The best distinct solutions found so far, best first"""
+            return list(self.__pool)
+
     def fixup_preamble_postamble(self):
         """Potentially fix up the preamble and postamble
 
@@ -2194,6 +2674,7 @@ class SlothyBase(LockAttributes):
         dfgc_postamble = DFGConfig(self.config, outputs=self._result.orig_outputs)
         DFG(self._result.postamble, log.getChild("new_postamble"), dfgc_postamble)
 
+    @profiled("extract_result")
     def _extract_result(self):
 
         self._result.orig_code = self._orig_code
@@ -2202,24 +2683,32 @@ class SlothyBase(LockAttributes):
 
         self._extract_positions(get_value)
         self._extract_register_renamings(get_value)
+        self._finalize_result()
+
+    def _finalize_result(self):
         self._extract_input_output_renaming()
 
         self._extract_spills()
         self._extract_code()
-        self._result.selfcheck_with_fixup(self.logger.getChild("selfcheck"))
+        with profile_phase("selfcheck"):
+            self._result.selfcheck_with_fixup(self.logger.getChild("selfcheck"))
         self._result.offset_fixup(self.logger.getChild("fixup"))
 
-        self._result.selftest(self.logger.getChild("selftest"))
+        with profile_phase("selftest"):
+            self._result.selftest(self.logger.getChild("selftest"))
 
     def _extract_positions(self, get_value):
 
+        cycles_bound = getattr(self._model, "cycles_lower_bound", None)
         if self.config.variable_size:
             self._result.stalls = get_value(self._model.stalls)
-            stalls_bound = self._model.cp_solver.BestObjectiveBound()
-            stats = self._stalls_to_stats(stalls_bound)
-            if stats is not None:
-                cycles_bound, _ = stats
-                self._result.cycles_bound = cycles_bound
+            if self._model.objective_name == "minimize cycles":
+                stalls_bound = self._model.cp_solver.BestObjectiveBound()
+                stats = self._stalls_to_stats(stalls_bound)
+                if stats is not None:
+                    cycles_bound = max(cycles_bound or 0, stats[0])
+        if cycles_bound is not None:
+            self._result.cycles_bound = cycles_bound
 
         self._result.optimization_wall_time = self._model.cp_solver.WallTime()
         self._result.optimization_user_time = self._model.cp_solver.UserTime()
@@ -2251,7 +2740,68 @@ class SlothyBase(LockAttributes):
             if not self.config.constraints.functional_only:
                 t.real_pos_cycle = t.real_pos_program // self.target.issue_rate
 
+        self._extract_reordering()
+
+    def _solution_snapshot(self, solution_cb, index):
+        """Take a lightweight snapshot of the solution currently held by a
+        solution callback"""
+
+        def get_value(v):
+            return v if isinstance(v, int) else solution_cb.Value(v)
+
+        if self._model.objective_name == "no objective":
+            objective = objective_bound = None
+        else:
+            objective = solution_cb.ObjectiveValue()
+            objective_bound = solution_cb.BestObjectiveBound()
+
+        if self.config.variable_size:
+            stalls = get_value(self._model.stalls)
+        else:
+            stalls = self.config.constraints.stalls_allowed
+
         if self.config.sw_pipelining.enabled:
+            codesize = get_value(self._model.program_padded_size_half)
+        else:
+            codesize = get_value(self._model.program_padded_size)
+
+        nodes = self._model.tree.nodes
+        positions = [get_value(t.program_start_var) for t in nodes]
+        code = None
+        if self.config.sw_pipelining.enabled:
+            key = tuple(
+                (p, get_value(t.pre_var), get_value(t.post_var))
+                for p, t in zip(positions, nodes)
+            )
+        else:
+
+            def extract_true_key(var_dict):
+                return next(k for k, v in var_dict.items() if get_value(v))
+
+            code = []
+            for _, t in sorted(zip(positions, nodes), key=lambda pt: pt[0]):
+                inst = copy(t.inst)
+                inst.args_out = [extract_true_key(v) for v in t.alloc_out_var]
+                inst.args_in = [extract_true_key(v) for v in t.alloc_in_var]
+                inst.args_in_out = [extract_true_key(v) for v in t.alloc_in_out_var]
+                code.append(inst.source_line.copy().set_text(str(inst)))
+            key = tuple(line.text for line in code)
+
+        return SolutionSnapshot(
+            index=index,
+            wall_time=solution_cb.WallTime(),
+            objective=objective,
+            objective_bound=objective_bound,
+            stalls=stalls,
+            cycles=codesize // self.target.issue_rate,
+            code=code,
+            key=key,
+        )
+
+    def _extract_reordering(self):
+        nodes = self._model.tree.nodes
+        if self.config.sw_pipelining.enabled:
+            nodes_low = self._model.tree.nodes_low
             self._result.reordering_with_bubbles = {
                 t.orig_pos: t.real_pos_program for t in nodes_low
             }
@@ -2726,6 +3276,86 @@ class SlothyBase(LockAttributes):
     #                  VARIABLES (Register allocation)               #
     # ================================================================
 
+    def _sparse_renaming_candidates(self):
+        """Determine a reduced set of candidate registers for every output
+
+        Returns a dictionary mapping nodes to the list of candidate registers
+        for each of their outputs. See Config.constraints.sparse_renaming."""
+        tree = self._model.tree
+        nodes = tree.nodes
+        slack = self.config.constraints.sparse_renaming_slack
+
+        pos = {t: -1 for t in tree.nodes_input}
+        pos.update({t: i for i, t in enumerate(nodes)})
+        pos.update({t: len(nodes) for t in tree.nodes_output})
+
+        # Original lifetime of every output: From the instruction producing it
+        # to the last instruction consuming it, possibly via input/output arguments.
+        last_use = {}
+        for t in tree.nodes_all:
+            for src in t.src_in + t.src_in_out:
+                src = src.reduce()
+                key = (src.src, src.idx)
+                last_use[key] = max(last_use.get(key, pos[src.src]), pos[t])
+
+        values = {}
+        for t in tree.nodes_all:
+            for idx, (ty, reg) in enumerate(zip(t.inst.arg_types_out, t.inst.args_out)):
+                end = last_use.get((t, idx), pos[t])
+                values.setdefault(ty, []).append((pos[t], end, reg, t, idx))
+
+        res = {}
+        for ty, vals in values.items():
+            avail = self._model.avail_renaming_regs.get(ty, [])
+            if len(avail) == 0:
+                continue
+            vals.sort(key=lambda v: v[0])
+            for i, (start, end, reg, t, idx) in enumerate(vals):
+                # Registers holding other values live during the lifetime of this one
+                busy = set()
+                live = 1
+                for start_o, end_o, reg_o, t_o, idx_o in vals:
+                    if start_o >= end:
+                        break
+                    if end_o <= start or (t_o, idx_o) == (t, idx):
+                        continue
+                    busy.add(reg_o)
+                    live += 1
+                size = min(len(avail), live + slack)
+                # Rotate the order of registers to spread outputs across the
+                # register file
+                rotated = avail[i % len(avail) :] + avail[: i % len(avail)]
+                cands = [reg] if reg in avail else []
+                cands += [r for r in rotated if r not in busy and r != reg]
+                cands += [r for r in rotated if r in busy and r != reg]
+                res.setdefault(t, [None] * len(t.inst.args_out))[idx] = cands[
+                    : max(size, 1)
+                ]
+
+        # Corresponding instructions of both loop iterations need the same options
+        if self.config.sw_pipelining.enabled:
+            for tlow, thigh in zip(tree.nodes_low, tree.nodes_high):
+                if tlow in res:
+                    res[thigh] = res[tlow]
+        return res
+
+    def _sparse_renaming_fallback(self):
+        """If the last solve failed on a model with reduced sets of candidate
+        registers for renaming, rebuild the model with full candidate sets.
+
+        Returns True if the model was rebuilt."""
+        if not self._sparse_renaming:
+            return False
+        if self._model.cp_model.status != cp_model.INFEASIBLE:
+            return False
+        self.logger.info(
+            "Model with sparse register renaming is infeasible: "
+            "Retrying with full sets of candidate registers"
+        )
+        self._sparse_renaming = False
+        self._build_model()
+        return True
+
     def _add_variables_register_renaming(self):
         """Add boolean variables indicating if an instruction uses a certain output
         register"""
@@ -2744,6 +3374,11 @@ class SlothyBase(LockAttributes):
                 reg: self._NewBoolVar(f"reg_used[{reg}]") for reg in regs
             }
 
+        sparse = {}
+        if self._sparse_renaming:
+            sparse = self._sparse_renaming_candidates()
+        num_candidates_full, num_candidates = 0, 0
+
         # Create variables for register renaming
 
         for t in self._get_nodes(allnodes=True):
@@ -2753,10 +3388,12 @@ class SlothyBase(LockAttributes):
             # Iterate through output registers of current instruction
             assert len(t.inst.arg_types_out) == len(t.inst.args_out)
             assert len(t.inst.arg_types_out) == len(t.inst.args_out_restrictions)
-            for arg_ty, arg_out, restrictions in zip(
-                t.inst.arg_types_out,
-                t.inst.args_out,
-                t.inst.args_out_restrictions,
+            for idx, (arg_ty, arg_out, restrictions) in enumerate(
+                zip(
+                    t.inst.arg_types_out,
+                    t.inst.args_out,
+                    t.inst.args_out_restrictions,
+                )
             ):
 
                 self.logger.debug("- Output %s (%s)", arg_out, arg_ty)
@@ -2788,7 +3425,12 @@ class SlothyBase(LockAttributes):
                     self.logger.input.debug(f"Reason: {reason}")
                     candidates = [arg_out]
                 else:
-                    candidates = list(set(self._model.avail_renaming_regs[arg_ty]))
+                    # Deduplicate in a fixed order: The order of the candidates
+                    # determines the model, and must not depend on string hashing,
+                    # which differs between processes.
+                    candidates = list(
+                        dict.fromkeys(self._model.avail_renaming_regs[arg_ty])
+                    )
 
                 if restrictions is not None:
                     self.logger.debug(
@@ -2808,6 +3450,24 @@ class SlothyBase(LockAttributes):
                     self.logger.error("Restrictions: %s", restrictions)
                     raise SlothyException()
 
+                num_candidates_full += len(candidates_restricted)
+                # Combinations of outputs (e.g. consecutive registers) are
+                # unlikely to survive pruning, so leave those alone.
+                pruned = None
+                if (
+                    locked is False
+                    and t in sparse
+                    and t.inst.args_out_combinations is None
+                ):
+                    pruned = sparse[t][idx]
+                if pruned is not None:
+                    candidates_pruned = [
+                        c for c in candidates_restricted if c in pruned
+                    ]
+                    if len(candidates_pruned) > 0:
+                        candidates_restricted = candidates_pruned
+                num_candidates += len(candidates_restricted)
+
                 self.logger.input.debug(
                     "Registers available for renaming of "
                     f"[{t.inst}].{arg_out} ({t.orig_pos})"
@@ -2824,6 +3484,13 @@ class SlothyBase(LockAttributes):
                     if arg_out in candidates_restricted:
                         self._AddHint(var_dict[arg_out], True)
 
+        if self._sparse_renaming:
+            self.logger.info(
+                "Sparse register renaming: %d instead of %d renaming variables",
+                num_candidates,
+                num_candidates_full,
+            )
+
         # For convenience, also add references to the variables governing the
         # register renaming for input and input/output arguments.
         for t in self._get_nodes(allnodes=True):
@@ -3116,6 +3783,10 @@ class SlothyBase(LockAttributes):
         for reg, var_a in var_dic_a.items():
             var_b = var_dic_b.get(reg, None)
             if var_b is None:
+                # Registers pruned from the candidates of the output must not
+                # be used for the input either
+                if self._sparse_renaming:
+                    self._Add(var_a == False)  # noqa: E712
                 continue
             self._AddImplication(var_a, var_b)
 
@@ -3227,6 +3898,97 @@ class SlothyBase(LockAttributes):
                     t_in.alloc_out_var[0], t_out.alloc_in_var[0]
                 )
 
+    def _register_symmetry_classes(self):
+        """Find classes of interchangeable registers
+
+        Two registers are interchangeable if they are available for renaming the
+        same outputs, belong to the same argument restrictions, and are not
+        mentioned in any combination or lock. Returns a list of pairs of a class
+        of registers and the renaming variable dictionaries, in program order, of
+        the outputs using them.
+
+        The registers of a class are sorted by their first use in the original
+        code, so that the original register allocation respects the order."""
+        pinned = set(self.config.locked_registers)
+        restriction_sets = set()
+        for t in self._get_nodes(allnodes=True):
+            for restrictions in [
+                t.inst.args_in_restrictions,
+                t.inst.args_out_restrictions,
+                t.inst.args_in_out_restrictions,
+            ]:
+                for r in restrictions or []:
+                    if r is not None:
+                        restriction_sets.add(frozenset(r))
+            for combinations in [
+                t.inst.args_in_combinations,
+                t.inst.args_out_combinations,
+                t.inst.args_in_out_combinations,
+            ]:
+                for _, valid_combinations in combinations or []:
+                    for combination in valid_combinations:
+                        pinned.update(combination)
+
+        extra = set()
+        for ty in self.arch.RegisterType:
+            extra.update(self.arch.RegisterType.list_registers(ty, only_extra=True))
+
+        # Group registers by the outputs they are available to
+        dicts, orig = [], []
+        for t in self._get_nodes(allnodes=True):
+            dicts += t.alloc_out_var
+            orig += t.inst.args_out
+        users = {}
+        for i, d in enumerate(dicts):
+            for reg in d:
+                users.setdefault(reg, []).append(i)
+        restriction_sets = list(restriction_sets)
+        classes = {}
+        for reg, idxs in users.items():
+            if reg in pinned:
+                continue
+            restricted = tuple(reg in r for r in restriction_sets)
+            classes.setdefault((tuple(idxs), restricted, reg in extra), []).append(reg)
+
+        res = []
+        for (idxs, _, _), regs in classes.items():
+            if len(regs) < 2:
+                continue
+            first_use = {}
+            for i in idxs:
+                first_use.setdefault(orig[i], i)
+            regs.sort(key=lambda r: first_use.get(r, len(dicts)))
+            res.append((regs, [dicts[i] for i in idxs]))
+        return res
+
+    def _add_constraints_register_symmetry(self):
+        if not self.config.constraints.register_symmetry_breaking:
+            return
+
+        classes = self._register_symmetry_classes()
+        self.logger.info(
+            "Register symmetry breaking: %d classes of interchangeable registers (%s)",
+            len(classes),
+            ", ".join(str(len(regs)) for regs, _ in classes),
+        )
+
+        # Within a class, the (j+1)-th register may only be used by an output if
+        # the j-th register is used by some earlier output, in program order.
+        for regs, dicts in classes:
+            for reg, reg_next in zip(regs, regs[1:]):
+                used_before = None
+                for d in dicts:
+                    if used_before is None:
+                        self._Add(d[reg_next] == False)  # noqa: E712
+                    else:
+                        self._AddImplication(d[reg_next], used_before)
+                    used = self._NewBoolVar(f"used_before[{reg}]")
+                    clause = [used.Not(), d[reg]]
+                    if used_before is not None:
+                        clause.append(used_before)
+                    self._AddAtLeastOne(clause)
+                    used_before = used
+
     # ================================================================
     #                 CONSTRAINTS (Software pipelining)              #
     # ================================================================
@@ -3874,6 +4636,86 @@ class SlothyBase(LockAttributes):
     #                         OBJECTIVES                            #
     # ==============================================================#
 
+    def _cycles_lower_bound(self, log=None):
+        """Compute a lower bound for the number of cycles of the optimized code
+        from the data flow graph and the microarchitecture model.
+
+        The bound is the maximum of the bounds imposed by the issue rate, the
+        critical path through the data flow graph, and the total occupancy of
+        every set of functional units. It is sound for the constraint model
+        built by SlothyBase, so stall counts below it need not be probed.
+
+        The bound is logged via `log`, or at debug level if it is None.
+
+        Returns None if no bound is available, which is the case when software
+        pipelining is enabled, only functional correctness is modelled, or the
+        code is empty."""
+        if log is None:
+            log = self.logger.debug
+        if self.config.sw_pipelining.enabled or self.config.constraints.functional_only:
+            return None
+
+        nodes = self._get_nodes()
+        if len(nodes) == 0:
+            return None
+        issue_bound = math.ceil(len(nodes) / self.target.issue_rate)
+
+        # Critical path: Every instruction has to start no earlier than its
+        # producers plus their latencies, and all instructions have to start
+        # within the window.
+        path_bound = 0
+        if self.config.constraints.model_latencies:
+            edges = {}
+            for t, i, _, _ in self._iter_dependencies(with_virt=False):
+                latency = self.target.get_latency(i.src.inst, i.idx, t.inst)
+                # Latencies with an alternative constraint need not be respected
+                if not isinstance(latency, int):
+                    continue
+                edges.setdefault(t, []).append((i.src, latency))
+            earliest = {}
+            # Nodes are in program order, so producers come before consumers
+            for t in nodes:
+                earliest[t] = max(
+                    (earliest[src] + lat for src, lat in edges.get(t, [])),
+                    default=0,
+                )
+            path_bound = max(earliest.values(), default=-1) + 1
+
+        # Functional units: Every set of units can absorb at most one cycle of
+        # occupancy per unit and cycle, including the cycle past the window.
+        unit_bound = 0
+        if self.config.constraints.model_functional_units:
+            usages = []
+            for t in nodes:
+                occupancy = self.target.get_inverse_throughput(t.inst)
+                units = self.target.get_units(t.inst)
+                if len(units) == 1:
+                    # All units are occupied
+                    used = units[0] if isinstance(units[0], list) else [units[0]]
+                    usages += [(frozenset([u]), occupancy) for u in used]
+                elif len(units) > 1:
+                    # One of the units is occupied
+                    choices = set()
+                    for unit_choices in units:
+                        if not isinstance(unit_choices, list):
+                            unit_choices = [unit_choices]
+                        choices.update(unit_choices)
+                    usages.append((frozenset(choices), occupancy))
+            for unit_set in {s for s, _ in usages}:
+                load = sum(occ for s, occ in usages if s <= unit_set)
+                unit_bound = max(unit_bound, math.ceil(load / len(unit_set)) - 1)
+
+        bound = max(issue_bound, path_bound, unit_bound)
+        log(
+            "Lower bound: %d cycles (issue rate: %d, critical path: %d, "
+            "functional units: %d)",
+            bound,
+            issue_bound,
+            path_bound,
+            unit_bound,
+        )
+        return bound
+
     def _stalls_to_stats(self, stalls):
         psize = self._model.min_slots + self._model.pfactor * stalls
         cc = psize // self.config.target.issue_rate
@@ -4022,8 +4864,49 @@ class SlothyBase(LockAttributes):
 
     def _init_external_model_and_solver(self):
         self._model.cp_model = cp_model.CpModel()
+        self._configure_solver(self._solver_overrides)
+
+    def _solver_parameters(self, overrides=None):
+        """Collect the CP-SAT parameters configured for this optimization, with
+        the given overrides taking precedence."""
+        c = self.config
+        params = {}
+        if c.solver_num_workers is not None:
+            params["num_workers"] = c.solver_num_workers
+        if c.solver_subsolvers is not None:
+            params["subsolvers"] = c.solver_subsolvers
+        if c.solver_linearization_level is not None:
+            params["linearization_level"] = c.solver_linearization_level
+        if c.solver_symmetry_level is not None:
+            params["symmetry_level"] = c.solver_symmetry_level
+        params.update(c.solver_parameters)
+        if overrides is not None:
+            params.update(overrides)
+        return params
+
+    def _configure_solver(self, overrides=None):
         self._model.cp_solver = cp_model.CpSolver()
-        self._model.cp_solver.parameters.random_seed = self.config.solver_random_seed
+        parameters = self._model.cp_solver.parameters
+        parameters.random_seed = self.config.solver_random_seed
+        for name, val in self._solver_parameters(overrides).items():
+            self.logger.debug("Setting CP-SAT parameter %s to %s", name, val)
+            try:
+                if isinstance(val, (list, tuple)):
+                    field = getattr(parameters, name)
+                    if hasattr(field, "clear"):
+                        field.clear()
+                    else:
+                        del field[:]
+                    field.extend(val)
+                    continue
+                # Allow enum-typed parameters to be given by name
+                if isinstance(val, str) and hasattr(parameters, val):
+                    val = getattr(parameters, val)
+                setattr(parameters, name, val)
+            except (AttributeError, TypeError, ValueError) as exc:
+                raise InvalidConfig(
+                    f"Invalid CP-SAT parameter {name}={val}: {exc}"
+                ) from exc
 
     def _NewIntVar(self, minval, maxval, name=""):
         r = self._model.cp_model.NewIntVar(minval, maxval, name)
@@ -4070,8 +4953,14 @@ class SlothyBase(LockAttributes):
         return self._model.cp_model.AddAllDifferent(lst)
 
     def _AddHint(self, var, val):
+        # Remember hints: CP-SAT rejects models hinting a variable twice
+        self._model.hints[var.Index()] = (var, val)
         return self._model.cp_model.AddHint(var, val)
 
+    def _ClearHints(self):
+        self._model.hints = {}
+        return self._model.cp_model.ClearHints()
+
     def _AddMaxEquality(self, varlist, var):
         return self._model.cp_model.AddMaxEquality(varlist, var)
 
@@ -4156,6 +5045,29 @@ class SlothyBase(LockAttributes):
                     return True
             return False
 
+        # Cap the solver at the time remaining until the global timeout
+        self._model.time_capped = False
+        remaining = self.config.time_remaining()
+        if remaining is not None:
+            if remaining == 0:
+                self.logger.warning("Global timeout expired -- skipping solver")
+                self._model.cp_model.status = cp_model.UNKNOWN
+                return False
+            parameters = self._model.cp_solver.parameters
+            if remaining < parameters.max_time_in_seconds:
+                self.logger.info(
+                    "Capping timeout at %.1f seconds remaining of global timeout",
+                    remaining,
+                )
+                parameters.max_time_in_seconds = remaining
+                self._model.time_capped = True
+
+        snapshot = None
+        if (
+            self.config.solution_callback is not None
+            or self.config.solution_pool_size > 0
+        ):
+            snapshot = self._solution_snapshot
         solution_cb = SlothyBase.CpSatSolutionCb(
             self.logger,
             self._model.objective_name,
@@ -4163,10 +5075,18 @@ class SlothyBase(LockAttributes):
             is_good_enough=is_good_enough,
             printer=self._model.objective_printer,
             variables=self._model.objective_vars,
+            snapshot=snapshot,
+            on_solution=self.config.solution_callback,
+            pool_size=self.config.solution_pool_size,
         )
-        self._model.cp_model.status = self._model.cp_solver.Solve(
-            self._model.cp_model, solution_cb
-        )
+        with profile_phase("solve", **self._model_size()) as info:
+            self._model.cp_model.status = self._model.cp_solver.Solve(
+                self._model.cp_model, solution_cb
+            )
+            info["status"] = self._model.cp_solver.StatusName(
+                self._model.cp_model.status
+            )
+            info["booleans"] = self._model.cp_solver.NumBooleans()
 
         status_str = self._model.cp_solver.StatusName(self._model.cp_model.status)
         self.logger.info(
@@ -4174,39 +5094,56 @@ class SlothyBase(LockAttributes):
         )
 
         ok = self._model.cp_model.status in [cp_model.FEASIBLE, cp_model.OPTIMAL]
+        self._result.solution_pool = solution_cb.solution_pool()
 
         # - Export (optional)
         self._export_model()
 
         if ok:
             # Remember solution in case we want to retry with an(other) objective
-            self._model.cp_model.ClearHints()
+            self._ClearHints()
             for v in self._model.variables:
                 self._AddHint(v, self._model.cp_solver.Value(v))
 
         return ok
 
+    @profiled("retry")
     def retry(self, fix_stalls=None):
+        result_cache, cache_key, entry = self._lookup_result_cache(
+            retry=True, fix_stalls=fix_stalls
+        )
+        if entry is not None:
+            return self._load_result_from_cache(entry)
+
+        # If the initial optimization was served from the result cache,
+        # no model has been built yet.
+        if getattr(self._model, "cp_model", None) is None:
+            self._build_model()
+
         self._result = Result(self.config)
 
         if fix_stalls is not None:
             assert self.config.variable_size
             self._Add(self._model.stalls == fix_stalls)
 
-        self._set_timeout(self.config.retry_timeout)
+        # Start from a fresh solver so that parameter overrides of the initial
+        # pass do not carry over
+        self._configure_solver(self.config.solver_retry_parameters)
+        if self.config.retry_timeout is not None:
+            self._set_timeout(self.config.retry_timeout)
+        else:
+            self._set_timeout(self.config.timeout)
 
         # - Objective
-        self._add_objective(force_objective=fix_stalls is not None)
+        self._add_objective(force_objective=fix_stalls is not None or self._incremental)
 
         # Do the actual work
-        self.logger.info("Invoking external constraint solver...")
+        self.logger.info(
+            "Invoking external constraint solver (%s) ...", self._describe_solver()
+        )
         self.result.success = self._solve()
         self.result.valid = True
-        if not self.success:
-            return False
-
-        self._extract_result()
-        return True
+        return self._finish_solve(result_cache, cache_key)
 
     def _dump_model_statistics(self):
         # Extract and report results
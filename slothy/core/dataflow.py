@@ -25,8 +25,10 @@
 # Author: Hanno Becker <hannobecker@posteo.de>
 #
 
-from functools import cached_property
+from bisect import bisect_right
+from collections.abc import Mapping
 from slothy.helper import SourceLine
+from slothy.core.profiler import profile_phase
 
 
 class SlothyUselessInstructionException(Exception):
@@ -46,6 +48,8 @@ class RegisterSource:
     respectively.
     """
 
+    __slots__ = ("src", "idx")
+
     def __init__(self, src, idx):
         assert isinstance(src, ComputationNode)
         self.src = src
@@ -69,6 +73,8 @@ class RegisterSource:
 class InstructionOutput(RegisterSource):
     """Represents an output of a node in the data flow graph"""
 
+    __slots__ = ()
+
     def __repr__(self):
         return f"({self.src}).out[{self.idx}]"
 
@@ -91,6 +97,8 @@ class InstructionOutput(RegisterSource):
 class InstructionInOut(RegisterSource):
     """Represents an input/output of a node in the data flow graph"""
 
+    __slots__ = ()
+
     def __repr__(self):
         return f"({self.src}).inout[{self.idx}]"
 
@@ -110,6 +118,83 @@ class InstructionInOut(RegisterSource):
         return InstructionInOut(self.src.sibling, self.idx)
 
 
+class RegisterState:
+    """Versioned map from register names to the RegisterSource holding them
+
+    The data flow graph remembers the register state at every node. Rather than
+    copying the whole map for every node, RegisterState keeps the history of
+    assignments of every register, and every assignment creates a new version.
+    Snapshots of the state at a given version share this history.
+    """
+
+    def __init__(self):
+        # Register name -> (list of versions, list of sources)
+        self._history = {}
+        # Register names assigned to, in order; the i-th assignment creates
+        # version i+1
+        self._log = []
+
+    @property
+    def version(self):
+        """The current version of the register state"""
+        return len(self._log)
+
+    def __setitem__(self, reg, src):
+        self._log.append(reg)
+        versions, srcs = self._history.setdefault(reg, ([], []))
+        versions.append(len(self._log))
+        srcs.append(src)
+
+    def __getitem__(self, reg):
+        return self._history[reg][1][-1]
+
+    def __contains__(self, reg):
+        return reg in self._history
+
+    def snapshot(self):
+        """Returns a read-only view of the current register state, which is not
+        affected by subsequent assignments."""
+        return RegisterStateSnapshot(self, self.version)
+
+    def rollback(self, version):
+        """Undo all assignments made after the given version"""
+        while len(self._log) > version:
+            reg = self._log.pop()
+            versions, srcs = self._history[reg]
+            versions.pop()
+            srcs.pop()
+            if len(versions) == 0:
+                del self._history[reg]
+
+
+class RegisterStateSnapshot(Mapping):
+    """Read-only view of a RegisterState at a given version"""
+
+    __slots__ = ("_state", "_version")
+
+    def __init__(self, state, version):
+        self._state = state
+        self._version = version
+
+    def __getitem__(self, reg):
+        history = self._state._history.get(reg)
+        if history is None:
+            raise KeyError(reg)
+        versions, srcs = history
+        idx = bisect_right(versions, self._version)
+        if idx == 0:
+            raise KeyError(reg)
+        return srcs[idx - 1]
+
+    def __iter__(self):
+        for reg, (versions, _) in self._state._history.items():
+            if versions[0] <= self._version:
+                yield reg
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
 class VirtualInstruction:
     """A 'virtual' instruction node for inputs and outputs."""
 
@@ -199,6 +284,70 @@ class ComputationNode:
 
     """
 
+    # Attributes describing the node within the data flow graph
+    _GRAPH_ATTRIBUTES = (
+        "orig_pos",
+        "id",
+        "inst",
+        "src_in",
+        "src_in_out",
+        "dst_out",
+        "dst_in_out",
+        "is_locked",
+        "depth",
+        "reg_state",
+        "delete",
+        "changed",
+    )
+
+    # Attributes attached to the node by the constraint model and the heuristics.
+    # They are only present once set, so that accidental use of an attribute
+    # before it was assigned still raises an AttributeError.
+    _SOLVER_ATTRIBUTES = (
+        "inst_orig",
+        "fixup",
+        "sibling",
+        "latency_depth",
+        "orig_pos_scaled",
+        # Positions in the optimized code
+        "real_pos",
+        "real_pos_program",
+        "real_pos_cycle",
+        "pre",
+        "core",
+        "post",
+        # Model variables
+        "program_start_var",
+        "program_displacement",
+        "cycle_start_var",
+        "cycle_end_var",
+        "pre_var",
+        "core_var",
+        "post_var",
+        "slot_var",
+        "exec",
+        "exec_unit_choices",
+        "unique_unit",
+        "out_lifetime_start",
+        "out_lifetime_end",
+        "out_lifetime_duration",
+        "inout_lifetime_start",
+        "inout_lifetime_end",
+        "inout_lifetime_duration",
+        "alloc_in_var",
+        "alloc_out_var",
+        "alloc_in_out_var",
+        "alloc_in_combinations_vars",
+        "alloc_out_combinations_vars",
+        "alloc_in_out_combinations_vars",
+        "out_spills",
+        "in_out_spills",
+        "out_spill_vars",
+        "in_out_spill_vars",
+    )
+
+    __slots__ = _GRAPH_ATTRIBUTES + _SOLVER_ATTRIBUTES
+
     def __init__(
         self,
         *,
@@ -262,22 +411,22 @@ class ComputationNode:
         inst_txt = str(self.inst)
         return line.set_text(inst_txt)
 
-    @cached_property
+    @property
     def is_virtual_input(self):
         """Indicates whether the node is an input node."""
         return isinstance(self.inst, VirtualInputInstruction)
 
-    @cached_property
+    @property
     def is_virtual_output(self):
         """Indicates whether the node is an output node."""
         return isinstance(self.inst, VirtualOutputInstruction)
 
-    @cached_property
+    @property
     def is_virtual(self):
         """Indicates whether the node is an input or output node."""
         return self.is_virtual_input or self.is_virtual_output
 
-    @cached_property
+    @property
     def is_not_virtual(self):
         """Indicates whether the node is neither an input nor an output node."""
         return not self.is_virtual
@@ -575,8 +724,14 @@ class DataFlowGraph:
         """The underlying architecturel model"""
         return self.config.arch
 
-    def apply_cbs(self, cb, logger, one_a_time=False):
-        """Apply callback to all nodes in the graph"""
+    def apply_cbs(self, cb, logger, one_a_time=False, incremental=True):
+        """Apply callback to all nodes in the graph
+
+        If the callback changes or deletes nodes, the graph is rebuilt. Nodes are
+        considered changed if the callback returned True for them, or if it marked
+        them as changed or deleted. If incremental is set, only the part of the
+        graph from the first changed node onwards is rebuilt; the result is the
+        same as for a full rebuild."""
 
         count = 0
         while True:
@@ -591,15 +746,19 @@ class DataFlowGraph:
                 t.delete = False
                 t.changed = False
 
+            affected = set()
             for t in self.nodes:
                 if cb(t):
                     some_change = True
+                    affected.add(t)
                     if one_a_time is True:
                         break
 
             if some_change is False:
                 break
 
+            affected.update(t for t in self.nodes if t.changed or t.delete)
+
             z = filter(lambda x: x.delete is False, self.nodes)
 
             def pair_with_source(i):
@@ -632,7 +791,12 @@ class DataFlowGraph:
             for t in changed:
                 logger.debug("* %s was changed", t)
 
-            self._build_graph()
+            start = 0
+            if incremental is True:
+                start = self._unaffected_prefix(affected)
+                logger.debug("Rebuilding from source line %d onwards", start)
+
+            self._build_graph(start=start)
 
     def apply_parsing_cbs(self):
         """Apply parsing callbacks to all nodes in the graph.
@@ -717,15 +881,17 @@ class DataFlowGraph:
     def __init__(self, src: any, logger: any, config: any, parsing_cb: bool = True):
         self.logger = logger
         self.config = config
-        self.src = self._parse_source(src)
+        with profile_phase("parse", lines=len(src)):
+            self.src = self._parse_source(src)
 
-        self._build_graph()
+        with profile_phase("dfg"):
+            self._build_graph()
 
-        if parsing_cb is True:
-            self.apply_parsing_cbs()
+            if parsing_cb is True:
+                self.apply_parsing_cbs()
 
-        if config._unsafe_address_offset_fixup is True:
-            self._address_offset_fixup_cbs()
+            if config._unsafe_address_offset_fixup is True:
+                self._address_offset_fixup_cbs()
 
         self._selfcheck_outputs()
 
@@ -795,7 +961,16 @@ class DataFlowGraph:
         # prepare source lines for parsing
         src_lines = SourceLine.reduce_source(src)
         src_lines = SourceLine.unify_source(src_lines)
-        return list(map(self._parse_line, src_lines))
+        cache = self.arch.Instruction.parse_cache
+        hits, misses = cache.hits, cache.misses
+        res = list(map(self._parse_line, src_lines))
+        self.logger.debug(
+            "Parse cache: %d hits, %d misses (total hit rate %.2f)",
+            cache.hits - hits,
+            cache.misses - misses,
+            cache.stats()["hit_rate"],
+        )
+        return res
 
     def iter_dependencies(self):
         """Returns an iterator over all dependencies in the data flow graph.
@@ -945,15 +1120,79 @@ class DataFlowGraph:
         # Propagate change in register allocation to all dependent nodes
         self.update_inputs()
 
-    def _build_graph(self):
-        self.reg_state = {}
-        self.spilled_reg_state = {}
-        self._typing_dict = {}
-        self._nodes_all = []
+    def _unaffected_prefix(self, affected):
+        """Returns the number of leading source lines whose nodes are not affected
+        by a change, and which are represented by their node in the source
+        rebuilt from the graph."""
+        start = 0
+        for t in self._src_nodes:
+            # Absorbed spills/restores are dropped when rebuilding the source
+            if t is None or t in affected:
+                break
+            start += 1
+        return start
+
+    def _restore_checkpoint(self, idx):
+        """Roll back the graph to the state before processing the idx-th line"""
+        num_nodes_all, num_nodes, reg_state_version, spilled_reg_state, num_types = (
+            self._checkpoints[idx]
+        )
+        removed = self._nodes_all[num_nodes_all:]
+        removed_set = set(removed)
+
+        # Unlink removed nodes from the nodes they consume
+        for t in removed:
+            for r in t.src_in + t.src_in_out:
+                if r.src in removed_set:
+                    continue
+                if isinstance(r, InstructionOutput):
+                    dst = r.src.dst_out[r.idx]
+                else:
+                    dst = r.src.dst_in_out[r.idx]
+                dst[:] = [d for d in dst if d not in removed_set]
+
+        del self._nodes_all[num_nodes_all:]
+        del self._checkpoints[idx:]
+        del self._src_nodes[idx:]
+        self._num_nodes = num_nodes
+        self.reg_state.rollback(reg_state_version)
+        # The checkpoint is a copy, and it is dropped, so no copy is needed
+        self.spilled_reg_state = spilled_reg_state
+        # Registers are only ever added to the typing dictionary
+        for reg in list(self._typing_dict)[num_types:]:
+            del self._typing_dict[reg]
+
+    def _build_graph(self, start=0):
+        if start == 0:
+            self.reg_state = RegisterState()
+            self.spilled_reg_state = {}
+            self._typing_dict = {}
+            self._nodes_all = []
+            self._num_nodes = 0
+            # State of the graph before processing each source line, and the
+            # node each source line gave rise to (if any), for incremental rebuilds
+            self._checkpoints = []
+            self._src_nodes = []
+        else:
+            self._restore_checkpoint(start)
 
         # Process source and add one instruction a time to the data flow graph
-        for c, s in self.src:
+        for c, s in self.src[start:]:
+            self._checkpoints.append(
+                (
+                    len(self._nodes_all),
+                    self._num_nodes,
+                    self.reg_state.version,
+                    self.spilled_reg_state.copy(),
+                    len(self._typing_dict),
+                )
+            )
+            num_nodes = self._num_nodes
             self._add_node_from_candidates(c, s)
+            if self._num_nodes > num_nodes:
+                self._src_nodes.append(self._nodes_all[-1])
+            else:
+                self._src_nodes.append(None)
 
         # Mark inputs as outputs if desired
         outputs = set(self.config.outputs.copy())
@@ -1087,8 +1326,9 @@ class DataFlowGraph:
             s_id = f"output_{s.orig_reg}"
             orig_pos = None
         else:
-            s_id = len(self.nodes)
+            s_id = self._num_nodes
             orig_pos = s_id
+            self._num_nodes += 1
 
         step = ComputationNode(
             node_id=s_id,
@@ -1097,7 +1337,7 @@ class DataFlowGraph:
             src_in=src_in,
             src_in_out=src_in_out,
         )
-        step.reg_state = self.reg_state.copy()
+        step.reg_state = self.reg_state.snapshot()
 
         def change_reg_ref(reg, ref):
             self._remember_type(reg, ref.get_type())
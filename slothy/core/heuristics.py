@@ -33,14 +33,210 @@ module provides heuristics to split the optimization problem into several
 smaller-sizes problems amenable to one-shot SLOTHY.
 """
 
+import concurrent.futures
+import contextlib
+import functools
+import importlib
+import logging
 import math
+import pickle
+import time
 from pathlib import Path
 
 from slothy.core.dataflow import DataFlowGraph as DFG
 from slothy.core.dataflow import Config as DFGConfig, ComputationNode
-from slothy.core.core import SlothyBase, Result, SlothyException
-from slothy.helper import Permutation, SourceLine
-from slothy.helper import binary_search, BinarySearchLimitException
+from slothy.core.core import (
+    SlothyBase,
+    Result,
+    SlothyException,
+    SlothySelfCheckException,
+)
+from slothy.core.profiler import Profiler, active_profiler, profile_phase, profiled
+from slothy.helper import DeferHandler, Permutation, SourceLine, multiprocessing_context
+from slothy.helper import (
+    binary_search,
+    binary_search_parallel,
+    BinarySearchLimitException,
+)
+
+
+def _config_to_payload(conf):
+    """Split a configuration into a form which can be sent to worker processes
+
+    The architecture and target modules are replaced by their names."""
+    c = conf.copy()
+    c.arch = None
+    c.target = None
+    return conf.arch.__name__, conf.target.__name__, c
+
+
+def _config_from_payload(arch, target, conf):
+    """Restore a configuration split by _config_to_payload()"""
+    conf.arch = importlib.import_module(arch)
+    conf.target = importlib.import_module(target)
+    return conf
+
+
+def _capture_logs(logger_name, level):
+    """Collect the records of the given logger in a worker process, so they can
+    be sent back and replayed in the calling process."""
+    handler = DeferHandler()
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def _replay_logs(records):
+    """Replay log records sent back by a worker process"""
+    for r in records:
+        logging.getLogger(r.name).handle(r)
+
+
+def _worker_profiler(profile):
+    """Profiler for a worker process, whose phases are sent back and attached
+    to the profiler of the calling process."""
+    return Profiler() if profile else contextlib.nullcontext()
+
+
+def _attach_phases(phases):
+    """Attach phases sent back by a worker process to the active profiler"""
+    profiler = active_profiler()
+    if profiler is not None:
+        profiler.attach(phases)
+
+
+def _use_warm_start(conf):
+    # Solution hints only apply to the same source code
+    return (
+        conf.hints.ext_bsearch_warm_start
+        and not conf.hints.ext_bsearch_remember_successes
+    )
+
+
+def _closest_solution_hint(solution_hints, stalls):
+    """Pick the solution hint from the probe closest to the given number of
+    stalls, preferring larger stall counts on a tie."""
+    if len(solution_hints) == 0:
+        return None
+    closest = min(solution_hints, key=lambda k: (abs(k - stalls), -k))
+    return solution_hints[closest]
+
+
+def _optimize_binsearch_probe(payload, solution_hints, stalls, timeout=None):
+    """Solve a single probe of the parallel binary search in a worker process
+
+    Returns whether the optimization succeeded, and a triple of the log records it
+    produced, the solution hint for warm-starting other probes (if any), and the
+    phases recorded if profiling is enabled."""
+    arch, target, conf, source, kwargs, logger_name, level, profile = payload
+    conf = _config_from_payload(arch, target, conf)
+    conf.constraints.stalls_allowed = stalls
+    if timeout is not None:
+        conf.timeout = timeout
+    # Only feasibility matters here: The optimization for the minimum number of
+    # stalls is repeated and tested in the calling process.
+    conf.selftest = False
+
+    logger, handler = _capture_logs(logger_name, level)
+
+    logger.info(f"Attempt optimization with max {stalls} stalls...")
+    hint = None
+    if _use_warm_start(conf):
+        hint = _closest_solution_hint(solution_hints, stalls)
+    core = SlothyBase(conf.arch, conf.target, logger=logger, config=conf)
+    with _worker_profiler(profile) as profiler:
+        with profile_phase("probe", stalls=stalls):
+            success = core.optimize(
+                source,
+                solver_overrides=conf.solver_binsearch_parameters,
+                solution_hint=hint,
+                **kwargs,
+            )
+    if success and _use_warm_start(conf):
+        hint = core.solution_hint()
+    else:
+        hint = None
+    phases = profiler.phases() if profiler is not None else []
+    return success, (handler.export(), hint, phases)
+
+
+def _worker_payload(log, conf):
+    """The configuration and logging setup of a job, as sent to a worker process"""
+    return (
+        *_config_to_payload(conf),
+        log.name,
+        log.getEffectiveLevel(),
+        active_profiler() is not None,
+    )
+
+
+def _worker_call(payload, func, *args):
+    """Run func(*args, log, conf) in a worker process
+
+    Returns the result of func, the log records produced along the way, and the
+    phases recorded if profiling is enabled."""
+    arch, target, conf, logger_name, level, profile = payload
+    conf = _config_from_payload(arch, target, conf)
+    # The jobs are already run concurrently
+    conf.constraints.stalls_parallel_probes = 1
+
+    log, handler = _capture_logs(logger_name, level)
+
+    with _worker_profiler(profile) as profiler:
+        res = func(*args, log, conf)
+    phases = profiler.phases() if profiler is not None else []
+    return res, handler.export(), phases
+
+
+def _jobs_picklable(jobs, logger, what):
+    """Check whether jobs can be sent to worker processes, and warn if not
+
+    Jobs are tuples (func, args, log, conf) standing for func(*args, log, conf).
+    `what` describes the jobs for the warning."""
+    try:
+        pickle.dumps(
+            [(func, args, _worker_payload(log, conf)) for func, args, log, conf in jobs]
+        )
+    except (pickle.PicklingError, TypeError, AttributeError) as exc:
+        logger.warning(
+            "Cannot %s in parallel (%s) -- falling back to sequential optimization",
+            what,
+            exc,
+        )
+        return False
+    return True
+
+
+def _worker_pool(workers):
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing_context()
+    )
+
+
+def _run_jobs(pool, jobs):
+    """Run jobs in a pool of worker processes
+
+    The log records and profiler phases of the jobs are replayed in the order of
+    the jobs, so that they are the same as for a sequential run. Returns the
+    results of the jobs, in the same order."""
+    futures = [
+        pool.submit(_worker_call, _worker_payload(log, conf), func, *args)
+        for func, args, log, conf in jobs
+    ]
+    results = []
+    for future in futures:
+        res, records, phases = future.result()
+        _replay_logs(records)
+        _attach_phases(phases)
+        results.append(res)
+    return results
+
+
+def _linear_code(body, log, conf):
+    """Optimize straightline code via Heuristics.linear(), returning the code"""
+    return Heuristics.linear(body, log, conf).code
 
 
 class Heuristics:
@@ -53,17 +249,66 @@ class Heuristics:
     """
 
     @staticmethod
+    def _stalls_lower_bound(source, logger, conf):
+        """Compute a lower bound for the number of stalls needed for the source,
+        or 0 if this is disabled via Config.constraints.stalls_lower_bound."""
+        if not conf.constraints.stalls_lower_bound:
+            return 0
+        core = SlothyBase(conf.arch, conf.target, logger=logger, config=conf)
+        lower_bound = core.stalls_lower_bound(source)
+        if lower_bound > 0:
+            logger.info(
+                "Skipping stall counts below the lower bound of %d stalls",
+                lower_bound,
+            )
+        return lower_bound
+
+    @staticmethod
+    @profiled("binsearch")
     def _optimize_binsearch_core(source, logger, conf, **kwargs):
 
         logger_name = logger.name.replace(".", "_")
         last_successful = None
+        # Solution hints of successful probes, indexed by their number of stalls
+        solution_hints = {}
+        # Model shared by the probes, and the number of stalls of the last probe
+        reuse_model = (
+            conf.constraints.stalls_reuse_model
+            and not conf.hints.ext_bsearch_remember_successes
+        )
+        shared_core = None
+        shared_core_stalls = None
+
+        lower_bound = Heuristics._stalls_lower_bound(source, logger, conf)
+        if lower_bound > conf.constraints.stalls_minimum_attempt:
+            conf = conf.copy()
+            conf.constraints.stalls_minimum_attempt = lower_bound
+            conf.constraints.stalls_first_attempt = max(
+                lower_bound, conf.constraints.stalls_first_attempt
+            )
 
         def try_with_stalls(stalls, timeout=None):
-            nonlocal last_successful
+            with profile_phase("probe", stalls=stalls):
+                return try_with_stalls_core(stalls, timeout=timeout)
+
+        def try_with_stalls_core(stalls, timeout=None):
+            nonlocal last_successful, shared_core, shared_core_stalls
 
             logger.info(f"Attempt optimization with max {stalls} stalls...")
+            if (
+                shared_core is not None
+                and stalls <= shared_core.config.constraints.stalls_allowed
+            ):
+                success = shared_core.reoptimize(stalls, timeout=timeout)
+                shared_core_stalls = stalls
+                if success and _use_warm_start(conf):
+                    solution_hints[stalls] = shared_core.solution_hint()
+                return success, shared_core
+
             c = conf.copy()
             c.constraints.stalls_allowed = stalls
+            if reuse_model:
+                c.variable_size = True
 
             if c.hints.ext_bsearch_remember_successes:
                 c.hints.rename_hint_orig_rename = True
@@ -77,24 +322,59 @@ class Heuristics:
                 src = last_successful
             else:
                 src = source
-            success = core.optimize(src, **kwargs)
+            hint = None
+            if _use_warm_start(c):
+                hint = _closest_solution_hint(solution_hints, stalls)
+            success = core.optimize(
+                src,
+                solver_overrides=c.solver_binsearch_parameters,
+                solution_hint=hint,
+                incremental=reuse_model,
+                **kwargs,
+            )
+            if reuse_model:
+                shared_core = core
+                shared_core_stalls = stalls
 
             if success and c.hints.ext_bsearch_remember_successes:
                 last_successful = core.result.code
+            if success and _use_warm_start(c):
+                solution_hints[stalls] = core.solution_hint()
 
             return success, core
 
         try:
-            return binary_search(
+            if conf.constraints.stalls_parallel_probes > 1:
+                res = Heuristics._optimize_binsearch_parallel(
+                    source, logger, conf, try_with_stalls, solution_hints, **kwargs
+                )
+                if res is not None:
+                    return res
+
+            min_stalls, core = binary_search(
                 try_with_stalls,
                 minimum=conf.constraints.stalls_minimum_attempt - 1,
                 start=conf.constraints.stalls_first_attempt,
                 threshold=conf.constraints.stalls_maximum_attempt,
                 precision=conf.constraints.stalls_precision,
                 timeout_below_precision=conf.constraints.stalls_timeout_below_precision,
+                abort=conf.out_of_time,
             )
 
-        except BinarySearchLimitException:
+            # The shared model may have been probed for fewer stalls since
+            if core is shared_core and shared_core_stalls != min_stalls:
+                logger.info("Minimum number of stalls: %d. Solve again...", min_stalls)
+                if not core.reoptimize(min_stalls):
+                    raise SlothyException("Re-optimization of shared model failed")
+            return min_stalls, core
+
+        except BinarySearchLimitException as exc:
+            if conf.out_of_time():
+                logger.warning("Global timeout expired without finding a solution")
+                raise SlothyException(
+                    "No solution found within global timeout"
+                ) from exc
+
             logger.error("Exceeded stall limit without finding a working solution")
             logger.error("Here's what you asked me to optimize:")
 
@@ -118,6 +398,72 @@ class Heuristics:
             logger.error(f"Stored this information in {err_file}")
             raise SlothyException("No solution found.")
 
+    @staticmethod
+    def _optimize_binsearch_parallel(
+        source, logger, conf, try_with_stalls, solution_hints, **kwargs
+    ):
+        """Find the minimum number of stalls by probing multiple stall counts
+        concurrently, and re-run the optimization for the minimum in-process.
+
+        Returns None if the configuration cannot be sent to worker processes,
+        in which case the caller should fall back to the sequential search."""
+
+        payload = (
+            *_config_to_payload(conf),
+            source,
+            kwargs,
+            logger.name,
+            logger.getEffectiveLevel(),
+            active_profiler() is not None,
+        )
+        try:
+            pickle.dumps(payload)
+        except (pickle.PicklingError, TypeError, AttributeError) as exc:
+            logger.warning(
+                "Cannot use parallel stall probing (%s) -- falling back to "
+                "sequential binary search",
+                exc,
+            )
+            return None
+
+        def on_result(stalls, success, info):
+            records, hint, phases = info
+            _replay_logs(records)
+            _attach_phases(phases)
+            if hint is not None:
+                solution_hints[stalls] = hint
+            logger.info(
+                "Probe with max %d stalls: %s", stalls, "OK" if success else "FAIL"
+            )
+
+        probes = conf.constraints.stalls_parallel_probes
+        logger.info("Probing up to %d stall counts in parallel...", probes)
+        min_stalls = binary_search_parallel(
+            # Probes started in later rounds see the hints collected so far,
+            # since the arguments are pickled when a worker process is started.
+            functools.partial(_optimize_binsearch_probe, payload, solution_hints),
+            probes,
+            minimum=conf.constraints.stalls_minimum_attempt - 1,
+            start=conf.constraints.stalls_first_attempt,
+            threshold=conf.constraints.stalls_maximum_attempt,
+            precision=conf.constraints.stalls_precision,
+            timeout_below_precision=conf.constraints.stalls_timeout_below_precision,
+            on_result=on_result,
+            abort=conf.out_of_time,
+        )
+
+        logger.info("Minimum number of stalls: %d. Optimize again...", min_stalls)
+        success, core = try_with_stalls(min_stalls)
+        if success:
+            return min_stalls, core
+
+        logger.warning(
+            "Re-optimization with %d stalls failed -- continue with sequential "
+            "binary search",
+            min_stalls,
+        )
+        return None
+
     @staticmethod
     def optimize_binsearch(  # noqa: DOC103
         source: list, logger: any, conf: any, **kwargs: any
@@ -166,6 +512,13 @@ class Heuristics:
             "Will just pick previous result..."
         )
 
+    @staticmethod
+    def _log_objective_skipped(log):
+        log.warning(
+            "Global timeout expired -- skipping optimization for the objective, "
+            "returning the result at minimum number of stalls"
+        )
+
     @staticmethod
     def _log_input_output_warning(log):
         log.warning(
@@ -232,6 +585,10 @@ class Heuristics:
         if conf.has_objective is False:
             return core.result
 
+        if conf.out_of_time():
+            Heuristics._log_objective_skipped(logger)
+            return core.result
+
         logger.info(
             "Optimize again with minimal number of %d stalls, with objective...",
             min_stalls,
@@ -292,7 +649,10 @@ class Heuristics:
 
         logger.info("Perform internal binary search for minimal number of stalls...")
 
-        start_attempt = conf.constraints.stalls_first_attempt
+        start_attempt = max(
+            conf.constraints.stalls_first_attempt,
+            Heuristics._stalls_lower_bound(source, logger, conf),
+        )
         cur_attempt = start_attempt
 
         while True:
@@ -303,12 +663,18 @@ class Heuristics:
             logger.info("Attempt optimization with max %d stalls...", cur_attempt)
 
             core = SlothyBase(c.arch, c.target, logger=logger, config=c)
-            success = core.optimize(source, **kwargs)
+            success = core.optimize(
+                source, solver_overrides=c.solver_binsearch_parameters, **kwargs
+            )
 
             if success:
                 min_stalls = core.result.stalls
                 break
 
+            if conf.out_of_time():
+                logger.warning("Global timeout expired without finding a solution")
+                raise SlothyException("No solution found within global timeout")
+
             cur_attempt = max(1, cur_attempt * 2)
             if cur_attempt > conf.constraints.stalls_maximum_attempt:
                 logger.error("Exceeded stall limit without finding a working solution")
@@ -320,6 +686,10 @@ class Heuristics:
         if conf.has_objective is False or conf.constraints.minimize_spills is True:
             return core.result
 
+        if conf.out_of_time():
+            Heuristics._log_objective_skipped(logger)
+            return core.result
+
         logger.info(
             "Optimize again with minimal number of %d stalls, with objective...",
             min_stalls,
@@ -353,6 +723,10 @@ class Heuristics:
         done via Heuristics.linear() and thus themselves subject to the
         splitting heuristic, if enabled.
 
+        If portfolio mode is enabled (conf.sw_pipelining.portfolio == True), both
+        of the above strategies are run concurrently, and the one yielding the
+        faster kernel is picked.
+
         :param body: The loop body to be optimized. This must be a list of
             SourceLine instances.
         :type body: list
@@ -367,8 +741,15 @@ class Heuristics:
             the preamble and postamble (the caller will need this to adjust the
             loop counter).
         :rtype: any
+        :raises SlothyException: If no solution is found for the loop kernel,
+            unless the global timeout expired, in which case the loop is left
+            unchanged.
+        :raises SlothySelfCheckException: If the selfcheck fails.
         """
 
+        if conf.sw_pipelining.enabled and conf.sw_pipelining.portfolio:
+            return Heuristics._periodic_portfolio(body, logger, conf)
+
         if conf.sw_pipelining.enabled and not conf.inputs_are_outputs:
             Heuristics._log_input_output_warning(logger)
 
@@ -399,9 +780,26 @@ class Heuristics:
         # First step: Optimize loop kernel
 
         logger.debug("Optimize loop kernel...")
-        c = conf.copy()
+        # Leave half of the global timeout for preamble and postamble, if needed
+        optimize_pre_post = (
+            conf.sw_pipelining.optimize_preamble
+            or conf.sw_pipelining.optimize_postamble
+        )
+        with conf.time_share(0.5 if optimize_pre_post else 1):
+            c = conf.copy()
         c.inputs_are_outputs = True
-        result = Heuristics.optimize_binsearch(body, logger.getChild("slothy"), c)
+        try:
+            result = Heuristics.optimize_binsearch(body, logger.getChild("slothy"), c)
+        except SlothySelfCheckException:
+            raise
+        except SlothyException:
+            if not c.out_of_time():
+                raise
+            logger.warning(
+                "Global timeout expired before the loop kernel was optimized -- "
+                "keeping the loop unchanged"
+            )
+            return [], body, [], 0
 
         conf.outputs = list(
             map(lambda o: result.output_renamings.get(o, o), conf.outputs)
@@ -413,6 +811,9 @@ class Heuristics:
 
         # Second step: Separately optimize preamble and postamble
 
+        # The passes for preamble and postamble are independent of each other
+        passes = []
+
         preamble = result.preamble
         if conf.sw_pipelining.optimize_preamble:
             logger.debug("Optimize preamble...")
@@ -421,10 +822,7 @@ class Heuristics:
             c = conf.copy()
             c.outputs = result.kernel_input_output
             c.sw_pipelining.enabled = False
-            res_preamble = Heuristics.linear(
-                preamble, conf=c, logger=logger.getChild("preamble")
-            )
-            preamble = res_preamble.code
+            passes.append((preamble, logger.getChild("preamble"), c))
 
         postamble = result.postamble
         if conf.sw_pipelining.optimize_postamble:
@@ -432,13 +830,149 @@ class Heuristics:
             Heuristics._dump("Preamble", postamble, logger)
             c = conf.copy()
             c.sw_pipelining.enabled = False
-            res_postamble = Heuristics.linear(
-                postamble, conf=c, logger=logger.getChild("postamble")
-            )
-            postamble = res_postamble.code
+            passes.append((postamble, logger.getChild("postamble"), c))
+
+        codes = Heuristics.linear_many(
+            passes, logger, conf.sw_pipelining.parallel_passes
+        )
+        if conf.sw_pipelining.optimize_preamble:
+            preamble = codes.pop(0)
+        if conf.sw_pipelining.optimize_postamble:
+            postamble = codes.pop(0)
 
         return preamble, kernel, postamble, num_exceptional_iterations
 
+    @staticmethod
+    def _kernel_cycles(kernel, logger, conf):
+        """Estimate the number of cycles per loop iteration of a loop kernel in
+        steady state, keeping the order and registers of its instructions"""
+        c = conf.copy()
+        c.constraints.allow_reordering = False
+        c.constraints.allow_renaming = False
+        c.variable_size = True
+        c.inputs_are_outputs = True
+        c.selftest = False
+        c.split_heuristic = False
+        c.sw_pipelining.unroll = 1
+        c.sw_pipelining.halving_heuristic = False
+        c.sw_pipelining.allow_pre = False
+        c.sw_pipelining.allow_post = False
+        c.sw_pipelining.minimize_overlapping = False
+        res = Heuristics.optimize_binsearch(kernel, logger, c)
+        return res.cycles / conf.sw_pipelining.unroll
+
+    @staticmethod
+    def _portfolio_candidate(body, logger, conf):
+        """Optimize a loop with a single strategy of the portfolio
+
+        Returns the result of Heuristics.periodic(), the number of cycles per
+        loop iteration of its kernel, the outputs and inputs_are_outputs of the
+        configuration as adjusted by Heuristics.periodic(), the time taken, and an
+        error message, if the strategy failed.
+
+        As for Heuristics.periodic(), the loop is kept unchanged if the global
+        timeout expires. The number of cycles is None if the global timeout
+        expired before the kernel could be evaluated."""
+        start = time.monotonic()
+        try:
+            res = Heuristics.periodic(body, logger, conf)
+        except SlothySelfCheckException:
+            raise
+        except SlothyException as exc:
+            return None, None, None, None, time.monotonic() - start, str(exc)
+        outputs = (conf.outputs, conf.inputs_are_outputs)
+
+        try:
+            cycles = Heuristics._kernel_cycles(
+                res[1], logger.getChild("kernel_cycles"), conf
+            )
+        except SlothySelfCheckException:
+            raise
+        except SlothyException as exc:
+            if not conf.out_of_time():
+                return None, None, None, None, time.monotonic() - start, str(exc)
+            logger.warning("Global timeout expired before the kernel was evaluated")
+            cycles = None
+        return res, cycles, *outputs, time.monotonic() - start, None
+
+    @staticmethod
+    def _periodic_portfolio(body, logger, conf):
+        """Optimize a loop with the halving heuristic and with full software
+        pipelining, for every unroll factor of the portfolio, and pick the
+        strategy whose kernel takes the fewest cycles per iteration"""
+        unrolls = conf.sw_pipelining.portfolio_unroll
+        if unrolls is None:
+            unrolls = [conf.sw_pipelining.unroll]
+
+        candidates = []
+        for unroll in sorted(set(unrolls)):
+            for halving in [False, True]:
+                c = conf.copy()
+                c.sw_pipelining.portfolio = False
+                c.sw_pipelining.unroll = unroll
+                c.sw_pipelining.halving_heuristic = halving
+                name = f"{'halving' if halving else 'full'}_unroll{unroll}"
+                candidates.append((name, logger.getChild(name), c))
+
+        jobs = [
+            (Heuristics._portfolio_candidate, (body,), log, c)
+            for _, log, c in candidates
+        ]
+        if _jobs_picklable(jobs, logger, "race strategies"):
+            logger.info(
+                "Racing %d strategies in parallel: %s",
+                len(candidates),
+                ", ".join(name for name, _, _ in candidates),
+            )
+            with _worker_pool(len(jobs)) as pool:
+                outcomes = _run_jobs(pool, jobs)
+        else:
+            outcomes = []
+            for i, (func, args, log, c) in enumerate(jobs):
+                # Spread the remaining time evenly over the remaining strategies
+                with c.time_share(1 / (len(jobs) - i)):
+                    outcomes.append(func(*args, log, c))
+
+        def rank(outcome):
+            # Strategies whose kernel could not be evaluated come last
+            cycles = outcome[1]
+            return (cycles is None, cycles or 0)
+
+        best = None
+        for (name, _, c), outcome in zip(candidates, outcomes):
+            _, cycles, _, _, duration, error = outcome
+            if error is not None:
+                logger.info(
+                    "Portfolio: %s failed after %.1fs (%s)", name, duration, error
+                )
+                continue
+            if cycles is None:
+                logger.info(
+                    "Portfolio: %s took %.1fs, kernel not evaluated", name, duration
+                )
+            else:
+                logger.info(
+                    "Portfolio: %s took %.1fs, kernel: %.2f cycles/iteration",
+                    name,
+                    duration,
+                    cycles,
+                )
+            if best is None or rank(outcome) < rank(best[1]):
+                best = ((name, c), outcome)
+
+        if best is None:
+            raise SlothyException("All strategies of the portfolio failed")
+
+        (name, c), (res, cycles, outputs, inputs_are_outputs, _, _) = best
+        if cycles is None:
+            logger.info("Portfolio: picking %s (kernel not evaluated)", name)
+        else:
+            logger.info("Portfolio: picking %s (%.2f cycles/iteration)", name, cycles)
+        conf.outputs = outputs
+        conf.inputs_are_outputs = inputs_are_outputs
+        conf.sw_pipelining.unroll = c.sw_pipelining.unroll
+        return res
+
     @staticmethod
     def linear(body: list, logger: any, conf: any) -> any:
         """Entrypoint for straightline optimization.
@@ -458,9 +992,13 @@ class Heuristics:
             disabled.
         :type conf: any
 
-        :return: A Result object representing the final optimization result.
+        :return: A Result object representing the final optimization result. If the
+            global timeout expired before any solution was found, this represents
+            the unchanged input.
         :rtype: any
-        :raises SlothyException: If software pipelining is enabled.
+        :raises SlothyException: If software pipelining is enabled, or if no
+            solution is found while the global timeout has not expired.
+        :raises SlothySelfCheckException: If the selfcheck fails.
         """
         assert SourceLine.is_source(body)
         if conf.sw_pipelining.enabled:
@@ -470,12 +1008,86 @@ class Heuristics:
 
         Heuristics._dump("Starting linear optimization...", body, logger)
 
-        # So far, we only implement one heuristic: The splitting heuristic --
-        # If that's disabled, just forward to the core optimization
-        if not conf.split_heuristic:
-            return Heuristics.optimize_binsearch(body, logger.getChild("slothy"), conf)
+        try:
+            # So far, we only implement one heuristic: The splitting heuristic --
+            # If that's disabled, just forward to the core optimization
+            if not conf.split_heuristic:
+                return Heuristics.optimize_binsearch(
+                    body, logger.getChild("slothy"), conf
+                )
 
-        return Heuristics._split(body, logger, conf)
+            return Heuristics._split(body, logger, conf)
+        except SlothySelfCheckException:
+            raise
+        except SlothyException:
+            if not conf.out_of_time():
+                raise
+            logger.warning(
+                "Global timeout expired before a solution was found -- "
+                "keeping the code unchanged"
+            )
+            return Heuristics._unoptimized_result(body, logger, conf)
+
+    @staticmethod
+    def linear_many(passes: list, logger: any, workers: int = 1) -> list:
+        """Optimize independent pieces of straightline code via Heuristics.linear().
+
+        If `workers` is greater than 1, the pieces are optimized concurrently in
+        worker processes. The log output of every pass is replayed in the order of
+        the passes, so that it is the same as for a sequential run. If the
+        configuration of a pass cannot be sent to worker processes, all passes
+        run sequentially.
+
+        If a global timeout is running, sequential passes share the remaining
+        time evenly, while concurrent passes each have all of it.
+
+        :param passes: The passes to run, as a list of tuples (body, logger, conf)
+            of the code to be optimized, the logger to use, and the configuration
+            to apply, as for Heuristics.linear().
+        :type passes: list
+        :param logger: The logger to be used for messages not specific to a pass.
+        :type logger: any
+        :param workers: The maximum number of worker processes to use.
+        :type workers: int
+        :return: The optimized code for each pass, in the order of the passes.
+        :rtype: list
+        """
+        workers = min(workers, len(passes))
+        jobs = [(_linear_code, (body,), log, conf) for body, log, conf in passes]
+        if workers > 1 and _jobs_picklable(jobs, logger, "run passes"):
+            logger.info(
+                "Optimizing %d independent passes using %d workers...",
+                len(passes),
+                workers,
+            )
+            with _worker_pool(workers) as pool:
+                return _run_jobs(pool, jobs)
+
+        codes = []
+        for i, (body, log, conf) in enumerate(passes):
+            with conf.time_share(1 / (len(passes) - i)):
+                codes.append(_linear_code(body, log, conf))
+        return codes
+
+    @staticmethod
+    def _unoptimized_result(body, logger, conf):
+        """Build a Result object for leaving straightline code unchanged"""
+        body = SourceLine.reduce_source(body)
+        inputs = DFG(
+            body, logger.getChild("dfg_generate_inputs"), DFGConfig(conf)
+        ).inputs
+
+        res = Result(conf)
+        res.orig_code = body.copy()
+        res.code = body.copy()
+        res.codesize_with_bubbles = len(body)
+        res.success = True
+        res.reordering_with_bubbles = Permutation.permutation_id(len(body))
+        res.input_renamings = {s: s for s in inputs}
+        res.output_renamings = {s: s for s in conf.outputs}
+        res.valid = True
+        res.selfcheck(logger.getChild("unoptimized"))
+        return res
 
     @staticmethod
     def _naive_reordering(body, logger, conf, use_latency_depth=False):
@@ -692,6 +1304,116 @@ class Heuristics:
         return ssa
 
     @staticmethod
+    @profiled("split_chunk")
+    def _optimize_chunk_core(body, start_idx, end_idx, log, conf):
+        """Optimize the window [start_idx, end_idx] of body with the surrounding
+        code fixed, and return the optimized window (including seams), its
+        reordering, its stall positions, and the lengths of the seams."""
+
+        cur_pre = body[:start_idx]
+        cur_body = body[start_idx:end_idx]
+        cur_post = body[end_idx:]
+
+        if not conf.split_heuristic_optimize_seam:
+            prefix_len = 0
+            suffix_len = 0
+        else:
+            prefix_len = min(len(cur_pre), conf.split_heuristic_optimize_seam)
+            suffix_len = min(len(cur_post), conf.split_heuristic_optimize_seam)
+            cur_prefix = cur_pre[-prefix_len:] if prefix_len > 0 else []
+            cur_suffix = cur_post[:suffix_len]
+            cur_body = cur_prefix + cur_body + cur_suffix
+            cur_post = cur_post[suffix_len:]
+
+        Heuristics._dump(
+            f"Optimizing chunk [{start_idx}-{prefix_len}:{end_idx}+{suffix_len}]",
+            cur_body,
+            log,
+        )
+        if prefix_len > 0:
+            Heuristics._dump("Using prefix", cur_prefix, log)
+        if suffix_len > 0:
+            Heuristics._dump("Using suffix", cur_suffix, log)
+
+        # Find dependencies of rest of body
+
+        dfgc = DFGConfig(conf.copy())
+        dfgc.outputs = set(dfgc.outputs).union(conf.outputs)
+        cur_outputs = DFG(cur_post, log.getChild("dfg_infer_outputs"), dfgc).inputs
+
+        c = conf.copy()
+        c.rename_inputs = {"other": "static"}  # No renaming
+        c.rename_outputs = {"other": "static"}  # No renaming
+        c.inputs_are_outputs = False
+        c.outputs = cur_outputs
+
+        result = Heuristics.optimize_binsearch(
+            cur_body,
+            log.getChild(f"{start_idx}_{end_idx}"),
+            c,
+            prefix_len=prefix_len,
+            suffix_len=suffix_len,
+        )
+        Heuristics._dump(f"New chunk [{start_idx}:{end_idx}]", result.code, log)
+
+        return (
+            SourceLine.reduce_source(result.code),
+            result.reordering,
+            result.stall_positions,
+            prefix_len,
+            suffix_len,
+        )
+
+    @staticmethod
+    def _optimize_chunk_in_time(body, window, log, conf):
+        """Optimize a window via Heuristics._optimize_chunk_core(), or return None
+        if the global timeout expired before the window could be optimized"""
+        start_idx, end_idx = window
+        try:
+            return Heuristics._optimize_chunk_core(body, start_idx, end_idx, log, conf)
+        except SlothySelfCheckException:
+            raise
+        except SlothyException:
+            if not conf.out_of_time():
+                raise
+            log.warning("Out of time for window [%d:%d] -- skipping", *window)
+            return None
+
+    @staticmethod
+    def _adaptive_windows(stalls, le, window_len):
+        """Turn a stall map into a prioritized list of optimization windows
+
+        Stalls at most half a window apart form a cluster, spanning at most one
+        window. Each cluster is covered by a window reaching half a window beyond
+        its first and last stall, so windows cover between one and two times the
+        window length. Regions without stalls are not covered. Windows are ordered
+        by the number of stalls they contain, most first."""
+        half = max(1, window_len // 2)
+        clusters = []
+        for i in sorted(stalls):
+            if (
+                len(clusters) > 0
+                and i - clusters[-1][-1] <= half
+                and i - clusters[-1][0] <= window_len
+            ):
+                clusters[-1].append(i)
+            else:
+                clusters.append([i])
+
+        windows = []
+        for cluster in clusters:
+            start_idx = max(0, cluster[0] - half)
+            end_idx = min(le, cluster[-1] + 1 + half)
+            if start_idx < end_idx:
+                windows.append((start_idx, end_idx))
+
+        def num_stalls(window):
+            return sum(1 for i in stalls if window[0] <= i < window[1])
+
+        return sorted(windows, key=lambda w: (-num_stalls(w), w[0]))
+
+    @staticmethod
+    @profiled("split")
     def _split_inner(body, logger, conf, ssa=False):
 
         le = len(body)
@@ -762,63 +1484,39 @@ class Heuristics:
             ]
             print_intarr(stalls_cumulative, le)
 
-        def optimize_chunk(start_idx, end_idx, body, stalls, show_stalls=True):
+        def optimize_chunk(
+            start_idx,
+            end_idx,
+            body,
+            stalls,
+            show_stalls=True,
+            solved=None,
+            chunk_conf=None,
+        ):
             """Optimizes a sub-chunks of the given snippet, delimited by pairs
             of start and end indices provided as arguments. Input/output register
-            names stay intact -- in particular, overlapping chunks are allowed."""
-
-            cur_pre = body[:start_idx]
-            cur_body = body[start_idx:end_idx]
-            cur_post = body[end_idx:]
-
-            if not conf.split_heuristic_optimize_seam:
-                prefix_len = 0
-                suffix_len = 0
-            else:
-                prefix_len = min(len(cur_pre), conf.split_heuristic_optimize_seam)
-                suffix_len = min(len(cur_post), conf.split_heuristic_optimize_seam)
-                cur_prefix = cur_pre[-prefix_len:] if prefix_len > 0 else []
-                cur_suffix = cur_post[:suffix_len]
-                cur_body = cur_prefix + cur_body + cur_suffix
-                cur_pre = cur_pre[:-prefix_len] if prefix_len > 0 else cur_pre
-                cur_post = cur_post[suffix_len:]
-
-            pre_pad = len(cur_pre)
-            post_pad = len(cur_post)
-
-            Heuristics._dump(
-                f"Optimizing chunk [{start_idx}-{prefix_len}:{end_idx}+{suffix_len}]",
-                cur_body,
-                log,
-            )
-            if prefix_len > 0:
-                Heuristics._dump("Using prefix", cur_prefix, log)
-            if suffix_len > 0:
-                Heuristics._dump("Using suffix", cur_suffix, log)
-
-            # Find dependencies of rest of body
-
-            dfgc = DFGConfig(conf.copy())
-            dfgc.outputs = set(dfgc.outputs).union(conf.outputs)
-            cur_outputs = DFG(cur_post, log.getChild("dfg_infer_outputs"), dfgc).inputs
-
-            c = conf.copy()
-            c.rename_inputs = {"other": "static"}  # No renaming
-            c.rename_outputs = {"other": "static"}  # No renaming
-            c.inputs_are_outputs = False
-            c.outputs = cur_outputs
+            names stay intact -- in particular, overlapping chunks are allowed.
+
+            If the chunk has already been optimized by a worker process, its
+            result is passed in `solved` and only stitched into the body. If
+            `chunk_conf` is set, it is used instead of the configuration of the
+            split heuristic."""
+
+            if solved is None:
+                solved = Heuristics._optimize_chunk_core(
+                    body,
+                    start_idx,
+                    end_idx,
+                    log,
+                    conf if chunk_conf is None else chunk_conf,
+                )
+            code, reordering, stall_positions, prefix_len, suffix_len = solved
 
-            result = Heuristics.optimize_binsearch(
-                cur_body,
-                log.getChild(f"{start_idx}_{end_idx}"),
-                c,
-                prefix_len=prefix_len,
-                suffix_len=suffix_len,
-            )
-            Heuristics._dump(f"New chunk [{start_idx}:{end_idx}]", result.code, log)
-            new_body = cur_pre + SourceLine.reduce_source(result.code) + cur_post
+            pre_pad = start_idx - prefix_len
+            post_pad = len(body) - end_idx - suffix_len
+            new_body = body[:pre_pad] + code + body[len(body) - post_pad :]
 
-            perm = Permutation.permutation_pad(result.reordering, pre_pad, post_pad)
+            perm = Permutation.permutation_pad(reordering, pre_pad, post_pad)
 
             keep_stalls = {
                 i
@@ -826,13 +1524,92 @@ class Heuristics:
                 if i < start_idx - prefix_len or i >= end_idx + suffix_len
             }
             new_stalls = keep_stalls.union(
-                map(lambda i: i + start_idx - prefix_len, result.stall_positions)
+                map(lambda i: i + start_idx - prefix_len, stall_positions)
             )
 
             if show_stalls:
                 print_stalls(new_stalls, le)
 
-            return new_body, new_stalls, len(result.stall_positions), perm
+            return new_body, new_stalls, len(stall_positions), perm
+
+        def should_abort(cur_stalls, high, low):
+            if high is not None and cur_stalls > high:
+                return True
+            if low is not None and cur_stalls < low:
+                return True
+            return False
+
+        def make_waves(start_end_idx_lst):
+            """Group windows into waves of windows which do not overlap, taking
+            into account the seam around each window."""
+            seam = conf.split_heuristic_optimize_seam
+            waves = []
+            for start_idx, end_idx in start_end_idx_lst:
+                lo, hi = start_idx - seam, end_idx + seam
+                for wave in waves:
+                    if all(hi <= s - seam or e + seam <= lo for s, e in wave):
+                        wave.append((start_idx, end_idx))
+                        break
+                else:
+                    waves.append([(start_idx, end_idx)])
+            return waves
+
+        def optimize_chunks_parallel(
+            start_end_idx_lst,
+            body,
+            stalls,
+            abort_stall_threshold_high=None,
+            abort_stall_threshold_low=None,
+            **kwargs,
+        ):
+            """Optimize waves of non-overlapping windows concurrently
+
+            Returns None if the configuration cannot be sent to worker processes."""
+            perm = Permutation.permutation_id(len(body))
+            waves = make_waves(start_end_idx_lst)
+            workers = min(
+                conf.split_heuristic_parallel_chunks, max(len(w) for w in waves)
+            )
+
+            def wave_jobs(wave, body):
+                return [
+                    (Heuristics._optimize_chunk_in_time, (body, window), log, conf)
+                    for window in wave
+                ]
+
+            # Later waves only differ in the code, so checking the first suffices
+            if not _jobs_picklable(wave_jobs(waves[0], body), log, "optimize windows"):
+                return None
+
+            log.info(
+                "Optimizing %d windows in %d waves using %d workers...",
+                len(start_end_idx_lst),
+                len(waves),
+                workers,
+            )
+            with _worker_pool(workers) as pool:
+                for wave in waves:
+                    # All windows of a wave are optimized against the same code.
+                    # Since they do not overlap and the optimization of a window
+                    # preserves its length and its input/output registers, their
+                    # results can be stitched together one after another.
+                    results = _run_jobs(pool, wave_jobs(wave, body))
+                    abort = False
+                    for (start_idx, end_idx), solved in zip(wave, results):
+                        if solved is None:
+                            continue
+                        body, stalls, cur_stalls, local_perm = optimize_chunk(
+                            start_idx, end_idx, body, stalls, solved=solved, **kwargs
+                        )
+                        perm = Permutation.permutation_comp(local_perm, perm)
+                        abort |= should_abort(
+                            cur_stalls,
+                            abort_stall_threshold_high,
+                            abort_stall_threshold_low,
+                        )
+                    if abort:
+                        break
+            return body, stalls, perm
 
         def optimize_chunks_many(
             start_end_idx_lst,
@@ -842,22 +1619,134 @@ class Heuristics:
             abort_stall_threshold_low=None,
             **kwargs,
         ):
+            if conf.split_heuristic_parallel_chunks > 1 and len(start_end_idx_lst) > 1:
+                res = optimize_chunks_parallel(
+                    start_end_idx_lst,
+                    body,
+                    stalls,
+                    abort_stall_threshold_high=abort_stall_threshold_high,
+                    abort_stall_threshold_low=abort_stall_threshold_low,
+                    **kwargs,
+                )
+                if res is not None:
+                    return res
+
             perm = Permutation.permutation_id(len(body))
-            for start_idx, end_idx in start_end_idx_lst:
+            for i, (start_idx, end_idx) in enumerate(start_end_idx_lst):
+                if conf.out_of_time():
+                    log.warning("Global timeout expired -- skipping remaining windows")
+                    break
+                # Spread the remaining time evenly over the remaining windows
+                with conf.time_share(1 / (len(start_end_idx_lst) - i)):
+                    chunk_conf = conf.copy()
+                solved = Heuristics._optimize_chunk_in_time(
+                    body, (start_idx, end_idx), log, chunk_conf
+                )
+                if solved is None:
+                    continue
                 body, stalls, cur_stalls, local_perm = optimize_chunk(
-                    start_idx, end_idx, body, stalls, **kwargs
+                    start_idx, end_idx, body, stalls, solved=solved, **kwargs
                 )
                 perm = Permutation.permutation_comp(local_perm, perm)
-                if (
-                    abort_stall_threshold_high is not None
-                    and cur_stalls > abort_stall_threshold_high
+                if should_abort(
+                    cur_stalls, abort_stall_threshold_high, abort_stall_threshold_low
                 ):
                     break
-                if (
-                    abort_stall_threshold_low is not None
-                    and cur_stalls < abort_stall_threshold_low
-                ):
+            return body, stalls, perm
+
+        def optimize_adaptive(body, stalls):
+            """Optimize windows around clusters of stalls, most stalls first, until
+            a pass brings no gain or the time budget is exhausted"""
+            perm = Permutation.permutation_id(len(body))
+            budget = conf.split_heuristic_adaptive_time_budget
+            window_len = max(1, int(le // split_factor))
+            max_window_len = 2 * window_len
+            initial_stalls = len(stalls)
+            start_time = time.monotonic()
+            out_of_time = False
+            pass_idx = 0
+
+            while not out_of_time:
+                windows = Heuristics._adaptive_windows(stalls, le, window_len)
+                if len(windows) == 0:
+                    log.info("No stalls left")
                     break
+                pass_idx += 1
+                log.info(
+                    "Adaptive pass %d: %d windows around %d stalls",
+                    pass_idx,
+                    len(windows),
+                    len(stalls),
+                )
+                body = SourceLine.reduce_source(body)
+                pass_stalls = len(stalls)
+                pass_start = time.monotonic()
+                for start_idx, end_idx in windows:
+                    chunk_conf = None
+                    if conf.out_of_time():
+                        log.warning(
+                            "Global timeout expired -- skipping remaining windows"
+                        )
+                        out_of_time = True
+                        break
+                    if budget is not None:
+                        remaining = budget - (time.monotonic() - start_time)
+                        if remaining <= 0:
+                            log.info("Time budget of %ss exhausted", budget)
+                            out_of_time = True
+                            break
+                        chunk_conf = conf.copy()
+                        timeout = max(1, math.ceil(remaining))
+                        if conf.timeout is not None:
+                            timeout = min(timeout, conf.timeout)
+                        chunk_conf.timeout = timeout
+                    try:
+                        body, stalls, _, local_perm = optimize_chunk(
+                            start_idx, end_idx, body, stalls, chunk_conf=chunk_conf
+                        )
+                    except SlothySelfCheckException:
+                        raise
+                    except SlothyException:
+                        # Windows may only fail for lack of time
+                        exhausted = (
+                            budget is not None
+                            and time.monotonic() - start_time >= budget
+                        )
+                        if not conf.out_of_time() and not exhausted:
+                            raise
+                        log.warning(
+                            "Out of time for window [%d:%d] -- skipping",
+                            start_idx,
+                            end_idx,
+                        )
+                        continue
+                    perm = Permutation.permutation_comp(local_perm, perm)
+
+                gain = pass_stalls - len(stalls)
+                duration = time.monotonic() - pass_start
+                log.info(
+                    "Adaptive pass %d: removed %d stalls in %.1fs (%.2f stalls/s)",
+                    pass_idx,
+                    gain,
+                    duration,
+                    gain / max(duration, 1e-3),
+                )
+                if gain <= 0 and not out_of_time:
+                    if window_len >= max_window_len:
+                        break
+                    window_len = min(2 * window_len, max_window_len)
+                    log.info(
+                        "No gain -- growing windows to %d instructions", window_len
+                    )
+
+            gain = initial_stalls - len(stalls)
+            duration = time.monotonic() - start_time
+            log.info(
+                "Adaptive split heuristic: removed %d stalls in %.1fs (%.2f stalls/s)",
+                gain,
+                duration,
+                gain / max(duration, 1e-3),
+            )
             return body, stalls, perm
 
         cur_body = body
@@ -889,8 +1778,10 @@ class Heuristics:
         stalls = set()
         increment = 1 / split_factor
 
+        adaptive = conf.split_heuristic_adaptive and not conf.split_heuristic_chunks
+
         # First, do a 'dry run' solely for finding the initial 'stall map'
-        if conf.split_heuristic_repeat > 0:
+        if conf.split_heuristic_repeat > 0 or adaptive:
             orig_conf = conf.copy()
             conf.constraints.allow_reordering = False
             conf.constraints.allow_renaming = False
@@ -913,7 +1804,11 @@ class Heuristics:
         outputs = conf.outputs.copy()
         inputs = DFG(orig_body, log.getChild("dfg_infer_inputs"), dfgc).inputs.copy()
 
-        for _ in range(conf.split_heuristic_repeat):
+        if adaptive:
+            cur_body, stalls, local_perm = optimize_adaptive(cur_body, stalls)
+            perm = Permutation.permutation_comp(local_perm, perm)
+
+        for _ in range(0 if adaptive else conf.split_heuristic_repeat):
 
             cur_body = SourceLine.reduce_source(cur_body)
 
@@ -1082,7 +1977,11 @@ class Heuristics:
         c.outputs = c.outputs.union(kernel_deps)
 
         if not conf.sw_pipelining.halving_heuristic_split_only:
-            res_halving_0 = Heuristics.linear(body, logger.getChild("slothy"), conf=c)
+            # Leave half of the global timeout for the second step
+            with c.time_share(0.5):
+                res_halving_0 = Heuristics.linear(
+                    body, logger.getChild("slothy"), conf=c
+                )
 
             # Split resulting kernel as [A;B] and synthesize result structure
             # as if SW pipelining has been used and the result would have been
@@ -0,0 +1,305 @@
+#
+# Copyright (c) 2022 Arm Limited
+# Copyright (c) 2022 Hanno Becker
+# Copyright (c) 2023 Amin Abdulrahman, Matthias Kannwischer
+# SPDX-License-Identifier: MIT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Author: Hanno Becker <hannobecker@posteo.de>
+#
+
+"""Per-phase profiling of the optimization pipeline
+
+While a Profiler is active, every phase of the pipeline -- parsing, data flow
+graph construction, model building, solving, result extraction, selfcheck, and
+the heuristics wrapping them -- is recorded as a node in a tree of phases. Each
+node holds the wall time and CPU time spent in the phase, the peak resident set
+size of the process at the end of the phase, and additional information such as
+the size of the constraint model. The profiler also reports the activity of
+the caches registered via register_cache() while it was active.
+
+When no Profiler is active, profile_phase() does nothing.
+
+Example:
+
+```
+with Profiler() as p:
+    slothy.optimize(start="start", end="end")
+p.write_json("profile.json")
+```
+"""
+
+import functools
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_active = None
+_caches = {}
+
+# Cache statistics which are counters, and reported as deltas by the profiler
+_CACHE_COUNTERS = ("hits", "disk_hits", "misses", "stores", "evictions")
+
+
+def register_cache(name: str, stats: any):
+    """Register a cache whose statistics are to be included in profiles
+
+    :param name: The name under which to report the cache.
+    :type name: str
+    :param stats: Function returning the current statistics of the cache, as a
+        dictionary with counters such as hits, misses, stores and evictions.
+    :type stats: any
+    """
+    _caches[name] = stats
+
+
+def _cache_snapshot():
+    return {name: stats() for name, stats in _caches.items()}
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        rss //= 1024
+    return rss
+
+
+def _new_phase(name, info):
+    return {
+        "name": name,
+        "info": info,
+        "wall_time": 0.0,
+        "cpu_time": 0.0,
+        "peak_rss_kb": None,
+        "children": [],
+    }
+
+
+class Profiler:
+    """Records the phases of the optimization pipeline
+
+    A profiler is active between start() and stop(), or within a `with` block.
+    Profilers can be nested, in which case the innermost one records phases.
+    """
+
+    def __init__(self):
+        self._root = _new_phase("total", {})
+        self._stack = [self._root]
+        self._prev = None
+        self._start = None
+        self._caches_start = None
+        self._caches = {}
+
+    def start(self):
+        """Start recording phases"""
+        global _active
+        self._prev = _active
+        _active = self
+        self._start = (time.perf_counter(), time.process_time())
+        self._caches_start = _cache_snapshot()
+
+    def stop(self):
+        """Stop recording phases"""
+        global _active
+        wall, cpu = self._start
+        self._root["wall_time"] += time.perf_counter() - wall
+        self._root["cpu_time"] += time.process_time() - cpu
+        self._root["peak_rss_kb"] = _peak_rss_kb()
+        self._caches = self.caches()
+        self._caches_start = None
+        _active = self._prev
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @contextmanager
+    def phase(self, name: str, **info: any) -> Iterator[dict]:  # noqa: DOC103
+        """Record a phase nested in the current phase
+
+        :param name: The name of the phase.
+        :type name: str
+        :param ``**info``: Additional information to store with the phase.
+        :type ``**info``: any
+        :yield: The information dictionary of the phase, to which further entries
+            can be added while the phase is running.
+        :ytype: dict
+        """
+        node = _new_phase(name, info)
+        self._stack[-1]["children"].append(node)
+        self._stack.append(node)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield info
+        finally:
+            node["wall_time"] = time.perf_counter() - wall
+            node["cpu_time"] = time.process_time() - cpu
+            node["peak_rss_kb"] = _peak_rss_kb()
+            self._stack.pop()
+
+    def phases(self) -> list:
+        """Returns the phases recorded so far
+
+        :return: List of the top-level phases, each a dictionary with entries
+            name, info, wall_time, cpu_time, peak_rss_kb and children.
+        :rtype: list
+        """
+        return self._root["children"]
+
+    def attach(self, phases: list):
+        """Attach phases recorded by another profiler, e.g. in a worker process,
+        to the current phase.
+
+        :param phases: The phases to attach, as returned by phases().
+        :type phases: list
+        """
+        self._stack[-1]["children"].extend(phases)
+
+    def summary(self) -> dict:
+        """Aggregate the recorded phases by name
+
+        :return: Dictionary mapping phase names to their number of occurrences,
+            total wall time, total CPU time and maximum peak RSS.
+        :rtype: dict
+        """
+        res = {}
+
+        def visit(node):
+            s = res.setdefault(
+                node["name"],
+                {"count": 0, "wall_time": 0.0, "cpu_time": 0.0, "peak_rss_kb": None},
+            )
+            s["count"] += 1
+            s["wall_time"] += node["wall_time"]
+            s["cpu_time"] += node["cpu_time"]
+            if node["peak_rss_kb"] is not None:
+                s["peak_rss_kb"] = max(s["peak_rss_kb"] or 0, node["peak_rss_kb"])
+            for c in node["children"]:
+                visit(c)
+
+        for node in self.phases():
+            visit(node)
+        return res
+
+    def caches(self) -> dict:
+        """Returns the activity of the registered caches while profiling
+
+        :return: Dictionary mapping cache names to their statistics, with
+            counters restricted to the time the profiler was active and the
+            hit rate recomputed accordingly.
+        :rtype: dict
+        """
+        if self._caches_start is None:
+            return self._caches
+        res = {}
+        for name, stats in _cache_snapshot().items():
+            before = self._caches_start.get(name, {})
+            prev = self._caches.get(name, {})
+            s = dict(stats)
+            for k in _CACHE_COUNTERS:
+                if k in s:
+                    s[k] = s[k] - before.get(k, 0) + prev.get(k, 0)
+            hits = s.get("hits", 0) + s.get("disk_hits", 0)
+            total = hits + s.get("misses", 0)
+            s["hit_rate"] = hits / total if total > 0 else 0.0
+            res[name] = s
+        return res
+
+    def report(self) -> dict:
+        """Returns a JSON-serializable report of the recorded phases
+
+        :return: Dictionary with the full tree of phases, their summary, and the
+            activity of the registered caches.
+        :rtype: dict
+        """
+        return {"total": self._root, "summary": self.summary(), "caches": self.caches()}
+
+    def write_json(self, filename: str):
+        """Write the report to a JSON file
+
+        :param filename: The name of the file to write to.
+        :type filename: str
+        """
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=repr)
+
+
+@contextmanager
+def profile_phase(name: str, **info: any) -> Iterator[dict]:  # noqa: DOC103
+    """Record a phase with the active profiler, if any
+
+    :param name: The name of the phase.
+    :type name: str
+    :param ``**info``: Additional information to store with the phase.
+    :type ``**info``: any
+    :yield: The information dictionary of the phase, to which further entries
+        can be added while the phase is running.
+    :ytype: dict
+    """
+    if _active is None:
+        yield info
+    else:
+        with _active.phase(name, **info) as res:
+            yield res
+
+
+def active_profiler() -> any:
+    """Returns the currently active profiler
+
+    :return: The active Profiler, or None if profiling is disabled.
+    :rtype: any
+    """
+    return _active
+
+
+def profiled(name: str) -> any:
+    """Decorator recording every call of a function as a phase
+
+    :param name: The name of the phase.
+    :type name: str
+    :return: The decorator.
+    :rtype: any
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -55,6 +55,7 @@ from slothy.core.dataflow import DataFlowGraph as DFG
 from slothy.core.dataflow import Config as DFGConfig, ComputationNode
 from slothy.core.core import Config
 from slothy.core.heuristics import Heuristics
+from slothy.core.profiler import profiled
 from slothy.helper import (
     AsmAllocation,
     AsmHelper,
@@ -290,40 +291,53 @@ class Slothy:
 
         self.source = pre + body + post
 
-    def _make_llvm_mca_stats(self, pre, code, post, txt, indentation):
+    def _make_llvm_mca_stats(self, pre, regions, post, indentation):
+        """Run LLVM-MCA on several pieces of code at once, given as pairs of code
+        and title, returning the statistics for each piece as comments"""
+        codes = [code for code, _ in regions]
+        if self.config.llvm_mca_issue_width_overwrite is True:
+            issue_width = self.config.target.issue_rate
+        else:
+            issue_width = None
         try:
-            code = CPreprocessor.unfold(
+            codes = CPreprocessor.unfold_batch(
                 pre,
-                code,
+                codes,
                 post,
                 self.config.compiler_binary,
                 include=self.config.compiler_include_paths,
             )
-            if self.config.llvm_mca_issue_width_overwrite is True:
-                issue_width = self.config.target.issue_rate
-            else:
-                issue_width = None
-            stats = LLVM_Mca.run(
+            stats = LLVM_Mca.run_batch(
                 pre,
-                code,
+                codes,
                 self.config.arch.llvm_mca_arch,
                 self.config.target.llvm_mca_target,
                 self.logger,
                 full=self.config.llvm_mca_full,
                 issue_width=issue_width,
             )
-            stats = (
+        except LLVM_Mca_Error:
+            if len(regions) == 1:
+                self.logger.warning("Failed to run LLVM-MCA -- ignoring")
+                return [[]]
+            # Find out which pieces of code LLVM-MCA fails on
+            return [
+                self._make_llvm_mca_stats(pre, [region], post, indentation)[0]
+                for region in regions
+            ]
+
+        res = []
+        for (_, txt), s in zip(regions, stats):
+            s = (
                 ["", f"LLVM MCA STATISTICS ({txt}) BEGIN", ""]
-                + stats
+                + s
                 + ["", f"ORIGINAL LLVM MCA STATISTICS ({txt}) END", ""]
             )
-            stats = [SourceLine("").add_comment(r) for r in stats]
-            stats = SourceLine.apply_indentation(stats, indentation)
-        except LLVM_Mca_Error:
-            self.logger.warning("Failed to run LLVM-MCA -- ignoring")
-            stats = []
-        return stats
+            s = [SourceLine("").add_comment(r) for r in s]
+            res.append(SourceLine.apply_indentation(s, indentation))
+        return res
 
+    @profiled("optimize_region")
     def optimize(
         self,
         start: str = None,
@@ -367,6 +381,7 @@ class Slothy:
         aliases = AsmAllocation.parse_allocs(pre)
         c = self.config.copy()
         c.add_aliases(aliases)
+        c.start_global_timeout()
 
         # Check if the body has a dominant indentation
         indentation = AsmHelper.find_indentation(body)
@@ -389,22 +404,17 @@ class Slothy:
         logger.info("SLOTHY version: %s", self._get_version())
         self.logger.info("Instructions in body: %d", SourceLine.instruction_count(body))
 
-        if self.config.with_llvm_mca_before is True:
-            orig_stats = self._make_llvm_mca_stats(
-                pre, body, post, "ORIGINAL", indentation
-            )
-
         early, core, late, num_exceptional = Heuristics.periodic(body, logger, c)
 
+        # Analyze original and optimized code with a single run of LLVM-MCA
+        regions = []
         if self.config.with_llvm_mca_before is True:
-            core = core + orig_stats
-
+            regions.append((body, "ORIGINAL"))
         if self.config.with_llvm_mca_after is True:
-            new_stats_kernel = self._make_llvm_mca_stats(
-                pre, core, post, "OPTIMIZED", indentation
-            )
-
-            core = core + new_stats_kernel
+            regions.append((core, "OPTIMIZED"))
+        if len(regions) > 0:
+            stats = self._make_llvm_mca_stats(pre, regions, post, indentation)
+            core = core + sum(stats, [])
 
         def indented(code):
             return [SourceLine(line).set_indentation(indentation) for line in code]
@@ -510,6 +520,7 @@ class Slothy:
 
         return body
 
+    @profiled("fusion_region")
     def fusion_region(self, start: str, end: str, **kwargs: any):  # noqa: DOC103
         """Run fusion callbacks on straightline code replacing certain
         instruction (sequences) with an alternative. These replacements are
@@ -536,6 +547,7 @@ class Slothy:
         self.source = pre + body_ssa + post
         assert SourceLine.is_source(self.source)
 
+    @profiled("fusion_loop")
     def fusion_loop(  # noqa: DOC103
         self, loop_lbl: str, forced_loop_type: any = None, **kwargs: any
     ):
@@ -574,6 +586,7 @@ class Slothy:
         self.source = pre + body_ssa + post
         assert SourceLine.is_source(self.source)
 
+    @profiled("optimize_loop")
     def optimize_loop(
         self, loop_lbl: str, postamble_label: str = None, forced_loop_type: any = None
     ):
@@ -604,6 +617,7 @@ class Slothy:
         aliases = AsmAllocation.parse_allocs(early)
         c = self.config.copy()
         c.add_aliases(aliases)
+        c.start_global_timeout()
 
         if c.with_preprocessor:
             self.logger.info("Apply C preprocessor...")
@@ -627,15 +641,18 @@ class Slothy:
             SourceLine.instruction_count(body),
         )
 
-        if self.config.with_llvm_mca_before is True:
-            orig_stats = self._make_llvm_mca_stats(
-                early, body, late, "ORIGINAL", indentation
+        # Leave half of the global timeout for the exceptional iterations, if needed
+        share = 1
+        if (
+            self.config.sw_pipelining.unknown_iteration_count
+            and not self.config.sw_pipelining.halving_heuristic
+        ):
+            share = 0.5
+        with c.time_share(share):
+            preamble_code, kernel_code, postamble_code, num_exceptional = (
+                Heuristics.periodic(body, logger, c)
             )
 
-        preamble_code, kernel_code, postamble_code, num_exceptional = (
-            Heuristics.periodic(body, logger, c)
-        )
-
         # Remove branch instructions from preamble and postamble
         postamble_code = [
             line for line in postamble_code if not line.tags.get("branch")
@@ -644,32 +661,35 @@ class Slothy:
             line for line in postamble_code if not line.tags.get("branch")
         ]
 
+        # Analyze all pieces of code with a single run of LLVM-MCA
+        regions = {}
         if self.config.with_llvm_mca_before is True:
-            kernel_code = kernel_code + orig_stats
-
+            regions["orig"] = (body, "ORIGINAL")
         if self.config.with_llvm_mca_after is True:
-            new_stats_kernel = self._make_llvm_mca_stats(
-                early, kernel_code, late, "OPTIMIZED", indentation
-            )
-            kernel_code = kernel_code + new_stats_kernel
-
+            regions["kernel"] = (kernel_code, "OPTIMIZED")
             if (
                 self.config.sw_pipelining.optimize_preamble is True
                 and len(preamble_code) > 0
             ):
-                new_stats_preamble = self._make_llvm_mca_stats(
-                    early, preamble_code, late, "PREAMBLE", indentation
-                )
-                preamble_code = preamble_code + new_stats_preamble
-
+                regions["preamble"] = (preamble_code, "PREAMBLE")
             if (
                 self.config.sw_pipelining.optimize_postamble is True
                 and len(postamble_code) > 0
             ):
-                new_stats_postamble = self._make_llvm_mca_stats(
-                    early, postamble_code, late, "POSTAMBLE", indentation
+                regions["postamble"] = (postamble_code, "POSTAMBLE")
+        if len(regions) > 0:
+            stats = dict(
+                zip(
+                    regions,
+                    self._make_llvm_mca_stats(
+                        early, list(regions.values()), late, indentation
+                    ),
                 )
-                postamble_code = postamble_code + new_stats_postamble
+            )
+            kernel_code = kernel_code + stats.get("orig", [])
+            kernel_code = kernel_code + stats.get("kernel", [])
+            preamble_code = preamble_code + stats.get("preamble", [])
+            postamble_code = postamble_code + stats.get("postamble", [])
 
         def indented(code):
             if not SourceLine.is_source(code):
@@ -703,7 +723,7 @@ class Slothy:
                 loop_cnt,
                 indentation=self.config.indentation,
                 fixup=num_exceptional,
-                unroll=self.config.sw_pipelining.unroll,
+                unroll=c.sw_pipelining.unroll,
                 jump_if_empty=jump_if_empty,
                 preamble_code=preamble_code,
                 body_code=kernel_code,
@@ -723,15 +743,18 @@ class Slothy:
 
         if self.config.sw_pipelining.unknown_iteration_count:
             optimized_code += indented(self.arch.Branch.unconditional(loop_lbl_end))
+            # The exceptional iterations are optimized independently
+            passes = []
             for i in range(1, num_exceptional):
-                exceptional = i * body
                 c2 = c.copy()
                 c2.sw_pipelining.enabled = False
-                res = Heuristics.linear(
-                    exceptional, logger.getChild(f"exceptional_{i}"), c2
-                )
+                passes.append((i * body, logger.getChild(f"exceptional_{i}"), c2))
+            codes = Heuristics.linear_many(
+                passes, logger, self.config.sw_pipelining.parallel_passes
+            )
+            for i, code in enumerate(codes, start=1):
                 optimized_code += [SourceLine(f"{loop_lbl_iter(i)}:")]
-                optimized_code += indented(res.code)
+                optimized_code += indented(code)
                 optimized_code += [SourceLine(f"{loop_lbl_iter(i)}_end:")]
                 if i != num_exceptional - 1:
                     optimized_code += indented(
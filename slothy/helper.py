@@ -27,10 +27,17 @@
 
 import re
 import subprocess
-import os
+import random
+import importlib
+import hashlib
+import json
 import platform
 import logging
 import inspect
+import os
+import multiprocessing
+import multiprocessing.connection
+from collections import OrderedDict
 from abc import ABC, abstractmethod
 from sympy import simplify
 from slothy.targets.exceptions import FatalParsingException, UnknownInstruction
@@ -45,6 +52,10 @@ _NEWLINE_MARKER = "__SLOTHY_NL__"
 class SourceLine:
     """Representation of a single line of source code"""
 
+    # Source lines are created and copied in large numbers, so keep them compact:
+    # Tags and comments are only allocated once they are non-empty or accessed.
+    __slots__ = ("_raw", "_tags", "_indentation", "_fixlength", "_comments")
+
     def _extract_comments_from_text(self):
         if "//" not in self._raw:
             return
@@ -55,7 +66,7 @@ class SourceLine:
             s = self._raw.split("//")
         self._raw = s[0]
         # Preserve whitespace for block comments (with markers), lstrip others
-        self._comments += [c if _NEWLINE_MARKER in c else c.lstrip() for c in s[1:]]
+        self.comments.extend(c if _NEWLINE_MARKER in c else c.lstrip() for c in s[1:])
         self._trim_comments()
 
     def _extract_indentation_from_text(self):
@@ -101,16 +112,22 @@ class SourceLine:
         return s
 
     def _strip_comments(self):
+        if not self._comments:
+            return
         # Preserve whitespace for block comments (with markers), lstrip others
         self._comments = [
             c if _NEWLINE_MARKER in c else c.lstrip() for c in self._comments
         ]
 
     def _trim_comments(self):
+        if not self._comments:
+            return
         self._strip_comments()
-        self._comments = list(filter(lambda s: s != "", self._comments))
+        self._comments = list(filter(lambda s: s != "", self._comments)) or None
 
     def _extract_tags_from_comments(self):
+        if not self._comments:
+            return
         tags = {}
         self._comments = list(
             map(lambda c: SourceLine._parse_tags_in_string(c, tags), self._comments)
@@ -138,7 +155,7 @@ class SourceLine:
 
     def add_comment(self, comment):
         """Add a comment to the metadata of a source line"""
-        self._comments.append(comment)
+        self.comments.append(comment)
         return self
 
     def add_comments(self, comments):
@@ -165,17 +182,17 @@ class SourceLine:
         assert isinstance(s, str)
 
         self._raw = s
-        self._tags = {}
+        self._tags = None
         self._indentation = 0
         self._fixlength = None
-        self._comments = []
+        self._comments = None
 
         if reduce is True:
             self.reduce()
 
     def set_tag(self, tag, value=True):
         """Set source line tag"""
-        self._tags[tag] = value
+        self.tags[tag] = value
         return self
 
     def set_length(self, length):
@@ -194,6 +211,8 @@ class SourceLine:
 
         Tags are source annotations of the form @slothy:(tag[=value]?).
         """
+        if self._tags is None:
+            self._tags = {}
         return self._tags
 
     @tags.setter
@@ -203,6 +222,8 @@ class SourceLine:
     @property
     def comments(self):
         """Return the list of comments for the source line"""
+        if self._comments is None:
+            self._comments = []
         return self._comments
 
     @comments.setter
@@ -240,10 +261,11 @@ class SourceLine:
 
         indentation = " " * self._indentation if indentation is True else ""
 
-        double_comments = filter(lambda t: not t.startswith("/"), self._comments)
+        line_comments = self._comments or ()
+        double_comments = filter(lambda t: not t.startswith("/"), line_comments)
         triple_comments = map(
             lambda s: (" " + s[1:].strip()).rstrip(),
-            filter(lambda t: t.startswith("/"), self._comments),
+            filter(lambda t: t.startswith("/"), line_comments),
         )
 
         additional = []
@@ -265,7 +287,7 @@ class SourceLine:
             additional += list(map(format_comment, double_comments))
             additional += list(map(lambda s: f"///{s}", triple_comments))
 
-        if tags is True:
+        if tags is True and self._tags:
 
             def print_tag_value(tv):
                 t, v = tv
@@ -363,9 +385,9 @@ class SourceLine:
         """Create a copy of a source line"""
         return (
             SourceLine(self._raw)
-            .add_tags(self._tags.copy())
+            .add_tags(self._tags or {})
             .set_indentation(self._indentation)
-            .add_comments(self._comments.copy())
+            .add_comments(self._comments or ())
             .set_length(self._fixlength)
         )
 
@@ -407,8 +429,8 @@ class SourceLine:
         for line in s:
             if cur is not None:
                 cur.add_text(line.text)
-                cur.add_tags(line.tags)
-                cur.add_comments(line.comments)
+                cur.add_tags(line._tags or {})
+                cur.add_comments(line._comments or ())
             else:
                 cur = line.copy()
             if cur.is_escaped:
@@ -446,7 +468,9 @@ class SourceLine:
         """Add one or more tags to the metadata of the source line
 
         tags must be a tag:value dictionary."""
-        self._tags = {**self._tags, **tags}
+        if not tags:
+            return self
+        self._tags = {**(self._tags or {}), **tags}
         return self
 
     def add_tag(self, tag, value):
@@ -460,13 +484,13 @@ class SourceLine:
 
         In case of overlapping tags, source line l takes precedence."""
         assert SourceLine.is_source_line(line)
-        self.add_tags(line.tags)
+        self.add_tags(line._tags or {})
         return self
 
     def inherit_comments(self, line):
         """Inherits the comments from another source line"""
         assert SourceLine.is_source_line(line)
-        self.add_comments(line.comments)
+        self.add_comments(line._comments or ())
         return self
 
     @staticmethod
@@ -483,7 +507,7 @@ class SourceLine:
         """Drop all tags from a source"""
         assert SourceLine.is_source(source)
         for line in source:
-            line.tags = {}
+            line.tags = None
         return source
 
     @staticmethod
@@ -838,15 +862,25 @@ class BinarySearchLimitException(Exception):
 
 
 def binary_search(
-    func, threshold=256, minimum=-1, start=0, precision=1, timeout_below_precision=None
+    func,
+    threshold=256,
+    minimum=-1,
+    start=0,
+    precision=1,
+    timeout_below_precision=None,
+    abort=None,
 ):
-    """Conduct a binary search"""
+    """Conduct a binary search
+
+    If provided, `abort()` is consulted before every evaluation of `func`. Once it
+    returns True, the search stops and returns the smallest value found to succeed
+    so far, or raises BinarySearchLimitException if there is none."""
     start = max(start, minimum)
     last_failure = minimum
     val = start
     # Find _some_ version that works
     while True:
-        if val > threshold:
+        if val > threshold or (abort is not None and abort()):
             raise BinarySearchLimitException
 
         def double_val(val):
@@ -863,6 +897,8 @@ def binary_search(
         val = double_val(val)
     # Find _first_ version that works
     while last_success - last_failure > 1:
+        if abort is not None and abort():
+            break
         timeout = None
         if last_success - last_failure <= precision:
             if timeout_below_precision is None:
@@ -878,6 +914,149 @@ def binary_search(
     return last_success, last_success_core
 
 
+def multiprocessing_context():
+    """Returns the multiprocessing context to use for worker processes
+
+    We avoid fork() because the calling process may be multi-threaded, e.g.
+    after running the constraint solver."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _binary_search_parallel_worker(func, val, timeout, conn):
+    try:
+        res = ("ok", func(val, timeout=timeout))
+    except Exception as e:
+        res = ("exc", e)
+    conn.send(res)
+    conn.close()
+
+
+def binary_search_parallel(
+    func,
+    probes,
+    threshold=256,
+    minimum=-1,
+    start=0,
+    precision=1,
+    timeout_below_precision=None,
+    on_result=None,
+    abort=None,
+):
+    """Conduct a binary search, evaluating multiple candidates concurrently
+
+    This is a variant of binary_search() which, in every round, evaluates up to
+    `probes` candidate values in separate worker processes. While no successful
+    value is known, the candidates are the next values of the doubling sequence
+    used by binary_search(). Afterwards, the candidates split the interval between
+    the largest known failure and the smallest known success evenly. Probes that
+    become irrelevant because a smaller value succeeded or a larger value failed
+    are terminated right away.
+
+    `func` must be picklable. It is called in a worker process as
+    `func(val, timeout=timeout)` and must return a pair `(success, info)` of
+    picklable values. If provided, `on_result(val, success, info)` is called in the
+    calling process for every probe that ran to completion.
+
+    Returns the smallest value found to succeed. Like binary_search(), this assumes
+    that success is monotone in the value, and stops early once `abort()` returns
+    True, if provided."""
+
+    def double_val(val):
+        if val == 0:
+            return 1
+        return 2 * val
+
+    ctx = multiprocessing_context()
+
+    start = max(start, minimum)
+    last_failure = minimum
+    last_success = None
+    val = start
+    while True:
+        if abort is not None and abort():
+            if last_success is None:
+                raise BinarySearchLimitException
+            break
+        timeout = None
+        if last_success is None:
+            # Find _some_ version that works
+            candidates = []
+            while len(candidates) < probes and val <= threshold:
+                candidates.append(val)
+                val = double_val(val)
+            if len(candidates) == 0:
+                raise BinarySearchLimitException
+        else:
+            # Find _first_ version that works
+            gap = last_success - last_failure
+            if gap <= 1:
+                break
+            if gap <= precision:
+                if timeout_below_precision is None:
+                    break
+                timeout = timeout_below_precision
+            n = min(probes, gap - 1)
+            candidates = sorted(
+                {last_failure + (gap * (i + 1)) // (n + 1) for i in range(n)}
+            )
+
+        running = {}
+        try:
+            for c in candidates:
+                conn_recv, conn_send = ctx.Pipe(duplex=False)
+                p = ctx.Process(
+                    target=_binary_search_parallel_worker,
+                    args=(func, c, timeout, conn_send),
+                    daemon=True,
+                )
+                p.start()
+                conn_send.close()
+                running[conn_recv] = (c, p)
+
+            while len(running) > 0:
+                for conn in multiprocessing.connection.wait(list(running.keys())):
+                    c, p = running.pop(conn)
+                    try:
+                        status, res = conn.recv()
+                    except EOFError as exc:
+                        raise ChildProcessError(
+                            f"Worker process for value {c} terminated unexpectedly"
+                        ) from exc
+                    finally:
+                        conn.close()
+                        p.join()
+                    if status == "exc":
+                        raise res
+
+                    success, info = res
+                    if on_result is not None:
+                        on_result(c, success, info)
+                    if success:
+                        if last_success is None or c < last_success:
+                            last_success = c
+                    else:
+                        last_failure = max(last_failure, c)
+
+                    # Terminate probes whose outcome no longer matters
+                    for conn2, (c2, p2) in list(running.items()):
+                        if c2 <= last_failure or (
+                            last_success is not None and c2 >= last_success
+                        ):
+                            del running[conn2]
+                            p2.terminate()
+                            p2.join()
+                            conn2.close()
+        finally:
+            for conn, (_, p) in running.items():
+                p.terminate()
+                p.join()
+                conn.close()
+
+    return last_success
+
+
 class AsmMacro:
     """Helper class for parsing and applying assembly macros"""
 
@@ -1354,24 +1533,31 @@ class CPreprocessor:
     @staticmethod
     def unfold(header, body, post, gcc, include=None):
         """Runs the concatenation of header and body through the preprocessor"""
+        return CPreprocessor.unfold_batch(header, [body], post, gcc, include)[0]
+
+    @staticmethod
+    def unfold_batch(header, bodies, post, gcc, include=None):
+        """Runs the concatenation of header and several bodies through a single
+        invocation of the preprocessor, returning the unfolded bodies
+
+        The bodies form a single translation unit, so definitions made in one
+        body are visible in the bodies following it."""
 
-        assert SourceLine.is_source(body)
+        assert all(SourceLine.is_source(body) for body in bodies)
         assert SourceLine.is_source(header)
         assert SourceLine.is_source(post)
 
-        body_txt = SourceLine.write_multiline(body)
         header_txt = SourceLine.write_multiline(header)
         footer_txt = SourceLine.write_multiline(post)
 
-        code_txt = "\n".join(
-            [
-                header_txt,
-                CPreprocessor.magic_string_start,
-                body_txt,
-                CPreprocessor.magic_string_end,
-                footer_txt,
+        code_txt = [header_txt]
+        for i, body in enumerate(bodies):
+            code_txt += [
+                f"{CPreprocessor.magic_string_start}_{i}",
+                SourceLine.write_multiline(body),
+                f"{CPreprocessor.magic_string_end}_{i}",
             ]
-        )
+        code_txt = "\n".join(code_txt + [footer_txt])
 
         if include is None:
             include = []
@@ -1388,20 +1574,312 @@ class CPreprocessor:
         )
 
         unfolded_code = r.stdout.split("\n")
-        magic_idx_start = unfolded_code.index(CPreprocessor.magic_string_start)
-        magic_idx_end = unfolded_code.index(CPreprocessor.magic_string_end)
-        unfolded_code = unfolded_code[magic_idx_start + 1 : magic_idx_end]
-
-        return [SourceLine(r) for r in unfolded_code]
+        res = []
+        for i in range(len(bodies)):
+            magic_idx_start = unfolded_code.index(
+                f"{CPreprocessor.magic_string_start}_{i}"
+            )
+            magic_idx_end = unfolded_code.index(f"{CPreprocessor.magic_string_end}_{i}")
+            res.append(
+                [
+                    SourceLine(r)
+                    for r in unfolded_code[magic_idx_start + 1 : magic_idx_end]
+                ]
+            )
+        return res
 
 
 class LLVM_Mc_Error(Exception):
     """Exception thrown if llvm-mc subprocess fails"""
 
 
+# Definition of a (non-numeric) label at the beginning of a line
+_ASM_LABEL_DEFINITION = re.compile(r"^\s*([A-Za-z_.$][\w.$]*)\s*:", re.MULTILINE)
+
+# Directives emitting the code following them into another section
+_ASM_SECTION_SWITCH = re.compile(
+    r"^\s*\.(text|data|bss|rodata|section|pushsection|popsection|previous|"
+    r"subsection)\b",
+    re.MULTILINE,
+)
+
+
+def _batch_name(name, i):
+    return f"{name}_slothy_batch{i}"
+
+
+def _rename_labels(code, i):
+    """Rename the labels defined in the i-th piece of code of a batch, so that
+    pieces defining the same labels can be concatenated"""
+    for label in set(_ASM_LABEL_DEFINITION.findall(code)):
+        pattern = rf"(?<![\w.$]){re.escape(label)}(?![\w.$])"
+        code = re.sub(pattern, _batch_name(label, i), code)
+    return code
+
+
+class DiskCache:
+    """Directory of JSON entries with least-recently-used eviction
+
+    Every entry is stored in a file of its own, named after its key. Entries are
+    written atomically, so that processes can share the directory, and reading
+    an entry marks it as recently used. When the total size of the directory
+    exceeds the limit, the least recently used entries are removed.
+
+    :param cache_dir: The directory holding the entries.
+    :type cache_dir: str
+    :param max_size: The maximum total size of the entries in bytes, or None
+        for an unbounded directory.
+    :type max_size: int
+    :param logger: The logger to report corrupted entries to, if any.
+    :type logger: any
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = None, logger: any = None):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._logger = logger
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, f"{key}.json")
+
+    def read(self, key: str) -> any:
+        """Read an entry and mark it as recently used
+
+        :param key: The key of the entry.
+        :type key: str
+        :return: The entry, or None if there is no readable entry for the key.
+        :rtype: any
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            if self._logger is not None:
+                self._logger.warning("Ignoring corrupted cache entry %s", path)
+            return None
+
+        # Remember recent use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def write(self, key: str, entry: any) -> int:
+        """Write an entry and evict old entries if the directory exceeds its size
+
+        :param key: The key of the entry.
+        :type key: str
+        :param entry: The JSON-serializable entry.
+        :type entry: any
+        :return: The number of entries evicted.
+        :rtype: int
+        """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        # Atomic, so that concurrent readers never observe partial entries
+        os.replace(tmp, path)
+        return self._evict()
+
+    def _evict(self):
+        if self._max_size is None:
+            return 0
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self._cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(sz for _, sz, _ in entries)
+        entries.sort()
+        evicted = 0
+        for _, sz, name in entries:
+            if total <= self._max_size:
+                break
+            try:
+                os.remove(os.path.join(self._cache_dir, name))
+            except OSError:
+                continue
+            total -= sz
+            evicted += 1
+            if self._logger is not None:
+                self._logger.debug("Evicted cache entry %s", name)
+        return evicted
+
+
+class AssemblyCache:
+    """Cache mapping the inputs of LLVM_Mc.assemble() to the assembled code.
+
+    Entries are keyed on a hash of the source text and of all options affecting
+    the assembly. They are held in memory, and optionally persisted in a
+    directory so that they can be shared between processes and runs. Note that
+    the contents of files included by the C preprocessor are not part of the
+    key.
+
+    :param max_size: Maximum number of entries held in memory. When exceeded,
+        the least recently used entry is evicted.
+    :type max_size: int
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(
+        source: str,
+        arch: str,
+        attr: str,
+        symbol: str,
+        preprocessor: str,
+        include_paths: list,
+    ) -> str:
+        """Computes the cache key for an invocation of LLVM_Mc.assemble()
+
+        :param source: The source text to be assembled.
+        :type source: str
+        :param arch: The architecture passed to llvm-mc.
+        :type arch: str
+        :param attr: The attributes passed to llvm-mc.
+        :type attr: str
+        :param symbol: The symbol whose offset is returned.
+        :type symbol: str
+        :param preprocessor: The C preprocessor binary, if any.
+        :type preprocessor: str
+        :param include_paths: The include paths for the C preprocessor.
+        :type include_paths: list
+        :return: Hex digest identifying the assembly.
+        :rtype: str
+        """
+        data = [
+            source,
+            arch,
+            attr,
+            symbol,
+            preprocessor,
+            include_paths,
+            platform.system(),
+        ]
+        txt = json.dumps(data, default=str)
+        return hashlib.sha256(txt.encode()).hexdigest()
+
+    def lookup(self, key: str, cache_dir: str = None) -> tuple:
+        """Look up assembled code
+
+        :param key: The cache key, as computed by AssemblyCache.key().
+        :type key: str
+        :param cache_dir: If set, the directory to look into if the entry is
+            not held in memory.
+        :type cache_dir: str
+        :return: Pair of the code bytes and the offset of the symbol, or None
+            if there is no entry for the key.
+        :rtype: tuple
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        if cache_dir is not None:
+            data = DiskCache(cache_dir).read(key)
+            try:
+                entry = (bytes.fromhex(data["code"]), data["offset"])
+            except (ValueError, KeyError, TypeError):
+                entry = None
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+                return entry
+        self.misses += 1
+        return None
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def store(
+        self,
+        key: str,
+        code: bytes,
+        offset: int,
+        cache_dir: str = None,
+        max_disk_size: int = None,
+    ):
+        """Store assembled code
+
+        :param key: The cache key, as computed by AssemblyCache.key().
+        :type key: str
+        :param code: The assembled code.
+        :type code: bytes
+        :param offset: The offset of the symbol in the code.
+        :type offset: int
+        :param cache_dir: If set, the directory to persist the entry in.
+        :type cache_dir: str
+        :param max_disk_size: The maximum total size in bytes of the entries in
+            cache_dir. If exceeded, the least recently used entries are removed.
+            If None, the directory is unbounded.
+        :type max_disk_size: int
+        """
+        self._remember(key, (code, offset))
+        self.stores += 1
+        if cache_dir is not None:
+            entry = {"code": code.hex(), "offset": offset}
+            DiskCache(cache_dir, max_disk_size).write(key, entry)
+
+    def clear(self):
+        """Drop all entries held in memory and reset the statistics"""
+        self._entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss statistics of the cache
+
+        :return: Dictionary with counts of hits in memory and on disk, misses,
+            stores and evictions, the current number of entries in memory, and
+            the hit rate.
+        :rtype: dict
+        """
+        hits = self.hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": hits / total if total > 0 else 0.0,
+        }
+
+
 class LLVM_Mc:
     """Helper class for the application of the LLVM MC tool"""
 
+    # Assembled code, shared by all invocations of assemble() in this process
+    cache = AssemblyCache()
+
     @staticmethod
     def llvm_mc_output_extract_text_section(objfile):
         """Extracts offset and size of .text section from an objectfile
@@ -1521,18 +1999,115 @@ class LLVM_Mc:
 
     @staticmethod
     def assemble(
-        source, arch, attr, log, symbol=None, preprocessor=None, include_paths=None
+        source,
+        arch,
+        attr,
+        log,
+        symbol=None,
+        preprocessor=None,
+        include_paths=None,
+        cache_dir=None,
+        cache_max_size=None,
     ):
-        """Runs LLVM-MC tool to assemble `source`, returning byte code"""
+        """Runs LLVM-MC tool to assemble `source`, returning byte code
+
+        Results are cached in LLVM_Mc.cache and, if `cache_dir` is set, in that
+        directory, bounded to `cache_max_size` bytes."""
+        return LLVM_Mc.assemble_batch(
+            [source],
+            arch,
+            attr,
+            log,
+            symbol=symbol,
+            preprocessor=preprocessor,
+            include_paths=include_paths,
+            cache_dir=cache_dir,
+            cache_max_size=cache_max_size,
+        )[0]
 
-        thumb = "thumb" in arch or (attr is not None and "thumb" in attr)
+    @staticmethod
+    def assemble_batch(
+        sources,
+        arch,
+        attr,
+        log,
+        symbol=None,
+        preprocessor=None,
+        include_paths=None,
+        cache_dir=None,
+        cache_max_size=None,
+    ):
+        """Assembles several independent pieces of code, returning the byte code
+        and symbol offset for each of them, as LLVM_Mc.assemble() would.
+
+        Pieces of code not found in the cache are preprocessed and assembled with
+        a single invocation of the C preprocessor, of LLVM-MC and of llvm-readobj,
+        each piece in a section of its own and with its labels renamed apart.
+        Should this fail, e.g. for clashing symbols which are not labels, or on
+        Darwin, the pieces are assembled one by one instead. The same holds for
+        pieces which switch sections themselves, and for a single piece."""
+
+        keys = [
+            AssemblyCache.key(
+                SourceLine.write_multiline(source),
+                arch,
+                attr,
+                symbol,
+                preprocessor,
+                include_paths,
+            )
+            for source in sources
+        ]
+        res = {}
+        todo = {}
+        for key, source in zip(keys, sources):
+            if key in res or key in todo:
+                continue
+            entry = LLVM_Mc.cache.lookup(key, cache_dir=cache_dir)
+            if entry is not None:
+                res[key] = entry
+            else:
+                todo[key] = source
+
+        # Pieces switching sections themselves cannot be put in a section of
+        # their own, and are assembled one by one
+        batch = {
+            key: source
+            for key, source in todo.items()
+            if not _ASM_SECTION_SWITCH.search(SourceLine.write_multiline(source))
+        }
+        assembled = {}
+        # Object files on Darwin have a single text section
+        if len(batch) > 1 and platform.system() != "Darwin":
+            try:
+                codes = LLVM_Mc._assemble_batch(
+                    list(batch.values()),
+                    arch,
+                    attr,
+                    symbol,
+                    preprocessor,
+                    include_paths,
+                )
+                assembled = dict(zip(batch, codes))
+            except LLVM_Mc_Error:
+                log.debug("Batched assembly failed -- assembling one by one")
+        for key, source in todo.items():
+            if key not in assembled:
+                assembled[key] = LLVM_Mc._assemble(
+                    source, arch, attr, log, symbol, preprocessor, include_paths
+                )
 
-        # Unfortunately, there is no option to directly extract byte code
-        # from LLVM-MC: One either gets a textual description, or an object file.
-        # To not introduce another binary dependency, we just extract the byte
-        # code directly from the textual output, which for every assembly line
-        # has a "encoding: [byte0, byte1, ...]" comment at the end.
+        for key, (code, offset) in assembled.items():
+            LLVM_Mc.cache.store(
+                key, code, offset, cache_dir=cache_dir, max_disk_size=cache_max_size
+            )
+            res[key] = (code, offset)
+        return [res[key] for key in keys]
 
+    @staticmethod
+    def _harness(source, arch, attr, symbol):
+        """Wraps `source` into a function unless a symbol to run is given"""
+        thumb = "thumb" in arch or (attr is not None and "thumb" in attr)
         if symbol is None:
             if thumb is True:
                 source = [SourceLine(".thumb")] + source
@@ -1542,6 +2117,103 @@ class LLVM_Mc:
                 SourceLine("harness:"),
             ] + source
             symbol = "harness"
+        return source, symbol, thumb
+
+    @staticmethod
+    def _readobj_entries(txt, block):
+        """Returns the entries of a block such as "Sections" or "Symbols" in the
+        output of llvm-readobj, as dictionaries of their fields"""
+        entries = None
+        for line in txt.split("\n"):
+            if line == f"{block} [":
+                entries = []
+            elif entries is None:
+                continue
+            elif line == "]":
+                break
+            elif line.startswith("  ") and not line.startswith("   "):
+                if line.strip().endswith("{"):
+                    entries.append({})
+            elif ": " in line and len(entries) > 0:
+                k, v = line.strip().split(": ", 1)
+                entries[-1].setdefault(k, v.split(" ")[0].strip())
+        return entries or []
+
+    @staticmethod
+    def _assemble_batch(sources, arch, attr, symbol, preprocessor, include_paths):
+        """Assembles several pieces of code with a single invocation of LLVM-MC
+
+        Raises LLVM_Mc_Error on failure, without logging it."""
+        wrapped = [LLVM_Mc._harness(s, arch, attr, symbol) for s in sources]
+        sources = [source for source, _, _ in wrapped]
+        symbol = wrapped[0][1]
+
+        try:
+            if preprocessor is not None:
+                sources = CPreprocessor.unfold_batch(
+                    [], sources, [], preprocessor, include=include_paths
+                )
+            code = []
+            for i, source in enumerate(sources):
+                source = SourceLine.write_multiline(source)
+                # Section switches may also stem from the preprocessor
+                if _ASM_SECTION_SWITCH.search(source):
+                    raise LLVM_Mc_Error(f"Piece {i} of batch switches sections")
+                code.append(f'.section {_batch_name(".text", i)},"ax"')
+                code.append(_rename_labels(source, i))
+            code = "\n".join(code) + "\n"
+
+            args = [f"--arch={arch}", "--assemble", "--filetype=obj"]
+            if attr is not None:
+                args.append(f"--mattr={attr}")
+            r = subprocess.run(
+                ["llvm-mc"] + args, input=code.encode(), capture_output=True, check=True
+            )
+            objfile = r.stdout
+            r = subprocess.run(
+                ["llvm-readobj", "-S", "-s", "-"],
+                input=objfile,
+                capture_output=True,
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            raise LLVM_Mc_Error from exc
+
+        txt = r.stdout.decode()
+        sections = {
+            e.get("Name"): (int(e["Offset"], 0), int(e["Size"], 0))
+            for e in LLVM_Mc._readobj_entries(txt, "Sections")
+        }
+        symbols = {
+            e.get("Name"): (e.get("Section"), int(e["Value"], 0))
+            for e in LLVM_Mc._readobj_entries(txt, "Symbols")
+        }
+
+        res = []
+        for i in range(len(sources)):
+            section = _batch_name(".text", i)
+            try:
+                offset, sz = sections[section]
+                symbol_section, symbol_offset = symbols[_batch_name(symbol, i)]
+            except KeyError as exc:
+                raise LLVM_Mc_Error(
+                    f"Could not find piece {i} of batch in object file"
+                ) from exc
+            if sz == 0 or symbol_section != section:
+                raise LLVM_Mc_Error(f"Piece {i} of batch not in its own section")
+            res.append((objfile[offset : offset + sz], symbol_offset))
+        return res
+
+    @staticmethod
+    def _assemble(source, arch, attr, log, symbol, preprocessor, include_paths):
+        """Assembles `source` with LLVM-MC, bypassing the cache"""
+        # Unfortunately, there is no option to directly extract byte code
+        # from LLVM-MC: One either gets a textual description, or an object file.
+        # To not introduce another binary dependency, we just extract the byte
+        # code directly from the textual output, which for every assembly line
+        # has a "encoding: [byte0, byte1, ...]" comment at the end.
+
+        source, symbol, thumb = LLVM_Mc._harness(source, arch, attr, symbol)
 
         if preprocessor is not None:
             # First, run the C preprocessor on the code
@@ -1596,6 +2268,12 @@ class LLVM_Mca_Error(Exception):
     """Exception thrown if llvm-mca subprocess fails"""
 
 
+# Markers of code regions. LLVM-MCA does not recognize them in comments
+# starting with `//` on all architectures, but does so for `#`.
+_LLVM_MCA_BEGIN = "# LLVM-MCA-BEGIN"
+_LLVM_MCA_END = "# LLVM-MCA-END"
+
+
 class LLVM_Mca:
     """Helper class for the application of the LLVM MCA tool"""
 
@@ -1603,13 +2281,21 @@ class LLVM_Mca:
     def run(header, body, arch, cpu, log, full=False, issue_width=None):
         """Runs LLVM-MCA tool on body and returns result as array of strings"""
 
-        LLVM_MCA_BEGIN = SourceLine("").add_comment("LLVM-MCA-BEGIN")
-        LLVM_MCA_END = SourceLine("").add_comment("LLVM-MCA-END")
-        mca_binary = "llvm-mca"
-
-        data = SourceLine.write_multiline(
-            header + [LLVM_MCA_BEGIN] + body + [LLVM_MCA_END]
+        data = "\n".join(
+            [
+                SourceLine.write_multiline(header),
+                _LLVM_MCA_BEGIN,
+                SourceLine.write_multiline(body),
+                _LLVM_MCA_END,
+                "",
+            ]
         )
+        return LLVM_Mca._run_regions(data, arch, cpu, full, issue_width)
+
+    @staticmethod
+    def _run_regions(data, arch, cpu, full, issue_width):
+        """Runs LLVM-MCA tool on code delimited into code regions"""
+        mca_binary = "llvm-mca"
 
         try:
             if full is False:
@@ -1643,12 +2329,369 @@ class LLVM_Mca:
         res = r.stdout.split("\n")
         return res
 
+    @staticmethod
+    def run_batch(header, bodies, arch, cpu, log, full=False, issue_width=None):
+        """Runs LLVM-MCA tool on several bodies and returns the result for each
+        of them, as LLVM_Mca.run() would, with a single invocation of LLVM-MCA
+
+        Each body becomes a code region of its own, with its labels renamed
+        apart."""
+
+        if len(bodies) == 1:
+            return [LLVM_Mca.run(header, bodies[0], arch, cpu, log, full, issue_width)]
+
+        data = [SourceLine.write_multiline(header)]
+        for i, body in enumerate(bodies):
+            name = _batch_name("region", i)
+            data += [
+                f"{_LLVM_MCA_BEGIN} {name}",
+                _rename_labels(SourceLine.write_multiline(body), i),
+                f"{_LLVM_MCA_END} {name}",
+            ]
+        data = "\n".join(data) + "\n"
+        out = LLVM_Mca._run_regions(data, arch, cpu, full, issue_width)
+
+        starts = {}
+        for idx, line in enumerate(out):
+            m = re.fullmatch(r"\[\d+\] Code Region - (\S+)", line)
+            if m is not None:
+                starts[m.group(1)] = idx
+        bounds = sorted(starts.values()) + [len(out)]
+        res = []
+        for i in range(len(bodies)):
+            start = starts.get(_batch_name("region", i))
+            if start is None:
+                raise LLVM_Mca_Error(f"Could not find region {i} in LLVM-MCA output")
+            end = bounds[bounds.index(start) + 1]
+            region = out[start + 1 : end]
+            # Present the region as if it had been analyzed on its own
+            suffix = _batch_name("", i)
+            region = [line.replace(suffix, "") for line in region]
+            res.append(["", "[0] Code Region"] + region)
+        return res
+
 
 class SelfTestException(Exception):
     """Exception thrown upon selftest failures"""
 
 
+_SELFTEST_CODE_BASE = 0x010000
+_SELFTEST_CODE_SZ = 0x010000
+_SELFTEST_CODE_END = _SELFTEST_CODE_BASE + _SELFTEST_CODE_SZ
+_SELFTEST_RAM_BASE = 0x030000
+_SELFTEST_RAM_SZ = 0x010000
+_SELFTEST_STACK_BASE = 0x040000
+_SELFTEST_STACK_SZ = 0x010000
+_SELFTEST_STACK_TOP = _SELFTEST_STACK_BASE + _SELFTEST_STACK_SZ
+
+
+def _selftest_worker(selftest, seeds, batched, conn):
+    try:
+        res = ("ok", selftest.run_trials(seeds, batched))
+    except Exception as e:
+        res = ("exc", e)
+    conn.send(res)
+    conn.close()
+
+
+def _selftest_parallel(selftest, seeds, workers, batched):
+    """Distribute the trials of a selftest over worker processes, and return the
+    description of the first mismatch found, or None if all trials succeed.
+
+    The first mismatch terminates the remaining workers."""
+    ctx = multiprocessing_context()
+    running = {}
+    try:
+        for i in range(workers):
+            conn_recv, conn_send = ctx.Pipe(duplex=False)
+            p = ctx.Process(
+                target=_selftest_worker,
+                args=(selftest, seeds[i::workers], batched, conn_send),
+                daemon=True,
+            )
+            p.start()
+            conn_send.close()
+            running[conn_recv] = p
+
+        while len(running) > 0:
+            for conn in multiprocessing.connection.wait(list(running.keys())):
+                p = running.pop(conn)
+                try:
+                    status, res = conn.recv()
+                except EOFError as exc:
+                    raise ChildProcessError(
+                        "Selftest worker process terminated unexpectedly"
+                    ) from exc
+                finally:
+                    conn.close()
+                    p.join()
+                if status == "exc":
+                    raise res
+                if res is not None:
+                    return res
+    finally:
+        for conn, p in running.items():
+            p.terminate()
+            p.join()
+            conn.close()
+    return None
+
+
 class SelfTest:
+    """Empirical test for the functional equivalence of two pieces of code.
+
+    Both pieces of code are emulated on the same random initial register and
+    memory contents, and the final contents of the output registers and memory
+    are compared. Every trial derives its random inputs from its own seed, so a
+    failing trial can be replayed by running a single trial with that seed.
+
+    :param config: The configuration, providing the architecture model and the
+        selftest options.
+    :type config: any
+    :param log: The logger to use.
+    :type log: logging.Logger
+    :param codeA: The original code.
+    :type codeA: list[SourceLine]
+    :param codeB: The code to compare the original code against.
+    :type codeB: list[SourceLine]
+    :param address_registers: Dictionary of registers holding pointers to memory,
+        and the size of the memory they point to.
+    :type address_registers: dict
+    :param output_registers: The registers whose final contents are compared.
+    :type output_registers: list
+    :param fnsym: If set, the code is a function of this name, which is called
+        and expected to return.
+    :type fnsym: str
+    """
+
+    def __init__(
+        self,
+        config: any,
+        log: logging.Logger,
+        codeA: list[SourceLine],
+        codeB: list[SourceLine],
+        address_registers: dict,
+        output_registers: list,
+        fnsym: str = None,
+    ):
+        self.arch = config.arch
+        self.compiler_binary = config.compiler_binary
+        self.compiler_include_paths = config.compiler_include_paths
+        self.assembly_cache_dir = config.assembly_cache_dir
+        self.assembly_cache_max_size = config.assembly_cache_max_size
+        self.memory_size = config.selftest_default_memory_size
+        self.initial_register_values = dict(config.selftest_initial_register_values)
+        self.log = log
+        self.codeA = codeA
+        self.codeB = codeB
+        self.address_registers = address_registers
+        self.output_registers = output_registers
+        self.fnsym = fnsym
+        self.assembled = None
+        self.regs = [
+            r
+            for ty in self.arch.RegisterType
+            for r in self.arch.RegisterType.list_registers(ty)
+        ]
+
+    def __getstate__(self):
+        # Worker processes import the architecture model themselves
+        state = self.__dict__.copy()
+        state["arch"] = self.arch.__name__
+        return state
+
+    def __setstate__(self, state):
+        state["arch"] = importlib.import_module(state["arch"])
+        self.__dict__.update(state)
+
+    def _assemble(self):
+        """Assemble old and new code, with a single invocation of LLVM-MC"""
+        if self.assembled is None:
+            self.assembled = LLVM_Mc.assemble_batch(
+                [self.codeA, self.codeB],
+                self.arch.llvm_mc_arch,
+                self.arch.llvm_mc_attr,
+                self.log,
+                symbol=self.fnsym,
+                preprocessor=self.compiler_binary,
+                include_paths=self.compiler_include_paths,
+                cache_dir=self.assembly_cache_dir,
+                cache_max_size=self.assembly_cache_max_size,
+            )
+        return self.assembled
+
+    def _prepare(self, code, assembled):
+        """Set up an emulator for assembled code"""
+        objcode, offset = assembled
+        # Setup emulator
+        mu = Uc(self.arch.unicorn_arch, self.arch.unicorn_mode)
+        # Copy code into emulator
+        mu.mem_map(_SELFTEST_CODE_BASE, _SELFTEST_CODE_SZ)
+        mu.mem_write(_SELFTEST_CODE_BASE, objcode)
+        # Allocate memory and stack
+        mu.mem_map(_SELFTEST_RAM_BASE, _SELFTEST_RAM_SZ)
+        mu.mem_map(_SELFTEST_STACK_BASE, _SELFTEST_STACK_SZ)
+        # Remember the pristine CPU state, so the emulator can be reset
+        # between runs
+        return code, objcode, offset, mu, mu.context_save()
+
+    def _inputs(self, seed):
+        """Derive initial register, memory and stack contents from a seed"""
+        rng = random.Random(seed)
+        initial_memory = rng.randbytes(_SELFTEST_RAM_SZ)
+        initial_stack = rng.randbytes(_SELFTEST_STACK_SZ)
+        cur_ram = _SELFTEST_RAM_BASE
+        # Set initial register contents arbitrarily, except for registers
+        # which must hold valid memory addresses.
+        initial_register_contents = {}
+        for r in self.regs:
+            initial_register_contents[r] = rng.getrandbits(128)
+        # Apply user-specified fixed initial values (overrides random).
+        # Useful for registers that contribute to address computation
+        # (e.g. strides/offsets) but are not themselves address registers.
+        for reg, val in self.initial_register_values.items():
+            if reg in initial_register_contents:
+                initial_register_contents[reg] = val
+        for reg, sz in self.address_registers.items():
+            # allocate 2*sz and place pointer in the middle
+            # this makes sure that memory can be accessed at negative offsets
+            initial_register_contents[reg] = cur_ram + sz
+            cur_ram += 2 * sz
+        return initial_register_contents, initial_memory, initial_stack
+
+    def _run(self, prepared, initial_register_contents, initial_memory, initial_stack):
+        code, objcode, offset, mu, pristine = prepared
+        reg_type = self.arch.RegisterType
+        mu.context_restore(pristine)
+        # Copy initial register contents into emulator
+        for r, v in initial_register_contents.items():
+            ur = reg_type.unicorn_reg_by_name(r)
+            if ur is None:
+                continue
+            mu.reg_write(ur, v)
+        if self.fnsym is not None:
+            # If we expect a function return, put a valid address in the LR
+            # that serves as the marker to terminate emulation
+            mu.reg_write(reg_type.unicorn_link_register(), _SELFTEST_CODE_END)
+        # Setup stack and allocate initial stack memory
+        mu.reg_write(
+            reg_type.unicorn_stack_pointer(), _SELFTEST_STACK_TOP - self.memory_size
+        )
+
+        # Copy initial memory contents into emulator
+        mu.mem_write(_SELFTEST_RAM_BASE, initial_memory)
+        # Setup stack
+        mu.mem_write(_SELFTEST_STACK_BASE, initial_stack)
+        # Run emulator
+        try:
+            # For a function, expect a function return; otherwise, expect
+            # to run to the address CODE_END stored in the link register
+            if self.fnsym is None:
+                mu.emu_start(
+                    _SELFTEST_CODE_BASE + offset, _SELFTEST_CODE_BASE + len(objcode)
+                )
+            else:
+                mu.emu_start(_SELFTEST_CODE_BASE + offset, _SELFTEST_CODE_END)
+        except UcError as e:
+            self.log.error("Failed to emulate code using unicorn engine")
+            self.log.error("Code")
+            self.log.error(SourceLine.write_multiline(code))
+            raise SelfTestException(
+                f"Selftest failed: Unicorn failed to emulate code: {str(e)}"
+            ) from e
+
+        final_register_contents = {}
+        for r in self.regs:
+            ur = reg_type.unicorn_reg_by_name(r)
+            if ur is None:
+                continue
+            final_register_contents[r] = mu.reg_read(ur)
+        final_memory_contents = mu.mem_read(_SELFTEST_RAM_BASE, _SELFTEST_RAM_SZ)
+
+        return final_register_contents, final_memory_contents
+
+    @staticmethod
+    def _memory_diff(old, new, max_ranges=8, max_bytes=32):
+        """Describe the first ranges of bytes in which two memories differ"""
+        res = []
+        i = 0
+        while i < len(old) and len(res) < max_ranges:
+            if old[i] == new[i]:
+                i += 1
+                continue
+            j = i
+            while j < len(old) and old[j] != new[j]:
+                j += 1
+            k = min(j, i + max_bytes)
+            res.append(
+                f"[{hex(_SELFTEST_RAM_BASE + i)}:{hex(_SELFTEST_RAM_BASE + j)}]: "
+                f"{old[i:k].hex()} != {new[i:k].hex()}"
+            )
+            i = j
+        return res
+
+    def trial(self, seed: int, prepared_old: any, prepared_new: any) -> str:
+        """Run both pieces of code on the inputs derived from a seed
+
+        :param seed: The seed to derive the random inputs from.
+        :type seed: int
+        :param prepared_old: The emulator prepared for the original code.
+        :type prepared_old: any
+        :param prepared_new: The emulator prepared for the new code.
+        :type prepared_new: any
+        :return: None if the final states agree, and a description of the
+            mismatch otherwise.
+        :rtype: str
+        """
+        inputs = self._inputs(seed)
+        try:
+            final_regs_old, final_mem_old = self._run(prepared_old, *inputs)
+            final_regs_new, final_mem_new = self._run(prepared_new, *inputs)
+        except SelfTestException as e:
+            return f"{e} (seed {seed})"
+
+        # Check if memory contents are the same
+        if final_mem_old != final_mem_new:
+            diff = "\n".join(SelfTest._memory_diff(final_mem_old, final_mem_new))
+            return f"Selftest failed: Memory mismatch (seed {seed})\n{diff}"
+
+        # Check that callee-saved registers are the same
+        for r in self.output_registers:
+            # skip over hints
+            if r.startswith("hint_"):
+                continue
+            if final_regs_old[r] != final_regs_new[r]:
+                return (
+                    f"Selftest failed: Register mismatch for {r}: "
+                    f"{hex(final_regs_old[r])} != {hex(final_regs_new[r])} "
+                    f"(seed {seed})"
+                )
+        return None
+
+    def run_trials(self, seeds: list, batched: bool = True) -> str:
+        """Run trials until the first mismatch
+
+        :param seeds: The seeds of the trials to run.
+        :type seeds: list
+        :param batched: If set, set up the emulators for both pieces of code
+            only once, instead of once per trial.
+        :type batched: bool
+        :return: None if all trials succeed, and the description of the first
+            mismatch otherwise.
+        :rtype: str
+        """
+        assembled_old, assembled_new = self._assemble()
+        if batched:
+            prepared_old = self._prepare(self.codeA, assembled_old)
+            prepared_new = self._prepare(self.codeB, assembled_new)
+        for seed in seeds:
+            if not batched:
+                prepared_old = self._prepare(self.codeA, assembled_old)
+                prepared_new = self._prepare(self.codeB, assembled_new)
+            failure = self.trial(seed, prepared_old, prepared_new)
+            if failure is not None:
+                return failure
+        return None
 
     @staticmethod
     def run(
@@ -1661,85 +2704,27 @@ class SelfTest:
         iterations,
         fnsym=None,
     ):
-        CODE_BASE = 0x010000
-        CODE_SZ = 0x010000
-        CODE_END = CODE_BASE + CODE_SZ
-        RAM_BASE = 0x030000
-        RAM_SZ = 0x010000
-        STACK_BASE = 0x040000
-        STACK_SZ = 0x010000
-        STACK_TOP = STACK_BASE + STACK_SZ
-
-        regs = [
-            r
-            for ty in config.arch.RegisterType
-            for r in config.arch.RegisterType.list_registers(ty)
-        ]
+        selftest = SelfTest(
+            config, log, codeA, codeB, address_registers, output_registers, fnsym
+        )
 
-        def run_code(code, txt=None):
-            objcode, offset = LLVM_Mc.assemble(
-                code,
-                config.arch.llvm_mc_arch,
-                config.arch.llvm_mc_attr,
-                log,
-                symbol=fnsym,
-                preprocessor=config.compiler_binary,
-                include_paths=config.compiler_include_paths,
-            )
-            # Setup emulator
-            mu = Uc(config.arch.unicorn_arch, config.arch.unicorn_mode)
-            # Copy initial register contents into emulator
-            for r, v in initial_register_contents.items():
-                ur = config.arch.RegisterType.unicorn_reg_by_name(r)
-                if ur is None:
-                    continue
-                mu.reg_write(ur, v)
-            if fnsym is not None:
-                # If we expect a function return, put a valid address in the LR
-                # that serves as the marker to terminate emulation
-                mu.reg_write(config.arch.RegisterType.unicorn_link_register(), CODE_END)
-            # Setup stack and allocate initial stack memory
-            mu.reg_write(
-                config.arch.RegisterType.unicorn_stack_pointer(),
-                STACK_TOP - config.selftest_default_memory_size,
+        seed = config.selftest_seed
+        if seed is None:
+            seed = random.getrandbits(32)
+        seeds = [seed + i for i in range(iterations)]
+        log.debug(f"Selftest seeds: {seed}..{seed + iterations - 1}")
+
+        workers = min(config.selftest_parallel_workers, iterations)
+        if workers > 1:
+            # Assemble once, rather than in every worker
+            selftest._assemble()
+            failure = _selftest_parallel(
+                selftest, seeds, workers, config.selftest_batched
             )
-            # Copy code into emulator
-            mu.mem_map(CODE_BASE, CODE_SZ)
-            mu.mem_write(CODE_BASE, objcode)
-
-            # Copy initial memory contents into emulator
-            mu.mem_map(RAM_BASE, RAM_SZ)
-            mu.mem_write(RAM_BASE, initial_memory)
-            # Setup stack
-            mu.mem_map(STACK_BASE, STACK_SZ)
-            mu.mem_write(STACK_BASE, initial_stack)
-            # Run emulator
-            try:
-                # For a function, expect a function return; otherwise, expect
-                # to run to the address CODE_END stored in the link register
-                if fnsym is None:
-                    mu.emu_start(CODE_BASE + offset, CODE_BASE + len(objcode))
-                else:
-                    mu.emu_start(CODE_BASE + offset, CODE_END)
-            except UcError as e:
-                log.error("Failed to emulate code using unicorn engine")
-                log.error("Code")
-                log.error(SourceLine.write_multiline(code))
-                raise SelfTestException(
-                    f"Selftest failed: Unicorn failed to emulate code: {str(e)}"
-                ) from e
-
-            final_register_contents = {}
-            for r in regs:
-                ur = config.arch.RegisterType.unicorn_reg_by_name(r)
-                if ur is None:
-                    continue
-                final_register_contents[r] = mu.reg_read(ur)
-            final_memory_contents = mu.mem_read(RAM_BASE, RAM_SZ)
-
-            return final_register_contents, final_memory_contents
+        else:
+            failure = selftest.run_trials(seeds, config.selftest_batched)
 
-        def failure_dump():
+        if failure is not None:
             log.error("Selftest failed")
             log.error("Input code:")
             log.error(SourceLine.write_multiline(codeA))
@@ -1747,49 +2732,12 @@ class SelfTest:
             log.error(SourceLine.write_multiline(codeB))
             log.error("Output registers:")
             log.error(output_registers)
-
-        for _ in range(iterations):
-            initial_memory = os.urandom(RAM_SZ)
-            initial_stack = os.urandom(STACK_SZ)
-            cur_ram = RAM_BASE
-            # Set initial register contents arbitrarily, except for registers
-            # which must hold valid memory addresses.
-            initial_register_contents = {}
-            for r in regs:
-                initial_register_contents[r] = int.from_bytes(
-                    os.urandom(16), byteorder="little"
-                )
-            # Apply user-specified fixed initial values (overrides random).
-            # Useful for registers that contribute to address computation
-            # (e.g. strides/offsets) but are not themselves address registers.
-            for reg, val in config.selftest_initial_register_values.items():
-                if reg in initial_register_contents:
-                    initial_register_contents[reg] = val
-            for reg, sz in address_registers.items():
-                # allocate 2*sz and place pointer in the middle
-                # this makes sure that memory can be accessed at negative offsets
-                initial_register_contents[reg] = cur_ram + sz
-                cur_ram += 2 * sz
-
-            final_regs_old, final_mem_old = run_code(codeA, txt="old")
-            final_regs_new, final_mem_new = run_code(codeB, txt="new")
-
-            # Check if memory contents are the same
-            if final_mem_old != final_mem_new:
-                failure_dump()
-                raise SelfTestException("Selftest failed: Memory mismatch")
-
-            # Check that callee-saved registers are the same
-            for r in output_registers:
-                # skip over hints
-                if r.startswith("hint_"):
-                    continue
-                if final_regs_old[r] != final_regs_new[r]:
-                    failure_dump()
-                    raise SelfTestException(
-                        f"Selftest failed: Register mismatch for {r}: "
-                        f"{hex(final_regs_old[r])} != {hex(final_regs_new[r])}"
-                    )
+            log.error(failure)
+            log.error(
+                "Set selftest_seed to the seed above and selftest_iterations to 1 "
+                "to replay the failing trial."
+            )
+            raise SelfTestException(failure.splitlines()[0])
 
         if fnsym is None:
             log.info("Local selftest: OK")
@@ -1881,6 +2829,20 @@ class DeferHandler(logging.Handler):
         for r in self._records:
             logger.handle(r)
 
+    def export(self):
+        """Return copies of all captured records which can be sent to another
+        process. Messages are formatted eagerly and exception information is
+        dropped."""
+        res = []
+        for r in self._records:
+            r = logging.makeLogRecord(r.__dict__)
+            r.msg = r.getMessage()
+            r.args = None
+            r.exc_info = None
+            r.exc_text = None
+            res.append(r)
+        return res
+
     def forward_to_file(self, log_label, filename, lvl=logging.DEBUG):
         """Store all captured records in a file."""
         logger = logging.getLogger(log_label)
@@ -1891,6 +2853,98 @@ class DeferHandler(logging.Handler):
         self.forward(logger)
 
 
+class ParseCache:
+    """Bounded cache mapping the text of an instruction to its parsed form.
+
+    Architecture models keep one cache for their instruction parser, so that
+    lines which are parsed repeatedly -- e.g. when the data flow graph of the
+    same code is rebuilt -- only pay for parsing once. The cache holds pristine
+    templates which are never handed out: Lookups return clones, which can be
+    modified and bound to a source line by the caller.
+
+    :param max_size: Maximum number of entries. When exceeded, the least recently
+        used entry is evicted.
+    :type max_size: int
+    """
+
+    def __init__(self, max_size: int = 16384):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _clone(inst):
+        def copy_attr(v):
+            if type(v) is list:
+                return [e.copy() if type(e) is list else e for e in v]
+            return v
+
+        res = object.__new__(type(inst))
+        res.__dict__ = {k: copy_attr(v) for k, v in inst.__dict__.items()}
+        return res
+
+    def lookup(self, src: str) -> any:
+        """Look up the parsed form of an instruction
+
+        :param src: The instruction text, stripped of whitespace.
+        :type src: str
+        :return: A fresh copy of the instruction parsed from src, or None if
+            src is not in the cache.
+        :rtype: any
+        """
+        inst = self._entries.get(src)
+        if inst is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(src)
+        return ParseCache._clone(inst)
+
+    def store(self, src: str, inst: any):
+        """Store the parsed form of an instruction
+
+        :param src: The instruction text, stripped of whitespace.
+        :type src: str
+        :param inst: The instruction parsed from src, before it is bound to a
+            source line. A copy is stored, so inst can be modified afterwards.
+        :type inst: any
+        """
+        self._entries[src] = ParseCache._clone(inst)
+        self._entries.move_to_end(src)
+        self.stores += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the statistics"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss statistics of the cache
+
+        :return: Dictionary with counts of hits, misses, stores and evictions, the
+            current number of entries, and the hit rate.
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+
 class Loop(ABC):
     def __init__(self, lbl_start="1", lbl_end="2", loop_init="lr"):
         self.lbl_start = lbl_start
@@ -2032,10 +3086,130 @@ class Loop(ABC):
         raise FatalParsingException(f"Couldn't identify loop {lbl}")
 
 
+class MultidictIndex:
+    """Index of a multidict mapping instruction classes, callables, or tuples
+    thereof to values, as used for the latency and functional unit tables of
+    microarchitecture models.
+
+    Keys are split into classes and predicates once. The entries whose classes
+    match an instruction only depend on its type and are memoized per type;
+    only the predicates are evaluated for every lookup.
+
+    Use MultidictIndex.get() to obtain the index for a multidict, which is
+    built on first use and shared afterwards. Values are read from the multidict
+    itself, so overwriting the value of a key is reflected immediately, while
+    adding, removing or replacing keys causes the index to be rebuilt.
+
+    :param d: The multidict mapping keys (classes, callables, or tuples) to values.
+    :type d: dict
+    """
+
+    _indices = {}
+
+    def __init__(self, d: dict):
+        self.table = d
+        self.keys = list(d.keys())
+        self._classes = []
+        self._predicates = []
+        for idx, key in enumerate(self.keys):
+            if not isinstance(key, tuple):
+                key = (key,)
+            classes = tuple(x for x in key if inspect.isclass(x))
+            predicates = tuple(x for x in key if not inspect.isclass(x))
+            assert all(callable(x) for x in predicates)
+            if len(classes) > 0:
+                self._classes.append((idx, classes))
+            if len(predicates) > 0:
+                self._predicates.append((idx, predicates))
+        self._matches_by_type = {}
+
+    @staticmethod
+    def get(d: dict) -> "MultidictIndex":
+        """Returns the index for a multidict, building it if necessary.
+
+        The index is rebuilt if the keys of the multidict have changed since.
+
+        :param d: The multidict to index.
+        :type d: dict
+        :return: The index of d.
+        :rtype: MultidictIndex
+        """
+        index = MultidictIndex._indices.get(id(d))
+        if index is None or index.table is not d or index.keys != list(d):
+            index = MultidictIndex(d)
+            MultidictIndex._indices[id(d)] = index
+        return index
+
+    def value(self, idx: int) -> any:
+        """Returns the current value of an entry of the multidict.
+
+        :param idx: The index of the entry, in the order of the multidict.
+        :type idx: int
+        :return: The value of the entry.
+        :rtype: any
+        """
+        return self.table[self.keys[idx]]
+
+    def _class_matches(self, inst):
+        ty = type(inst)
+        res = self._matches_by_type.get(ty)
+        if res is None:
+            res = tuple(idx for idx, cls in self._classes if issubclass(ty, cls))
+            self._matches_by_type[ty] = res
+        return res
+
+    def matches(self, inst: any) -> list:
+        """Find all entries of the multidict matching an instruction.
+
+        :param inst: The instruction instance to match against the keys.
+        :type inst: any
+        :return: The indices of the matching entries, in the order of the multidict.
+        :rtype: list
+        """
+        res = list(self._class_matches(inst))
+        by_class = len(res)
+        for idx, predicates in self._predicates:
+            if idx in res[:by_class]:
+                continue
+            if any(p(inst) for p in predicates):
+                res.append(idx)
+        if by_class < len(res):
+            res.sort()
+        return res
+
+    def first_match(self, inst: any) -> int:
+        """Find the first entry of the multidict matching an instruction.
+        Predicates of later entries are not evaluated.
+
+        :param inst: The instruction instance to match against the keys.
+        :type inst: any
+        :return: The index of the first matching entry, in the order of the
+            multidict, or None if there is none.
+        :rtype: int
+        """
+        class_matches = self._class_matches(inst)
+        first = class_matches[0] if len(class_matches) > 0 else None
+        for idx, predicates in self._predicates:
+            if first is not None and idx >= first:
+                break
+            if any(p(inst) for p in predicates):
+                first = idx
+                break
+        return first
+
+
 def lookup_multidict(d: dict, inst: any, instclass: any) -> any:
     """
     Lookup a value in a multidict based on an instruction instance.
 
+    Multidict entries can be the following:
+
+    - An instruction class. It matches any instruction of that class.
+    - A callable. It matches any instruction returning ``True`` when passed
+      to the callable.
+    - A tuple of instruction classes or callables. It matches any instruction
+      which matches at least one element in the tuple.
+
     :param d: The multidict mapping keys (classes, callables, or tuples) to values.
     :type d: dict
     :param inst: The instruction instance to match against the keys.
@@ -2046,32 +3220,10 @@ def lookup_multidict(d: dict, inst: any, instclass: any) -> any:
     :rtype: any
     :raises UnknownInstruction: If no matching key found, or multiple matches found.
     """
-
-    result = None
-    for ll, v in d.items():
-        # Multidict entries can be the following:
-        # - An instruction class. It matches any instruction of that class.
-        # - A callable. It matches any instruction returning `True` when passed
-        #   to the callable.
-        # - A tuple of instruction classes or callables. It matches any instruction
-        #   which matches at least one element in the tuple.
-        def match(x):
-            if inspect.isclass(x):
-                return isinstance(inst, x)
-            assert callable(x)
-            return x(inst)
-
-        if not isinstance(ll, tuple):
-            ll = [ll]
-        for lp in ll:
-            if match(lp):
-                if result is not None:
-                    raise UnknownInstruction(
-                        f"Multiple matches found for {instclass} for {inst}"
-                    )
-                result = v
-                break
-
-    if result is None:
+    index = MultidictIndex.get(d)
+    matches = index.matches(inst)
+    if len(matches) > 1:
+        raise UnknownInstruction(f"Multiple matches found for {instclass} for {inst}")
+    if len(matches) == 0:
         raise UnknownInstruction(f"Couldn't find {instclass} for {inst}")
-    return result
+    return index.value(matches[0])
@@ -122,7 +122,7 @@ from slothy.targets.exceptions import (
     UnknownInstruction,
     ParsingException,
 )
-from slothy.helper import Loop, SourceLine
+from slothy.helper import Loop, ParseCache, SourceLine
 
 arch_name = "Arm_AArch64"
 
@@ -603,6 +603,9 @@ class BranchLoop(Loop):
 
 
 class Instruction:
+    # Cache of parsed instructions, shared by all instances of the architecture
+    parse_cache = ParseCache()
+
     def __init__(
         self, *, mnemonic, arg_types_in=None, arg_types_in_out=None, arg_types_out=None
     ):
@@ -857,6 +860,65 @@ class Instruction:
 
         return obj
 
+    # Characters which occur literally in instruction patterns, but are never
+    # matched by a placeholder. Their number of occurrences forms the operand
+    # shape of a pattern, which must agree with the shape of any matching line.
+    _SHAPE_CHARS = "[]{}!"
+
+    # Dispatch table from (mnemonic, operand shape) to the instruction classes
+    # whose parsers can possibly succeed, built from all_subclass_leaves.
+    _parser_index = None
+    _parser_index_leaves = None
+
+    @staticmethod
+    def _operand_shape(txt):
+        return tuple(txt.count(c) for c in Instruction._SHAPE_CHARS)
+
+    @staticmethod
+    def _build_parser_index():
+        """Group the instruction classes by the mnemonic of their pattern.
+
+        The parsers of AArch64Instruction reject any line whose first word is not
+        the mnemonic of the pattern, so only the classes of the line's mnemonic
+        need to be tried. Classes without a pattern are tried for any line. Within
+        a group, classes are kept in the order of all_subclass_leaves, so that the
+        first successful parser is the same as in a linear search."""
+        leaves = Instruction.all_subclass_leaves
+        wildcards = []
+        groups = {}
+        for i, inst_class in enumerate(leaves):
+            pattern = getattr(inst_class, "pattern", None)
+            if pattern is None:
+                wildcards.append((i, None, inst_class))
+                continue
+            shape = Instruction._operand_shape(pattern)
+            groups.setdefault(pattern.split(" ")[0], []).append((i, shape, inst_class))
+        groups = {m: sorted(g + wildcards) for m, g in groups.items()}
+        Instruction._parser_index = (groups, wildcards, {})
+        Instruction._parser_index_leaves = leaves
+
+    @staticmethod
+    def _parser_candidates(src):
+        """Returns the instruction classes whose parsers may succeed on the given
+        (stripped) line, in the order in which they must be tried."""
+        if Instruction._parser_index_leaves is not Instruction.all_subclass_leaves:
+            Instruction._build_parser_index()
+        groups, wildcards, memo = Instruction._parser_index
+
+        mnemonic = src.split(" ")[0]
+        # The operand shape is not reliable if the line has a trailing comment
+        shape = Instruction._operand_shape(src) if "//" not in src else None
+        key = (mnemonic, shape)
+        res = memo.get(key)
+        if res is None:
+            res = [
+                inst_class
+                for _, s, inst_class in groups.get(mnemonic, wildcards)
+                if s is None or shape is None or s == shape
+            ]
+            memo[key] = res
+        return res
+
     @staticmethod
     def parser(src_line):
         """Global factory method parsing an assembly line into an instance
@@ -867,16 +929,22 @@ class Instruction:
 
         src = src_line.text.strip()
 
-        # Iterate through all derived classes and call their parser
-        # until one of them hopefully succeeds
-        for inst_class in Instruction.all_subclass_leaves:
-            try:
-                inst = inst_class.make(src)
-                instnames = [inst_class.__name__]
-                insts = [inst]
-                break
-            except ParsingException as e:
-                exceptions[inst_class.__name__] = e
+        inst = Instruction.parse_cache.lookup(src)
+        if inst is not None:
+            instnames = [type(inst).__name__]
+            insts = [inst]
+        else:
+            # Iterate through all derived classes which may match the line and call
+            # their parser until one of them hopefully succeeds
+            for inst_class in Instruction._parser_candidates(src):
+                try:
+                    inst = inst_class.make(src)
+                    Instruction.parse_cache.store(src, inst)
+                    instnames = [inst_class.__name__]
+                    insts = [inst]
+                    break
+                except ParsingException as e:
+                    exceptions[inst_class.__name__] = e
 
         for i in insts:
             i.source_line = src_line
@@ -5225,10 +5293,18 @@ def iter_aarch64_instructions():
     yield from all_subclass_leaves(Instruction)
 
 
-def find_class(src):
+@cache
+def _find_class_of_type(ty):
     for inst_class in iter_aarch64_instructions():
-        if isinstance(src, inst_class):
+        if issubclass(ty, inst_class):
             return inst_class
+    return None
+
+
+def find_class(src):
+    inst_class = _find_class_of_type(type(src))
+    if inst_class is not None:
+        return inst_class
     raise UnknownInstruction(
         f"Couldn't find instruction class for {src} (type {type(src)})"
     )
@@ -67,7 +67,7 @@ from unicorn.arm_const import (
     UC_ARM_REG_S31,
 )
 
-from slothy.helper import SourceLine, Loop
+from slothy.helper import SourceLine, Loop, ParseCache
 from sympy import simplify
 
 arch_name = "Arm_v7M"
@@ -701,6 +701,9 @@ class SubsLoop(Loop):
 
 
 class Instruction:
+    # Cache of parsed instructions, shared by all instances of the architecture
+    parse_cache = ParseCache()
+
     def __init__(
         self, *, mnemonic, arg_types_in=None, arg_types_in_out=None, arg_types_out=None
     ):
@@ -958,16 +961,22 @@ class Instruction:
 
         src = src_line.text.strip()
 
-        # Iterate through all derived classes and call their parser
-        # until one of them hopefully succeeds
-        for inst_class in Instruction.all_subclass_leaves:
-            try:
-                inst = inst_class.make(src)
-                instnames = [inst_class.__name__]
-                insts = [inst]
-                break
-            except ParsingException as e:
-                exceptions[inst_class.__name__] = e
+        inst = Instruction.parse_cache.lookup(src)
+        if inst is not None:
+            instnames = [type(inst).__name__]
+            insts = [inst]
+        else:
+            # Iterate through all derived classes and call their parser
+            # until one of them hopefully succeeds
+            for inst_class in Instruction.all_subclass_leaves:
+                try:
+                    inst = inst_class.make(src)
+                    Instruction.parse_cache.store(src, inst)
+                    instnames = [inst_class.__name__]
+                    insts = [inst]
+                    break
+                except ParsingException as e:
+                    exceptions[inst_class.__name__] = e
 
         for i in insts:
             i.source_line = src_line
@@ -2625,10 +2634,18 @@ def iter_armv7m_instructions():
     yield from all_subclass_leaves(Instruction)
 
 
-def find_class(src):
+@cache
+def _find_class_of_type(ty):
     for inst_class in iter_armv7m_instructions():
-        if isinstance(src, inst_class):
+        if issubclass(ty, inst_class):
             return inst_class
+    return None
+
+
+def find_class(src):
+    inst_class = _find_class_of_type(type(src))
+    if inst_class is not None:
+        return inst_class
     raise UnknownInstruction(
         f"Couldn't find instruction class for {src} (type {type(src)})"
     )
@@ -40,7 +40,7 @@ from functools import cache
 from enum import Enum
 from sympy import simplify
 
-from slothy.helper import Loop
+from slothy.helper import Loop, ParseCache
 from slothy.targets.exceptions import (
     FatalParsingException,
     UnknownInstruction,
@@ -197,6 +197,9 @@ class LeLoop(Loop):
 
 
 class Instruction:
+    # Cache of parsed instructions, shared by all instances of the architecture
+    parse_cache = ParseCache()
+
     def __init__(
         self, *, mnemonic, arg_types_in=None, arg_types_in_out=None, arg_types_out=None
     ):
@@ -548,16 +551,22 @@ class Instruction:
 
         src = src_line.text.strip()
 
-        # Iterate through all derived classes and call their parser
-        # until one of them hopefully succeeds
-        for inst_class in Instruction.all_subclass_leaves:
-            try:
-                inst = inst_class.make(src)
-                instnames = [inst_class.__name__]
-                insts = [inst]
-                break
-            except ParsingException as e:
-                exceptions[inst_class.__name__] = e
+        inst = Instruction.parse_cache.lookup(src)
+        if inst is not None:
+            instnames = [type(inst).__name__]
+            insts = [inst]
+        else:
+            # Iterate through all derived classes and call their parser
+            # until one of them hopefully succeeds
+            for inst_class in Instruction.all_subclass_leaves:
+                try:
+                    inst = inst_class.make(src)
+                    Instruction.parse_cache.store(src, inst)
+                    instnames = [inst_class.__name__]
+                    insts = [inst]
+                    break
+                except ParsingException as e:
+                    exceptions[inst_class.__name__] = e
         for i in insts:
             i.source_line = src_line
             i.extract_read_writes()
@@ -2692,10 +2701,18 @@ def iter_MVE_instructions():
     yield from all_subclass_leaves(Instruction)
 
 
-def find_class(src):
+@cache
+def _find_class_of_type(ty):
     for inst_class in iter_MVE_instructions():
-        if isinstance(src, inst_class):
+        if issubclass(ty, inst_class):
             return inst_class
+    return None
+
+
+def find_class(src):
+    inst_class = _find_class_of_type(type(src))
+    if inst_class is not None:
+        return inst_class
     raise UnknownInstruction("Couldn't find instruction class")
 
 
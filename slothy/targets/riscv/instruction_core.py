@@ -28,6 +28,7 @@
 
 import re
 from slothy.targets.exceptions import FatalParsingException, ParsingException
+from slothy.helper import ParseCache
 import logging
 
 # from slothy.targets.riscv.riscv_super_instructions import RISCVStore, RISCVLoad
@@ -36,6 +37,9 @@ import logging
 class Instruction:
     """Represents an abstract instruction"""
 
+    # Cache of parsed instructions, shared by all instances of the architecture
+    parse_cache = ParseCache()
+
     def __init__(
         self, *, mnemonic, arg_types_in=None, arg_types_in_out=None, arg_types_out=None
     ):
@@ -288,16 +292,22 @@ class Instruction:
         instnames = []
 
         src = src_line.text.strip()
-        # Iterate through all derived classes and call their parser
-        # until one of them hopefully succeeds
-        for inst_class in Instruction.all_subclass_leaves(Instruction):
-            try:
-                inst = inst_class.make(src)
-                instnames = [inst_class.__name__]
-                insts = [inst]
-                break
-            except ParsingException as e:
-                exceptions[inst_class.__name__] = e
+        inst = Instruction.parse_cache.lookup(src)
+        if inst is not None:
+            instnames = [type(inst).__name__]
+            insts = [inst]
+        else:
+            # Iterate through all derived classes and call their parser
+            # until one of them hopefully succeeds
+            for inst_class in Instruction.all_subclass_leaves(Instruction):
+                try:
+                    inst = inst_class.make(src)
+                    Instruction.parse_cache.store(src, inst)
+                    instnames = [inst_class.__name__]
+                    insts = [inst]
+                    break
+                except ParsingException as e:
+                    exceptions[inst_class.__name__] = e
 
         for i in insts:
             i.source_line = src_line
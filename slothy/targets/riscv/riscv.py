@@ -32,13 +32,12 @@
 Partial SLOTHY architecture model for RISCV
 """
 
-import inspect
 import logging
 import math
 from sympy import simplify
 from enum import Enum
 from functools import cache
-from slothy.helper import Loop
+from slothy.helper import Loop, MultidictIndex
 from slothy.targets.riscv.instruction_core import Instruction
 from slothy.targets.exceptions import UnknownInstruction
 
@@ -495,10 +494,18 @@ def iter_riscv_instructions():
     yield from Instruction.all_subclass_leaves(Instruction)
 
 
-def find_class(src):
+@cache
+def _find_class_of_type(ty):
     for inst_class in iter_riscv_instructions():
-        if isinstance(src, inst_class):
+        if issubclass(ty, inst_class):
             return inst_class
+    return None
+
+
+def find_class(src):
+    inst_class = _find_class_of_type(type(src))
+    if inst_class is not None:
+        return inst_class
     raise UnknownInstruction(
         f"Couldn't find instruction class for {src} (type {type(src)})"
     )
@@ -526,19 +533,10 @@ def lookup_multidict(d: any, inst: any, default: any = None) -> any:
     :raises UnknownInstruction: Couldn't find instruction class for instruction
     """
     instclass = find_class(inst)
-    for key, v in d.items():
-
-        def match(x):
-            if inspect.isclass(x):
-                return isinstance(inst, x)
-            # assert callable(x)
-            return x(inst)
-
-        if not isinstance(key, tuple):
-            key = [key]
-        for lp in key:
-            if match(lp):
-                return v
+    index = MultidictIndex.get(d)
+    idx = index.first_match(inst)
+    if idx is not None:
+        return index.value(idx)
     if default is None:
         raise UnknownInstruction(f"Couldn't find {instclass} for {inst}")
     return default
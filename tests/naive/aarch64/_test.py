@@ -25,12 +25,34 @@
 # Author: Amin Abdulrahman <amin@abdulrahman.de>
 #
 
+import copy
+import json
+import logging
+import os
+import pickle
+import random
+import re
+import tempfile
+from unittest import mock
+
 from common.OptimizationRunner import OptimizationRunner
+from slothy.core.cache import ResultCache
+from slothy.core.config import InvalidConfig
+from slothy.core.core import Result, SlothyBase, SlothySelfCheckException
+from slothy.core.dataflow import ComputationNode
+from slothy.core.dataflow import DataFlowGraph as DFG
+from slothy.core.dataflow import Config as DFGConfig
+from slothy.core.dataflow import RegisterState
+from slothy.core.heuristics import Heuristics
+from slothy.core.profiler import Profiler
+from slothy.helper import DeferHandler, LLVM_Mc, LLVM_Mca, SelfTest, SelfTestException
+from slothy.helper import MultidictIndex, SourceLine, lookup_multidict
 import slothy.targets.aarch64.aarch64_neon as AArch64_Neon
 import slothy.targets.aarch64.cortex_a55 as Target_CortexA55
 import slothy.targets.aarch64.cortex_a72_frontend as Target_CortexA72
 import slothy.targets.aarch64.neoverse_n1_experimental as Target_NeoverseN1
 import slothy.targets.aarch64.aarch64_big_experimental as Target_AArch64Big
+from slothy.targets.exceptions import ParsingException, UnknownInstruction
 
 
 class Instructions(OptimizationRunner):
@@ -472,6 +494,770 @@ class AArch64Directives(OptimizationRunner):
         slothy.optimize(start="start_irp_single", end="end_irp_single")  # 1 instruction
 
 
+def result_cache(slothy):
+    """Optimizes the same kernel twice with a result cache, expecting the second
+    optimization to be served from the cache and to yield identical code."""
+
+    slothy.config.variable_size = True
+    slothy.config.constraints.stalls_first_attempt = 32
+    slothy.config.sw_pipelining.enabled = True
+
+    orig = slothy.get_source_as_string()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        slothy.config.result_cache_dir = cache_dir
+        ResultCache.reset_stats()
+
+        slothy.optimize_loop("start")
+        first = slothy.get_source_as_string()
+        stats = ResultCache.stats()
+        if stats["hits"] != 0 or stats["stores"] == 0:
+            raise Exception(f"Unexpected result cache statistics: {stats}")
+
+        slothy.load_source_raw(orig)
+        slothy.optimize_loop("start")
+        second = slothy.get_source_as_string()
+        stats = ResultCache.stats()
+        if stats["hits"] == 0:
+            raise Exception(f"Result cache not used: {stats}")
+
+    if first != second:
+        raise Exception("Result from cache differs from original result")
+
+
+def parallel_stall_probes(slothy):
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.hints.ext_bsearch_warm_start = True
+
+    # Parallel and sequential probing must find the same minimum
+    def min_cycles(probes):
+        c = slothy.config.copy()
+        c.constraints.stalls_parallel_probes = probes
+        log = slothy.logger.getChild(f"probes_{probes}")
+        return Heuristics.optimize_binsearch(slothy.source, log, c).cycles
+
+    sequential, parallel = min_cycles(1), min_cycles(2)
+    if sequential != parallel:
+        raise Exception(
+            f"Parallel probing found {parallel} cycles, sequential {sequential}"
+        )
+
+    slothy.config.constraints.stalls_parallel_probes = 2
+    slothy.optimize()
+
+
+def split_parallel_chunks(slothy):
+    slothy.config.split_heuristic = True
+    slothy.config.split_heuristic_factor = 2
+    slothy.config.split_heuristic_repeat = 1
+    slothy.config.constraints.stalls_first_attempt = 16
+
+    # Without overlap, all windows are in one wave and see the same code as
+    # in the sequential heuristic, so the stitched result must agree.
+    def cycles(chunks):
+        c = slothy.config.copy()
+        c.split_heuristic_stepsize = 0.5
+        c.split_heuristic_parallel_chunks = chunks
+        log = slothy.logger.getChild(f"chunks_{chunks}")
+        return Heuristics.linear(slothy.source, log, c).cycles
+
+    sequential, parallel = cycles(1), cycles(2)
+    if sequential != parallel:
+        raise Exception(
+            f"Parallel windows yield {parallel} cycles, sequential {sequential}"
+        )
+
+    slothy.config.split_heuristic_parallel_chunks = 2
+    slothy.optimize()
+
+
+def split_adaptive(slothy):
+    # Stalls 3 and 4 form one cluster, stall 20 another
+    windows = Heuristics._adaptive_windows({3, 4, 20}, 40, 8)
+    if windows != [(0, 9), (16, 25)]:
+        raise Exception(f"Unexpected adaptive windows: {windows}")
+
+    slothy.config.split_heuristic = True
+    slothy.config.split_heuristic_factor = 2
+    slothy.config.split_heuristic_adaptive = True
+    slothy.config.split_heuristic_adaptive_time_budget = 60
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.optimize()
+
+    # Windows failing their selfcheck must not be skipped. Only the windows of
+    # the adaptive passes fail, not those of the initial pass finding the
+    # stalls, nor the check of the whole code.
+    num_instructions = SourceLine.instruction_count(slothy.source)
+    adaptive = False
+
+    def adaptive_windows(*args):
+        nonlocal adaptive
+        adaptive = True
+        return windows(*args)
+
+    def failing_selfcheck(result, log):
+        window = SourceLine.instruction_count(result.orig_code) < num_instructions
+        if adaptive and window:
+            raise SlothySelfCheckException("Injected selfcheck failure")
+        return selfcheck(result, log)
+
+    windows, selfcheck = Heuristics._adaptive_windows, Result.selfcheck
+    log = slothy.logger.getChild("fail")
+    with (
+        mock.patch.object(Heuristics, "_adaptive_windows", adaptive_windows),
+        mock.patch.object(Result, "selfcheck", failing_selfcheck),
+    ):
+        try:
+            Heuristics.linear(slothy.source, log, slothy.config)
+        except SlothySelfCheckException:
+            return
+    raise Exception("Selfcheck failure of a window not propagated")
+
+
+def global_timeout(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.sw_pipelining.halving_heuristic = True
+    slothy.config.split_heuristic = True
+    slothy.config.split_heuristic_factor = 2
+    slothy.config.constraints.stalls_first_attempt = 16
+    # Too short to find any solution: The loop is kept unchanged
+    slothy.config.global_timeout = 0.001
+    slothy.optimize_loop("start")
+
+
+def global_timeout_cache(slothy):
+    """Optimizes a kernel with a result cache under a global timeout, which is
+    not part of the cache key, expecting solutions cut short by the timeout not
+    to be served to optimizations without it."""
+    c = slothy.config.copy()
+    c.variable_size = True
+    c.constraints.stalls_allowed = 32
+    # Stop at the first solution, before it is proven optimal
+    c.max_solutions = 1
+
+    def optimize(global_timeout):
+        cc = c.copy()
+        cc.global_timeout = global_timeout
+        cc.start_global_timeout()
+        core = SlothyBase(slothy.arch, slothy.target, config=cc)
+        if not core.optimize(slothy.source):
+            raise Exception("Optimization failed")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        c.result_cache_dir = cache_dir
+        ResultCache.reset_stats()
+        optimize(600)
+        optimize(None)
+        stats = ResultCache.stats()
+
+    # A dry run has no objective, so the first solution is optimal and is
+    # cached despite the global timeout
+    if slothy.config.constraints.functional_only:
+        if stats["hits"] != 1:
+            raise Exception(f"Optimal result not served from cache: {stats}")
+    elif stats["hits"] != 0 or stats["stores"] != 1:
+        raise Exception(f"Result cut short by global timeout cached: {stats}")
+
+
+def parallel_passes(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.sw_pipelining.unknown_iteration_count = True
+    slothy.config.inputs_are_outputs = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    # Multi-threaded solving is not deterministic
+    slothy.config.solver_num_workers = 1
+
+    def optimize(passes):
+        slothy.config.sw_pipelining.parallel_passes = passes
+        slothy.optimize_loop("start")
+        # Timings differ between runs
+        return re.sub(r".*(Wall|User) time:.*\n", "", slothy.get_source_as_string())
+
+    orig = slothy.get_source_as_string()
+    sequential = optimize(1)
+    slothy.load_source_raw(orig)
+    if optimize(2) != sequential:
+        raise Exception("Parallel passes differ from sequential passes")
+
+
+def portfolio(slothy):
+    """Races the halving heuristic against full software pipelining, expecting
+    the winning strategy to be logged and its unroll factor to be emitted."""
+
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.sw_pipelining.portfolio = True
+    slothy.config.inputs_are_outputs = True
+
+    handler = DeferHandler()
+    slothy.logger.addHandler(handler)
+
+    def optimize(unrolls):
+        slothy.load_source_raw(orig)
+        slothy.config.sw_pipelining.portfolio_unroll = unrolls
+        start = len(handler.export())
+        slothy.optimize_loop("start")
+        picked = [
+            re.match(r"Portfolio: picking (\w+)_unroll(\d+)", r.msg)
+            for r in handler.export()[start:]
+        ]
+        picked = [m for m in picked if m is not None]
+        if len(picked) != 1:
+            raise Exception(f"No strategy picked for unroll factors {unrolls}")
+        unroll = int(picked[0].group(2))
+        # The loop counter is divided by the unroll factor
+        lsr = "lsr count, count, #1" in slothy.get_source_as_string()
+        if lsr != (unroll == 2):
+            raise Exception(f"Unroll factor {unroll} not emitted")
+        return unroll
+
+    orig = slothy.get_source_as_string()
+    if optimize([2]) != 2:
+        raise Exception("Unroll factor of the portfolio ignored")
+    optimize([1, 2])
+
+    # Strategies which run out of time keep the loop unchanged, also when run
+    # sequentially.
+    slothy.config.global_timeout = 0.001
+    optimize([1, 2])
+    with mock.patch("slothy.core.heuristics._jobs_picklable", return_value=False):
+        optimize([1, 2])
+    slothy.logger.removeHandler(handler)
+
+
+class SolutionRecorder:
+    """Solution callback recording all solutions, which stops the search as soon
+    as the cycle count does not improve anymore. Callbacks must be picklable."""
+
+    def __init__(self):
+        self.solutions = []
+
+    def __call__(self, solution):
+        self.solutions.append(solution)
+        return len(self.solutions) > 1 and solution.cycles >= self.solutions[-2].cycles
+
+
+def solution_callback(slothy):
+    try:
+        slothy.config.solution_callback = lambda solution: False
+    except InvalidConfig:
+        pass
+    else:
+        raise Exception("Unpicklable solution callback accepted")
+
+    on_solution = SolutionRecorder()
+    solutions = on_solution.solutions
+    c = slothy.config.copy()
+    c.variable_size = True
+    c.constraints.stalls_allowed = 32
+    c.solution_callback = on_solution
+    c.solution_pool_size = 2
+    core = SlothyBase(slothy.arch, slothy.target, config=c)
+    if not core.optimize(slothy.source):
+        raise Exception("Optimization failed")
+
+    if len(solutions) == 0:
+        raise Exception("Solution callback not invoked")
+    num_instructions = SourceLine.instruction_count(slothy.source)
+    for solution in solutions:
+        if len(solution.code) != num_instructions:
+            raise Exception(f"Unexpected code in {solution}")
+    pool = core.result.solution_pool
+    if not 0 < len(pool) <= 2:
+        raise Exception(f"Unexpected solution pool {pool}")
+    if pool[0].objective != min(s.objective for s in solutions):
+        raise Exception(f"Best solution missing from pool {pool}")
+
+    # Results from the result cache have no solution pool
+    handler = DeferHandler()
+    core.logger.addHandler(handler)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        c.result_cache_dir = cache_dir
+        for _ in range(2):
+            core = SlothyBase(slothy.arch, slothy.target, config=c)
+            core.optimize(slothy.source)
+    core.logger.removeHandler(handler)
+    if not any("No solution pool" in r.getMessage() for r in handler.export()):
+        raise Exception("No warning about missing solution pool of cached result")
+
+    slothy.config.solution_callback = on_solution
+    slothy.optimize()
+
+
+def solver_parameters(slothy):
+    slothy.config.solver_num_workers = 2
+    slothy.config.solver_linearization_level = 2
+    slothy.config.solver_symmetry_level = 1
+    slothy.config.solver_parameters = {
+        "max_presolve_iterations": 2,
+        "search_branching": "AUTOMATIC_SEARCH",
+    }
+    slothy.config.solver_binsearch_parameters = {
+        "num_workers": 1,
+        "subsolvers": ["default_lp"],
+    }
+    slothy.config.solver_retry_parameters = {"linearization_level": 0}
+    slothy.config.constraints.maximize_register_lifetimes = True
+    slothy.optimize()
+
+
+def warm_start(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.hints.ext_bsearch_warm_start = True
+    slothy.optimize_loop("start")
+
+
+def reuse_model(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.sw_pipelining.minimize_overlapping = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.constraints.stalls_reuse_model = True
+    slothy.optimize_loop("start")
+
+
+def sparse_renaming(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.constraints.sparse_renaming = True
+    # Inputs may only use the registers kept for the corresponding outputs
+    slothy.config.inputs_are_outputs = True
+    slothy.optimize_loop("start")
+
+
+def register_symmetry(slothy):
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.constraints.register_symmetry_breaking = True
+    slothy.optimize_loop("start")
+
+
+def stalls_lower_bound(slothy):
+    """Optimizes straight-line code, expecting the binary search not to probe
+    stall counts below the precomputed lower bound, and the bound not to change
+    the minimum number of cycles found."""
+
+    # The bound is derived from latencies and functional units, which are
+    # not modelled in a dry run
+    if slothy.config.constraints.functional_only:
+        slothy.optimize()
+        return
+
+    core = SlothyBase(slothy.arch, slothy.target, config=slothy.config.copy())
+    lower_bound = core.stalls_lower_bound(slothy.source)
+    if lower_bound == 0:
+        raise Exception("No lower bound for the number of stalls")
+
+    def min_cycles(with_bound):
+        c = slothy.config.copy()
+        c.constraints.stalls_lower_bound = with_bound
+        log = slothy.logger.getChild(f"bound_{with_bound}")
+        return Heuristics.optimize_binsearch(slothy.source, log, c).cycles
+
+    unbounded, bounded = min_cycles(False), min_cycles(True)
+    if unbounded != bounded:
+        raise Exception(f"Bound changes minimum cycles: {bounded} vs {unbounded}")
+
+    with Profiler() as profiler:
+        slothy.optimize()
+
+    def probes(node):
+        if node["name"] == "probe":
+            yield node
+        for c in node["children"]:
+            yield from probes(c)
+
+    for node in probes(profiler.report()["total"]):
+        if node["info"]["stalls"] < lower_bound:
+            raise Exception(f"Probe below lower bound {lower_bound}: {node}")
+
+
+def selftest_batched(slothy):
+    slothy.config.selftest_batched = True
+    slothy.config.selftest_iterations = 200
+    slothy.config.constraints.stalls_first_attempt = 32
+    slothy.optimize()
+
+    log = slothy.logger.getChild("mismatch")
+    log.setLevel(logging.CRITICAL)
+    old = SourceLine.read_multiline("add x0, x0, x1")
+    new = SourceLine.read_multiline("sub x0, x0, x1")
+    try:
+        SelfTest.run(slothy.config, log, old, new, {}, ["x0"], 8)
+    except SelfTestException:
+        return
+    raise Exception("Batched selftest did not detect mismatch")
+
+
+def selftest_parallel(slothy):
+    """Runs the selftest in worker processes, and expects a failing trial to be
+    reported with a seed which replays the same failure."""
+
+    slothy.config.selftest_parallel_workers = 2
+    slothy.config.selftest_iterations = 40
+    slothy.config.selftest_seed = 1234
+    slothy.config.constraints.stalls_first_attempt = 32
+    slothy.optimize()
+
+    log = slothy.logger.getChild("replay")
+    log.setLevel(logging.CRITICAL)
+    old = SourceLine.read_multiline("add x0, x0, x1")
+    new = SourceLine.read_multiline("sub x0, x0, x1")
+
+    def failure(iterations):
+        try:
+            SelfTest.run(slothy.config, log, old, new, {}, ["x0"], iterations)
+        except SelfTestException as e:
+            return str(e)
+        raise Exception("Selftest did not detect mismatch")
+
+    msg = failure(8)
+    seed = int(re.search(r"\(seed (\d+)\)", msg).group(1))
+    slothy.config.selftest_parallel_workers = 1
+    slothy.config.selftest_seed = seed
+    if failure(1) != msg:
+        raise Exception(f"Failing trial not reproduced by its seed: {msg}")
+
+
+def assembly_cache(slothy):
+    """Runs the selftest with an assembly cache directory, and expects later
+    selftests of the same code to reuse the assembled code from disk."""
+
+    slothy.config.constraints.stalls_first_attempt = 32
+
+    code = SourceLine.read_multiline("add x0, x0, x1")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        slothy.config.assembly_cache_dir = cache_dir
+        LLVM_Mc.cache.clear()
+        with Profiler() as profiler:
+            slothy.optimize()
+        stats = profiler.caches()["assembly"]
+        if stats["stores"] == 0 or len(os.listdir(cache_dir)) == 0:
+            raise Exception(f"Assembly cache not populated: {stats}")
+
+        SelfTest.run(slothy.config, slothy.logger, code, code, {}, ["x0"], 1)
+        LLVM_Mc.cache.clear()
+        with Profiler() as profiler:
+            SelfTest.run(slothy.config, slothy.logger, code, code, {}, ["x0"], 1)
+        stats = profiler.report()["caches"]["assembly"]
+        if stats["disk_hits"] != 1 or stats["misses"] != 0:
+            raise Exception(f"Assembly cache directory not used: {stats}")
+
+
+def llvm_batch(slothy):
+    """Optimizes a loop with LLVM-MCA statistics, and expects batched invocations
+    of LLVM-MC and LLVM-MCA to agree with one invocation per piece of code."""
+
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.constraints.stalls_first_attempt = 16
+    slothy.config.with_llvm_mca = True
+    slothy.optimize_loop("start")
+    for txt in ["ORIGINAL", "OPTIMIZED"]:
+        if f"STATISTICS ({txt}) BEGIN" not in slothy.get_source_as_string():
+            raise Exception(f"LLVM-MCA statistics missing: {txt}")
+
+    # Pieces of code defining the same labels
+    codes = [
+        SourceLine.read_multiline(code)
+        for code in [
+            "start:\nadd x0, x0, x1\nsubs x2, x2, #1\ncbnz x2, start",
+            "start:\nsub x0, x0, x1\nb end\nend:\nnop",
+            "mov x0, #1\n1:\nsubs x0, x0, #1\nb.ne 1b",
+        ]
+    ]
+    # Functions switching to the text section themselves
+    functions = [
+        SourceLine.read_multiline(f".text\n.global myfn\nmyfn:\n{code}\nret")
+        for code in ["add x0, x0, x1", "sub x0, x0, x1"]
+    ]
+    arch = slothy.config.arch
+    mc_args = (arch.llvm_mc_arch, arch.llvm_mc_attr, slothy.logger)
+    for pieces, symbol in [(codes, None), (functions, "myfn")]:
+        LLVM_Mc.cache.clear()
+        batch = LLVM_Mc.assemble_batch(
+            pieces, *mc_args, symbol=symbol, preprocessor="gcc"
+        )
+        single = [LLVM_Mc._assemble(c, *mc_args, symbol, "gcc", None) for c in pieces]
+        if batch != single:
+            raise Exception("Batched assembly differs from individual assembly")
+
+    mca_args = ("aarch64", "cortex-a55", slothy.logger)
+    batch = LLVM_Mca.run_batch([], codes, *mca_args)
+    if batch != [LLVM_Mca.run([], c, *mca_args) for c in codes]:
+        raise Exception("Batched LLVM-MCA statistics differ")
+
+
+def profiler(slothy):
+    """Optimizes a loop under the profiler, expecting phases for each stall
+    count probe and the model size of each solver invocation."""
+
+    slothy.config.sw_pipelining.enabled = True
+    slothy.config.constraints.stalls_first_attempt = 16
+
+    with Profiler() as profiler:
+        slothy.optimize_loop("start")
+
+    summary = profiler.summary()
+    phases = ["optimize_loop", "build_model", "solve"]
+    # A dry run solves once, without searching for the minimum stalls
+    if not slothy.config.constraints.functional_only:
+        phases += ["binsearch", "probe"]
+    for phase in phases:
+        if phase not in summary:
+            raise Exception(f"Phase {phase} missing in profile: {summary}")
+
+    def solves(node):
+        if node["name"] == "solve":
+            yield node
+        for c in node["children"]:
+            yield from solves(c)
+
+    for node in solves(profiler.report()["total"]):
+        if node["info"]["variables"] == 0 or "booleans" not in node["info"]:
+            raise Exception(f"Model size missing in profile: {node}")
+    json.dumps(profiler.report())
+
+
+def parse_cache(slothy):
+    """Optimizes a kernel with the split heuristic, expecting the data flow graphs
+    of the windows and of the binary search probes to reuse parsed lines."""
+
+    slothy.config.split_heuristic = True
+    slothy.config.split_heuristic_factor = 2
+    slothy.config.split_heuristic_repeat = 1
+    slothy.config.constraints.stalls_first_attempt = 16
+
+    cache = slothy.arch.Instruction.parse_cache
+    cache.clear()
+    slothy.optimize()
+
+    stats = cache.stats()
+    if stats["hits"] == 0 or stats["stores"] < stats["size"] or stats["size"] == 0:
+        raise Exception(f"Parse cache not used: {stats}")
+
+
+def incremental_dfg(slothy):
+    """Applies random edits to data flow graphs via callbacks, and checks that
+    rebuilding them incrementally yields the same graphs as full rebuilds."""
+
+    slothy.config.allow_useless_instructions = True
+    log = slothy.logger.getChild("incremental_dfg")
+
+    def random_edits(seed, num_nodes):
+        rng = random.Random(seed)
+        calls = 0
+
+        def cb(t):
+            nonlocal calls
+            calls += 1
+            # Stop editing after a few rounds
+            if calls > 4 * num_nodes:
+                return False
+            x = rng.random()
+            if x < 0.03:
+                t.delete = True
+                return True
+            if x < 0.06:
+                t.inst = [t.inst] + slothy.arch.Instruction.parser(t.inst.source_line)
+                t.changed = True
+                return True
+            # Report a change without marking the node
+            return x < 0.08
+
+        return cb
+
+    def describe(dfg):
+        def reg_state(t):
+            return {
+                reg: (r.src.id, type(r).__name__, r.idx)
+                for reg, r in t.reg_state.items()
+            }
+
+        return (
+            dfg.edges(),
+            dfg.inputs,
+            dfg.outputs,
+            [(t.id, str(t.inst), t.depth, reg_state(t)) for t in dfg.nodes_all],
+        )
+
+    for seed in range(20):
+        graphs = []
+        for incremental in [True, False]:
+            dfg = DFG(slothy.source, log, DFGConfig(slothy.config))
+            dfg.apply_cbs(
+                random_edits(seed, len(dfg.nodes)), log, incremental=incremental
+            )
+            graphs.append(describe(dfg))
+        if graphs[0] != graphs[1]:
+            raise Exception(f"Incremental rebuild differs from full rebuild: {seed}")
+
+
+def parser_dispatch(slothy):
+    """Parses every line of the kernel with the instruction classes of the
+    mnemonic dispatch table and with all instruction classes in turn, expecting
+    both to pick the same class."""
+    Instruction = slothy.arch.Instruction
+
+    def parse(candidates, src):
+        for inst_class in candidates:
+            try:
+                return type(inst_class.make(src))
+            except ParsingException:
+                pass
+        return None
+
+    # Writeback and trailing comments affect the operand shape used for dispatch
+    lines = [line.text.strip() for line in slothy.source] + [
+        "ldr q0, [x1, #16]!",
+        "ldr x2, [x1], #8",
+        "add x0, x0, x1 // trailing comment",
+        "not_an_instruction x0, x1",
+    ]
+    for src in lines:
+        linear = parse(Instruction.all_subclass_leaves, src)
+        dispatch = parse(Instruction._parser_candidates(src), src)
+        if linear is not dispatch:
+            raise Exception(f"Dispatch picks {dispatch} for {src}, not {linear}")
+
+
+def register_state(slothy):
+    """Applies random assignments and rollbacks to a register state, expecting
+    every snapshot to agree with a state built afresh from the assignments up to
+    its version."""
+    rng = random.Random(0)
+    regs = ["x0", "x1", "x2", "v0", "v1"]
+    # Source of every assignment made so far, not rolled back
+    assignments = []
+    snapshots = []
+    state = RegisterState()
+
+    def fresh(version):
+        ref = RegisterState()
+        for reg, src in assignments[:version]:
+            ref[reg] = src
+        return ref
+
+    for step in range(500):
+        if rng.random() < 0.1:
+            version = rng.randrange(state.version + 1)
+            state.rollback(version)
+            del assignments[version:]
+            snapshots = [(v, s) for v, s in snapshots if v <= version]
+        else:
+            reg, src = rng.choice(regs), step
+            state[reg] = src
+            assignments.append((reg, src))
+        snapshots.append((state.version, state.snapshot()))
+
+        ref = fresh(state.version)
+        for reg in regs:
+            if (reg in state) != (reg in ref) or (
+                reg in ref and state[reg] != ref[reg]
+            ):
+                raise Exception(f"Register state differs for {reg} at step {step}")
+        for version, snapshot in snapshots:
+            if dict(snapshot) != dict(fresh(version).snapshot()):
+                raise Exception(f"Snapshot of version {version} differs: {step}")
+
+
+def slotted_copies(slothy):
+    """Pickles and copies source lines and data flow graph nodes, which have no
+    instance dictionary, expecting the copies to agree with the originals."""
+
+    def copies(obj):
+        return [
+            pickle.loads(pickle.dumps(obj)),
+            copy.copy(obj),
+            copy.deepcopy(obj),
+        ]
+
+    def describe_line(line):
+        return (line.to_string(), line.text, line.tags, line.comments)
+
+    source = slothy.source + SourceLine.read_multiline(
+        "    add x0, x0, x1 // @slothy:some_tag=42\n// comment only\n\nnop"
+    )
+    for line in source + [line.copy() for line in source]:
+        for c in copies(line):
+            if describe_line(c) != describe_line(line):
+                raise Exception(f"Copy of source line differs: {line}")
+
+    def describe_node(t):
+        # Attributes of the solver are only present once assigned
+        present = [a for a in ComputationNode.__slots__ if hasattr(t, a)]
+        reg_state = {reg: (r.src.id, r.idx) for reg, r in t.reg_state.items()}
+        return (t.id, str(t.inst), t.depth, t.orig_pos, present, reg_state)
+
+    dfg = DFG(slothy.source, slothy.logger, DFGConfig(slothy.config))
+    dfg.nodes[0].pre = True
+    for nodes in copies(dfg.nodes_all):
+        if [describe_node(t) for t in nodes] != [
+            describe_node(t) for t in dfg.nodes_all
+        ]:
+            raise Exception("Copy of data flow graph nodes differs")
+
+
+def multidict_index(slothy):
+    """Looks up instructions in a multidict of instruction classes and
+    predicates, expecting ambiguous and missing entries to be rejected, and
+    changes to the multidict to be reflected."""
+
+    def parse(src):
+        return slothy.arch.Instruction.parser(SourceLine(src))[0]
+
+    add, sub, ldr = map(parse, ["add x0, x0, x1", "sub x0, x0, x1", "ldr q0, [x1]"])
+
+    def lookup(d, inst):
+        try:
+            return lookup_multidict(d, inst, "test")
+        except UnknownInstruction:
+            return None
+
+    def is_sub(inst):
+        return type(inst) is type(sub)
+
+    d = {type(add): 1, (type(ldr), is_sub): 2}
+    if [lookup(d, inst) for inst in [add, sub, ldr]] != [1, 2, 2]:
+        raise Exception("Unexpected multidict lookup")
+
+    # add matches both entries, ldr none
+    d = {type(add): 1, slothy.arch.AArch64Instruction: 2, is_sub: 3}
+    if lookup(d, add) is not None or lookup(d, ldr) != 2:
+        raise Exception("Ambiguous multidict entry not rejected")
+    index = MultidictIndex.get(d)
+    if index.matches(sub) != [1, 2] or index.first_match(add) != 0:
+        raise Exception(f"Unexpected multidict matches: {index.matches(sub)}")
+    del d[slothy.arch.AArch64Instruction]
+    if lookup(d, ldr) is not None:
+        raise Exception("Missing multidict entry not rejected")
+
+    # Overwritten values and replaced keys
+    d[is_sub] = 4
+    if lookup(d, sub) != 4:
+        raise Exception("Overwritten multidict value not used")
+    del d[is_sub]
+    d[type(ldr)] = 5
+    if lookup(d, sub) is not None or lookup(d, ldr) != 5:
+        raise Exception("Replaced multidict key not used")
+
+
+class AArch64Feature(OptimizationRunner):
+    """Runs a feature check on a test kernel.
+
+    The check configures SLOTHY for the feature under test, optimizes the kernel
+    and raises an exception if the outcome is not as expected. The test is named
+    after the check."""
+
+    def __init__(self, check, infile, arch=AArch64_Neon, target=Target_CortexA55):
+        self.check = check
+        name = f"aarch64_{check.__name__}"
+
+        super().__init__(
+            infile, name, rename=True, arch=arch, target=target, base_dir="tests"
+        )
+
+    def core(self, slothy):
+        self.check(slothy)
+
+
 test_instances = [
     Instructions(),
     Instructions(target=Target_CortexA72),
@@ -500,4 +1286,30 @@ test_instances = [
     AArch64SelftestAddr(),
     AArch64SelftestInitialRegs(),
     AArch64Directives(),
+    AArch64Feature(result_cache, "aarch64_simple0_loop"),
+    AArch64Feature(parallel_stall_probes, "aarch64_simple0"),
+    AArch64Feature(split_parallel_chunks, "aarch64_simple0"),
+    AArch64Feature(split_adaptive, "aarch64_simple0"),
+    AArch64Feature(global_timeout, "aarch64_simple0_loop"),
+    AArch64Feature(global_timeout_cache, "aarch64_simple0"),
+    AArch64Feature(parallel_passes, "aarch64_simple0_loop"),
+    AArch64Feature(portfolio, "aarch64_loop_subs_tabs"),
+    AArch64Feature(solution_callback, "aarch64_simple0"),
+    AArch64Feature(solver_parameters, "aarch64_simple0"),
+    AArch64Feature(warm_start, "aarch64_simple0_loop"),
+    AArch64Feature(reuse_model, "aarch64_simple0_loop"),
+    AArch64Feature(sparse_renaming, "aarch64_simple0_loop"),
+    AArch64Feature(register_symmetry, "aarch64_simple0_loop"),
+    AArch64Feature(stalls_lower_bound, "aarch64_simple0"),
+    AArch64Feature(selftest_batched, "aarch64_simple0"),
+    AArch64Feature(selftest_parallel, "aarch64_simple0"),
+    AArch64Feature(assembly_cache, "aarch64_simple0"),
+    AArch64Feature(llvm_batch, "aarch64_simple0_loop"),
+    AArch64Feature(profiler, "aarch64_simple0_loop"),
+    AArch64Feature(parse_cache, "aarch64_simple0"),
+    AArch64Feature(incremental_dfg, "aarch64_simple0"),
+    AArch64Feature(parser_dispatch, "instructions"),
+    AArch64Feature(register_state, "aarch64_simple0"),
+    AArch64Feature(slotted_copies, "aarch64_simple0"),
+    AArch64Feature(multidict_index, "aarch64_simple0"),
 ]
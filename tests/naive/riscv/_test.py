@@ -26,6 +26,7 @@
 #
 
 from common.OptimizationRunner import OptimizationRunner
+from slothy.helper import SourceLine
 import slothy.targets.riscv.riscv as RISC_V
 import slothy.targets.riscv.xuantie_c908 as Target_XuanTieC908
 
@@ -153,9 +154,31 @@ class RISC_VTest(OptimizationRunner):
         slothy.optimize(start="start_label", end="end_label")
 
 
+class RISC_VLookupMultidict(OptimizationRunner):
+    """Looks up instructions in multidicts, expecting the first matching entry
+    to be used even if its value is None, and the default otherwise."""
+
+    def __init__(self, var="", arch=RISC_V, target=Target_XuanTieC908):
+        name = "riscv_lookup_multidict"
+        infile = "riscv_simple0"
+
+        super().__init__(
+            infile, name, rename=True, arch=arch, target=target, base_dir="tests"
+        )
+
+    def core(self, slothy):
+        add = slothy.arch.Instruction.parser(SourceLine("add x1, x2, x3"))[0]
+        lookup = slothy.arch.lookup_multidict
+        if lookup({type(add): None, slothy.arch.Instruction: 1}, add, 2) is not None:
+            raise Exception("Entry with value None not used")
+        if lookup({lambda inst: False: 1}, add, 2) != 2:
+            raise Exception("Default not used")
+
+
 test_instances = [
     Instructions(),
     RISC_VSimple0(),
     RISC_VSimpleLoop0(),
     RISC_VTest(),
+    RISC_VLookupMultidict(),
 ]